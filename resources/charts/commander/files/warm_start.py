@@ -0,0 +1,28 @@
+# Entrypoint for idle commanders in the warm pool (see `warnet pool`).
+# The interpreter starts and imports the heavy framework modules ahead of time,
+# then waits for `warnet run` to upload a scenario archive and its arguments.
+import json
+import os
+import runpy
+import sys
+from time import sleep
+
+import kubernetes  # noqa: F401
+import ln_framework.ln  # noqa: F401
+import test_framework.p2p  # noqa: F401
+import test_framework.test_framework  # noqa: F401
+
+ARCHIVE = "/shared/archive.pyz"
+# Written last by `warnet run`, so its presence means the archive is complete
+ARGS = "/shared/args.json"
+
+print("Warm commander ready, waiting for scenario...", flush=True)
+while not os.path.exists(ARGS):
+    sleep(0.1)
+
+with open(ARGS) as f:
+    args = json.load(f)
+
+# commander.py discovers the network when it is imported, so that only happens now
+sys.argv = [ARCHIVE] + args
+runpy.run_path(ARCHIVE, run_name="__main__")
@@ -35,7 +35,7 @@ helm.sh/chart: {{ include "commander.chart" . }}
 app.kubernetes.io/version: {{ .Chart.AppVersion | quote }}
 {{- end }}
 app.kubernetes.io/managed-by: {{ .Release.Service }}
-{{- with .Values.podLabels }}
+{{- with omit .Values.podLabels "mission" }}
 {{ toYaml . }}
 {{- end }}
 {{- end }}
@@ -1,18 +1,20 @@
+import http.client
 import os
+import threading
+import time
 
 from authproxy import AuthServiceProxy
-from prometheus_client import Gauge, start_http_server
-
-
-# Ensure that all RPC calls are made with brand new http connections
-def auth_proxy_request(self, method, path, postdata):
-    self._set_conn()  # creates new http client connection
-    return self.oldrequest(method, path, postdata)
-
-
-AuthServiceProxy.oldrequest = AuthServiceProxy._request
-AuthServiceProxy._request = auth_proxy_request
-
+from prometheus_client import start_http_server
+from prometheus_client.core import REGISTRY
+from rpc_metrics import (
+    DEFAULT_METRICS,
+    LOOKUP_ERRORS,
+    Metric,
+    ResultCache,
+    add_samples,
+    metric_family,
+    parse_metrics,
+)
 
 # RPC Credentials for bitcoin node
 # By default we assume the container is in the same pod as bitcoind, on regtest
@@ -25,36 +27,71 @@ BITCOIN_RPC_PASSWORD = os.environ.get("BITCOIN_RPC_PASSWORD", "2themoon")
 METRICS_PORT = int(os.environ.get("METRICS_PORT", "9332"))
 
 # Bitcoin Core RPC data to scrape. Expressed as labeled RPC queries separated by spaces
-# label=method(params)[return object key][...]
-METRICS = os.environ.get(
-    "METRICS",
-    'blocks=getblockcount() inbounds=getnetworkinfo()["connections_in"] outbounds=getnetworkinfo()["connections_out"] mempool_size=getmempoolinfo()["size"]',
-)
+# See rpc_metrics.py for the syntax
+METRICS = os.environ.get("METRICS", DEFAULT_METRICS)
+
+
+class BitcoinCollector:
+    """
+    Collects all metrics with a single JSON-RPC batch per scrape, over one persistent
+    connection to bitcoind. Calls with a minimum interval are served from the cache
+    until they are due again.
+    """
+
+    def __init__(self, rpc: AuthServiceProxy, metrics: list[Metric]):
+        self.rpc = rpc
+        self.metrics = metrics
+        self.cache = ResultCache(metrics)
+        self.lock = threading.Lock()
+
+    def batch(self) -> dict:
+        with self.lock:
+            now = time.monotonic()
+            stale = self.cache.stale(now)
+            if stale:
+                requests = ResultCache.batch_request(stale)
+                try:
+                    responses = self.rpc.batch(requests)
+                except (OSError, http.client.HTTPException):
+                    # bitcoind closed the idle keep-alive connection, reconnect once
+                    self.rpc._set_conn()
+                    responses = self.rpc.batch(requests)
+                for error in self.cache.update(stale, responses, now):
+                    print(error)
+            return self.cache.results()
+
+    def describe(self):
+        # Lets the registry know our metric names without scraping bitcoind
+        for metric in self.metrics:
+            yield metric_family(metric)
+
+    def collect(self):
+        try:
+            results = self.batch()
+        except Exception as e:
+            print(f"Scrape failed: {e}")
+            return
+        for metric in self.metrics:
+            if metric.call not in results:
+                continue
+            family = metric_family(metric)
+            try:
+                add_samples(family, metric, results[metric.call])
+            except LOOKUP_ERRORS as e:
+                print(f"Metric {metric.label} unavailable: {e!r}")
+                continue
+            yield family
+
 
 # Set up bitcoind RPC client
 rpc = AuthServiceProxy(
     service_url=f"http://{BITCOIN_RPC_USER}:{BITCOIN_RPC_PASSWORD}@{BITCOIN_RPC_HOST}:{BITCOIN_RPC_PORT}"
 )
 
-
-# Create closure outside the loop
-def make_metric_function(cmd):
-    try:
-        return lambda: eval(f"rpc.{cmd}")
-    except Exception:
-        return None
-
-
 # Parse RPC queries into metrics
-commands = METRICS.split(" ")
-for labeled_cmd in commands:
-    if "=" not in labeled_cmd:
-        continue
-    label, cmd = labeled_cmd.strip().split("=")
-    # label, description i.e. ("bitcoin_conn_in", "Number of connections in")
-    metric = Gauge(label, cmd)
-    metric.set_function(make_metric_function(cmd))
-    print(f"Metric created: {labeled_cmd}")
+metrics = parse_metrics(METRICS)
+
+REGISTRY.register(BitcoinCollector(rpc, metrics))
 
 # Start the server
 server, thread = start_http_server(METRICS_PORT)
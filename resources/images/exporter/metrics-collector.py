@@ -0,0 +1,242 @@
+"""
+One Prometheus endpoint for every tank in the cluster, instead of one exporter
+container per tank.
+
+Tanks are discovered by label like commander.py does, and polled concurrently with
+asyncio: one JSON-RPC batch per tank and poll, over a kept-alive connection. All series
+are exported with `tank` and `namespace` labels.
+
+bitcoind is protected from the collector by:
+- at most one request in flight per tank, and at most CONCURRENCY tanks at a time
+- polls spread evenly over POLL_INTERVAL instead of all tanks at once
+- per-call minimum intervals (`@seconds` in the metric) served from a cache
+- exponential backoff, up to MAX_BACKOFF, on errors, timeouts and a full RPC work queue
+"""
+
+import asyncio
+import base64
+import json
+import os
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+from kubernetes import client, config
+from prometheus_client import start_http_server
+from prometheus_client.core import REGISTRY, GaugeMetricFamily
+from rpc_metrics import (
+    DEFAULT_METRICS,
+    LOOKUP_ERRORS,
+    ResultCache,
+    add_samples,
+    metric_family,
+    parse_metrics,
+)
+
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "9332"))
+METRICS = os.environ.get("METRICS", DEFAULT_METRICS)
+# Space separated namespaces to discover tanks in, default is our own namespace
+NAMESPACES = os.environ.get("NAMESPACES", "").split()
+TANK_SELECTOR = os.environ.get("TANK_SELECTOR", "mission=tank")
+RPC_USER = os.environ.get("BITCOIN_RPC_USER", "user")
+
+# Seconds between two polls of the same tank
+POLL_INTERVAL = float(os.environ.get("POLL_INTERVAL", "15"))
+# Maximum number of tanks with a request in flight
+CONCURRENCY = int(os.environ.get("CONCURRENCY", "32"))
+RPC_TIMEOUT = float(os.environ.get("RPC_TIMEOUT", "10"))
+MAX_BACKOFF = float(os.environ.get("MAX_BACKOFF", "300"))
+DISCOVERY_INTERVAL = float(os.environ.get("DISCOVERY_INTERVAL", "30"))
+
+LABELS = ("tank", "namespace")
+
+
+class RPCError(Exception):
+    pass
+
+
+@dataclass
+class Tank:
+    name: str
+    namespace: str
+    host: str
+    port: int
+    password: str
+    cache: ResultCache
+    # Results as of the last successful poll, replaced whole so scrapes never see a partial poll
+    results: dict = field(default_factory=dict)
+    up: bool = False
+    duration: float = 0.0
+    failures: int = 0
+    reader: Optional[asyncio.StreamReader] = None
+    writer: Optional[asyncio.StreamWriter] = None
+
+    @property
+    def auth(self) -> str:
+        return base64.b64encode(f"{RPC_USER}:{self.password}".encode()).decode()
+
+    def close(self):
+        if self.writer:
+            self.writer.close()
+        self.reader = self.writer = None
+
+    async def post(self, payload) -> tuple[int, bytes]:
+        body = json.dumps(payload).encode()
+        head = (
+            f"POST / HTTP/1.1\r\nHost: {self.host}\r\nAuthorization: Basic {self.auth}\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n"
+        )
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.writer.write(head.encode() + body)
+        await self.writer.drain()
+        status = int((await self.reader.readline()).split()[1])
+        headers = {}
+        while (line := await self.reader.readline()) not in (b"\r\n", b"\n", b""):
+            key, _, value = line.decode().partition(":")
+            headers[key.strip().lower()] = value.strip()
+        if "content-length" in headers:
+            data = await self.reader.readexactly(int(headers["content-length"]))
+        else:
+            data = await self.reader.read()
+            self.close()
+        if headers.get("connection", "").lower() == "close":
+            self.close()
+        return status, data
+
+    async def batch(self, payload) -> list[dict]:
+        reused = self.writer is not None
+        try:
+            status, data = await self.post(payload)
+        except (OSError, asyncio.IncompleteReadError, IndexError, ValueError):
+            self.close()
+            if not reused:
+                raise
+            # bitcoind closed the idle keep-alive connection, reconnect once
+            status, data = await self.post(payload)
+        if status != 200:
+            raise RPCError(f"HTTP {status}: {data[:200].decode(errors='replace')}")
+        return json.loads(data)
+
+    async def poll(self):
+        now = time.monotonic()
+        stale = self.cache.stale(now)
+        if stale:
+            responses = await asyncio.wait_for(
+                self.batch(ResultCache.batch_request(stale)), RPC_TIMEOUT
+            )
+            for error in self.cache.update(stale, responses, now):
+                print(f"{self.namespace}/{self.name}: {error}")
+        self.results = self.cache.results()
+        self.duration = time.monotonic() - now
+
+
+class Collector:
+    def __init__(self, metrics):
+        self.metrics = metrics
+        # Replaced, never mutated, by the event loop: the http server thread iterates it
+        self.tanks: dict[str, Tank] = {}
+        self.tasks: dict[str, asyncio.Task] = {}
+
+    def describe(self):
+        for metric in self.metrics:
+            yield metric_family(metric, LABELS)
+
+    def collect(self):
+        tanks = list(self.tanks.values())
+        for metric in self.metrics:
+            family = metric_family(metric, LABELS)
+            for tank in tanks:
+                results = tank.results
+                if metric.call not in results:
+                    continue
+                try:
+                    add_samples(family, metric, results[metric.call], (tank.name, tank.namespace))
+                except LOOKUP_ERRORS as e:
+                    print(f"{tank.namespace}/{tank.name}: metric {metric.label} unavailable: {e!r}")
+            yield family
+        up = GaugeMetricFamily("warnet_tank_up", "Last poll of the tank succeeded", labels=LABELS)
+        duration = GaugeMetricFamily(
+            "warnet_tank_poll_seconds", "Duration of the last poll of the tank", labels=LABELS
+        )
+        for tank in tanks:
+            up.add_metric([tank.name, tank.namespace], float(tank.up))
+            duration.add_metric([tank.name, tank.namespace], tank.duration)
+        yield up
+        yield duration
+
+    async def run_tank(self, tank: Tank, semaphore: asyncio.Semaphore):
+        # Spread the first polls of all tanks over one interval
+        await asyncio.sleep(random.uniform(0, POLL_INTERVAL))
+        while True:
+            delay = POLL_INTERVAL
+            async with semaphore:
+                try:
+                    await tank.poll()
+                    tank.up = True
+                    tank.failures = 0
+                except Exception as e:
+                    tank.close()
+                    tank.up = False
+                    tank.results = {}
+                    tank.failures += 1
+                    # A full work queue answers HTTP 503, back off like on any other error
+                    delay = min(MAX_BACKOFF, POLL_INTERVAL * 2**tank.failures)
+                    print(
+                        f"{tank.namespace}/{tank.name}: poll failed, retry in {delay:.0f}s: {e!r}"
+                    )
+            await asyncio.sleep(delay)
+
+    def discover(self, sclient, namespaces: list[str]) -> dict[str, Tank]:
+        found = {}
+        for namespace in namespaces:
+            pods = sclient.list_namespaced_pod(namespace=namespace, label_selector=TANK_SELECTOR)
+            for pod in pods.items:
+                if pod.status.phase != "Running" or not pod.status.pod_ip:
+                    continue
+                found[pod.metadata.uid] = Tank(
+                    name=pod.metadata.name,
+                    namespace=namespace,
+                    host=pod.status.pod_ip,
+                    port=int(pod.metadata.labels["RPCPort"]),
+                    password=pod.metadata.labels["rpcpassword"],
+                    cache=ResultCache(self.metrics),
+                )
+        return found
+
+    async def run(self, sclient, namespaces: list[str]):
+        semaphore = asyncio.Semaphore(CONCURRENCY)
+        while True:
+            try:
+                found = await asyncio.to_thread(self.discover, sclient, namespaces)
+            except Exception as e:
+                print(f"Tank discovery failed: {e!r}")
+                found = None
+            if found is not None:
+                tanks = dict(self.tanks)
+                for uid in set(self.tasks) - set(found):
+                    self.tasks.pop(uid).cancel()
+                    tanks.pop(uid).close()
+                for uid in set(found) - set(self.tasks):
+                    tanks[uid] = found[uid]
+                    self.tasks[uid] = asyncio.create_task(self.run_tank(found[uid], semaphore))
+                self.tanks = tanks
+                print(f"Collecting metrics from {len(self.tanks)} tanks")
+            await asyncio.sleep(DISCOVERY_INTERVAL)
+
+
+config.load_incluster_config()
+sclient = client.CoreV1Api()
+if not NAMESPACES:
+    with open("/var/run/secrets/kubernetes.io/serviceaccount/namespace") as f:
+        NAMESPACES = [f.read().strip()]
+
+collector = Collector(parse_metrics(METRICS))
+REGISTRY.register(collector)
+
+server, thread = start_http_server(METRICS_PORT)
+print(f"Serving metrics on port {METRICS_PORT} for tanks in {' '.join(NAMESPACES)}")
+
+# The http server thread reads the latest results, the event loop polls the tanks
+asyncio.run(collector.run(sclient, NAMESPACES))
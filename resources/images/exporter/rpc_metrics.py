@@ -0,0 +1,259 @@
+"""
+The metric language shared by bitcoin-exporter.py (one exporter per tank) and
+metrics-collector.py (one collector for all tanks):
+
+    [kind[(buckets)]:]label[{name=[key]...,...}]=method(params)[key][...][/[key]...][*scale][@seconds]
+"""
+
+import ast
+import json
+import os
+import re
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, HistogramMetricFamily
+
+DEFAULT_METRICS = 'blocks=getblockcount() inbounds=getnetworkinfo()["connections_in"] outbounds=getnetworkinfo()["connections_out"] mempool_size=getmempoolinfo()["size"]'
+
+# Default minimum number of seconds between two fetches of the same RPC call
+MIN_INTERVAL = float(os.environ.get("METRICS_MIN_INTERVAL", "0"))
+
+# Default histogram bucket upper bounds, suited to fee rates in sat/vB
+HISTOGRAM_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+METRIC_PATTERN = re.compile(
+    r"^(?:(?P<kind>gauge|counter|histogram)(?:\((?P<buckets>[^)]*)\))?:)?"
+    r"(?P<label>\w+)(?:\{(?P<labels>[^}]*)\})?="
+    r"(?P<method>\w+)\((?P<params>.*?)\)(?P<keys>(\[.+?\])*)"
+    r"(?:/(?P<divisor>(\[.+?\])+))?(?:\*(?P<scale>[0-9.eE+-]+))?(?:@(?P<interval>[0-9.]+))?$"
+)
+KEY_PATTERN = re.compile(r"\[(.+?)\]")
+LABEL_PATTERN = re.compile(r"(\w+)=((?:\[.+?\])+)")
+WILDCARD_PATTERN = re.compile(r"^(?:(?P<label>\w+)=)?\*$")
+
+# Errors raised while resolving keys of one array element, which is then skipped
+LOOKUP_ERRORS = (KeyError, IndexError, TypeError, ValueError, ZeroDivisionError)
+
+
+@dataclass(frozen=True)
+class Wildcard:
+    """A [*] or [name=*] key: iterate over every item of an array or object"""
+
+    label: str = ""
+
+
+def parse_keys(keys: str) -> list:
+    result = []
+    for key in KEY_PATTERN.findall(keys):
+        wildcard = WILDCARD_PATTERN.match(key)
+        result.append(Wildcard(wildcard["label"] or "") if wildcard else ast.literal_eval(key))
+    return result
+
+
+def resolve(obj, keys: list):
+    for key in keys:
+        obj = obj[key]
+    return obj
+
+
+@dataclass
+class Metric:
+    label: str
+    method: str
+    params: tuple
+    keys: list
+    description: str
+    kind: str = "gauge"
+    # Label name -> keys, resolved on each element of the first [*]
+    labels: dict = field(default_factory=dict)
+    # Keys resolved on the innermost [*] element (or the result) to divide the value by
+    divisor: list = field(default_factory=list)
+    scale: float = 1.0
+    buckets: tuple = HISTOGRAM_BUCKETS
+    interval: float = MIN_INTERVAL
+
+    @property
+    def call(self) -> tuple:
+        # Identical calls share one request per scrape
+        return (self.method, json.dumps(self.params))
+
+    @property
+    def label_names(self) -> list[str]:
+        return list(self.labels) + [
+            key.label for key in self.keys if isinstance(key, Wildcard) and key.label
+        ]
+
+    def samples(self, result) -> Iterator[tuple[tuple, float]]:
+        """Yield (label values, value) for every item the keys select from an RPC result"""
+        yield from self._walk(result, self.keys, (), result, True)
+
+    def _walk(self, node, keys, label_values, element, outermost):
+        for i, key in enumerate(keys):
+            if not isinstance(key, Wildcard):
+                node = node[key]
+                continue
+            items = node.items() if isinstance(node, dict) else enumerate(node)
+            for name, child in items:
+                try:
+                    values = label_values
+                    if outermost:
+                        values += tuple(str(resolve(child, path)) for path in self.labels.values())
+                    if key.label:
+                        values += (str(name),)
+                    yield from self._walk(child, keys[i + 1 :], values, child, False)
+                except LOOKUP_ERRORS:
+                    continue
+            return
+        value = float(node) * self.scale
+        if self.divisor:
+            value /= float(resolve(element, self.divisor))
+        # Drop binary float noise from decimal BTC amounts, so 10 sat/vB falls in le="10"
+        yield label_values, float(f"{value:.12g}")
+
+
+def parse_params(params: str) -> tuple:
+    # JSON spelling (true, null) as used in bitcoin-cli, or python literals
+    if not params.strip():
+        return ()
+    try:
+        return tuple(json.loads(f"[{params}]"))
+    except json.JSONDecodeError:
+        return ast.literal_eval(f"({params},)")
+
+
+def parse_metric(labeled_cmd: str) -> Metric:
+    """
+    Parse [kind[(buckets)]:]label[{labels}]=method(params)[key]... without evaluating it:
+    params and keys must be literals, e.g. getchaintxstats(10)["txrate"]
+    """
+    match = METRIC_PATTERN.match(labeled_cmd)
+    if not match:
+        raise ValueError(f"Can not parse metric: {labeled_cmd}")
+    keys = parse_keys(match["keys"])
+    metric = Metric(
+        label=match["label"],
+        method=match["method"],
+        params=parse_params(match["params"]),
+        keys=keys,
+        description=labeled_cmd[match.start("method") :],
+        kind=match["kind"] or "gauge",
+        labels={
+            name: parse_keys(path) for name, path in LABEL_PATTERN.findall(match["labels"] or "")
+        },
+        divisor=parse_keys(match["divisor"] or ""),
+        scale=float(match["scale"] or 1),
+        interval=float(match["interval"]) if match["interval"] else MIN_INTERVAL,
+    )
+    if match["buckets"]:
+        metric.buckets = tuple(sorted(float(b) for b in match["buckets"].split(",")))
+    wildcards = any(isinstance(key, Wildcard) for key in keys)
+    if metric.labels and not wildcards:
+        raise ValueError(f"Labels need a [*] key to iterate over: {labeled_cmd}")
+    if wildcards and metric.kind != "histogram" and not metric.label_names:
+        raise ValueError(f"Metric over [*] needs labels to tell samples apart: {labeled_cmd}")
+    if metric.kind == "histogram" and not wildcards:
+        raise ValueError(f"Histogram needs a [*] key to iterate over: {labeled_cmd}")
+    return metric
+
+
+class ResultCache:
+    """
+    Latest result of every distinct RPC call the metrics need. Metrics that use the same
+    call share one request, and a call is only sent again once it is older than the
+    smallest interval of the metrics using it.
+    """
+
+    def __init__(self, metrics: list[Metric]):
+        self.intervals: dict[tuple, float] = {}
+        for metric in metrics:
+            self.intervals[metric.call] = min(
+                metric.interval, self.intervals.get(metric.call, metric.interval)
+            )
+        # call -> (monotonic time fetched, result)
+        self.entries: dict[tuple, tuple[float, object]] = {}
+
+    def stale(self, now: float) -> list[tuple]:
+        return [
+            call
+            for call in self.intervals
+            if call not in self.entries or now - self.entries[call][0] >= self.intervals[call]
+        ]
+
+    @staticmethod
+    def batch_request(calls: list[tuple]) -> list[dict]:
+        return [
+            {"version": "1.1", "method": method, "params": json.loads(params), "id": i}
+            for i, (method, params) in enumerate(calls)
+        ]
+
+    def update(self, calls: list[tuple], responses: list[dict], now: float) -> list[str]:
+        """Store the responses to batch_request(calls), return the errors"""
+        errors = []
+        for response in responses:
+            call = calls[response["id"]]
+            if response.get("error") is None:
+                self.entries[call] = (now, response["result"])
+            else:
+                self.entries.pop(call, None)
+                errors.append(f"RPC error for {call}: {response['error']}")
+        return errors
+
+    def results(self) -> dict:
+        return {call: result for call, (_, result) in self.entries.items()}
+
+
+def parse_metrics(metrics: str) -> list[Metric]:
+    """Parse a space separated list of metrics"""
+    parsed = []
+    for labeled_cmd in metrics.split(" "):
+        if "=" not in labeled_cmd:
+            continue
+        parsed.append(parse_metric(labeled_cmd.strip()))
+        print(f"Metric created: {labeled_cmd}")
+    return parsed
+
+
+def metric_family(metric: Metric, extra_labels: tuple = ()):
+    labels = [*extra_labels, *metric.label_names]
+    if metric.kind == "counter":
+        return CounterMetricFamily(metric.label, metric.description, labels=labels)
+    if metric.kind == "histogram":
+        return HistogramMetricFamily(metric.label, metric.description, labels=labels)
+    return GaugeMetricFamily(metric.label, metric.description, labels=labels)
+
+
+def add_samples(family, metric: Metric, result, extra_label_values: tuple = ()):
+    """Add the samples `metric` selects from an RPC result to its metric family"""
+    samples = list(metric.samples(result))
+    if metric.kind == "histogram":
+        for label_values, values in group_samples(samples).items():
+            buckets, total = histogram(values, metric.buckets)
+            family.add_metric([*extra_label_values, *label_values], buckets, total)
+    else:
+        for label_values, value in samples:
+            family.add_metric([*extra_label_values, *label_values], value)
+
+
+def group_samples(samples: list[tuple[tuple, float]]) -> dict[tuple, list[float]]:
+    groups: dict[tuple, list[float]] = {}
+    for label_values, value in samples:
+        groups.setdefault(label_values, []).append(value)
+    return groups
+
+
+def histogram(values: list[float], bounds: tuple) -> tuple[list[tuple[str, int]], float]:
+    """Cumulative (le, count) buckets ending with +Inf, and the sum of all values"""
+    counts = [0] * len(bounds)
+    for value in values:
+        for i, bound in enumerate(bounds):
+            if value <= bound:
+                counts[i] += 1
+                break
+    buckets = []
+    cumulative = 0
+    for bound, count in zip(bounds, counts):
+        cumulative += count
+        buckets.append((str(float(bound)), cumulative))
+    buckets.append(("+Inf", len(values)))
+    return buckets, sum(values)
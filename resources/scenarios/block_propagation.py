@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from random import Random
+from time import monotonic, sleep
+
+from commander import Commander, cdf, format_cdf, percentile
+from test_framework.authproxy import JSONRPCException
+from test_framework.descriptors import descsum_create
+from test_framework.wallet import MiniWallet
+
+# Longest single waitforblockheight call, below the 60s RPC timeout of the commander
+MAX_WAIT_MS = 30_000
+# Seconds for watchers to have their long poll in flight before the block is mined
+WATCH_LEAD = 0.2
+# Anyone-can-spend coinbase outputs, no wallet needed to mine
+MINING_DESCRIPTOR = descsum_create("raw(51)")
+RPC_METHOD_NOT_FOUND = -32601
+
+
+def block_counters(node) -> Counter:
+    """Bytes of block relay messages exchanged with all peers so far"""
+    counters = Counter()
+    for peer in node.getpeerinfo():
+        for msg in ("cmpctblock", "blocktxn", "block"):
+            counters[f"recv_{msg}"] += peer["bytesrecv_per_msg"].get(msg, 0)
+        counters["sent_getblocktxn"] += peer["bytessent_per_msg"].get("getblocktxn", 0)
+    return counters
+
+
+def relay_outcome(before: Counter, after: Counter) -> str:
+    """How a tank got a block, from the block relay messages it exchanged meanwhile"""
+    if after["sent_getblocktxn"] > before["sent_getblocktxn"]:
+        return "compact_roundtrip"
+    if after["recv_block"] > before["recv_block"]:
+        return "full_block"
+    if after["recv_cmpctblock"] > before["recv_cmpctblock"]:
+        return "compact"
+    return "unknown"
+
+
+class BlockPropagation(Commander):
+    def set_test_params(self):
+        self.num_nodes = 2
+
+    def add_options(self, parser):
+        parser.description = (
+            "Mine blocks on chosen tanks and measure when every other tank's tip updates"
+        )
+        parser.usage = "warnet run /path/to/block_propagation.py [options]"
+        parser.add_argument(
+            "--blocks",
+            dest="blocks",
+            default=20,
+            type=int,
+            help="Number of blocks to mine (default 20)",
+        )
+        parser.add_argument(
+            "--miners",
+            dest="miners",
+            default="",
+            type=str,
+            help="Comma separated tanks to mine on, in turn (default: all tanks at random)",
+        )
+        parser.add_argument(
+            "--interval",
+            dest="interval",
+            default=5.0,
+            type=float,
+            help="Seconds between a block reaching all tanks and mining the next (default 5)",
+        )
+        parser.add_argument(
+            "--txs",
+            dest="txs",
+            default=0,
+            type=int,
+            help="Transactions to broadcast before each block, so compact blocks have "
+            "mempool contents to reconstruct from (default 0)",
+        )
+        parser.add_argument(
+            "--timeout",
+            dest="timeout",
+            default=120.0,
+            type=float,
+            help="Seconds after which a block counts as not propagated (default 120)",
+        )
+        parser.add_argument(
+            "--poll",
+            dest="poll",
+            default=0.05,
+            type=float,
+            help="Seconds between tip polls of tanks without waitforblockheight (default 0.05)",
+        )
+        parser.add_argument(
+            "--seed",
+            dest="seed",
+            default=None,
+            type=int,
+            help="Seed for the choice of mining tanks",
+        )
+
+    def watch(self, node, height: int, deadline: float):
+        """Time at which the tank's tip reached `height`, None on timeout"""
+        # Not node.rpc: the miner is sent generatetodescriptor while its watcher waits
+        rpc = self.watch_rpcs[node.index]
+        while (left := deadline - monotonic()) > 0:
+            if node.index in self.polled:
+                if rpc.getblockcount() >= height:
+                    return monotonic()
+                sleep(self.options.poll)
+                continue
+            try:
+                tip = rpc.waitforblockheight(height, int(min(left * 1000, MAX_WAIT_MS)))
+            except JSONRPCException as e:
+                if e.error.get("code") != RPC_METHOD_NOT_FOUND:
+                    raise
+                self.polled.add(node.index)
+                continue
+            if tip["height"] >= height:
+                return monotonic()
+        return None
+
+    def broadcast(self, wallet, utxos: list[dict], rng: Random):
+        for utxo in utxos:
+            tx = wallet.create_self_transfer(utxo_to_spend=utxo, fee_rate=Decimal("0.00002"))
+            rng.choice(self.nodes).sendrawtransaction(tx["hex"], 0)
+
+    def run_test(self):
+        rng = Random(self.options.seed)
+        # Tanks without waitforblockheight, their tips are polled instead
+        self.polled: set[int] = set()
+        # One connection per watcher, reused for every block
+        self.watch_rpcs = {node.index: self.rpc_proxy(node) for node in self.nodes}
+        if self.options.miners:
+            miners = [self.tanks[name] for name in self.options.miners.split(",")]
+        else:
+            miners = self.nodes
+        utxos = []
+        if self.options.txs:
+            wallet = MiniWallet(self.nodes[0])
+            utxos = self.miniwallet_utxos(
+                self.nodes[0], wallet, self.options.txs * self.options.blocks
+            )
+
+        latencies: list[float] = []
+        reach_all: list[float] = []
+        outcomes = Counter()
+        missed = 0
+        with ThreadPoolExecutor(max_workers=2 * len(self.nodes)) as executor:
+            for index in range(self.options.blocks):
+                self.sync_blocks()
+                miner = miners[index % len(miners)] if self.options.miners else rng.choice(miners)
+                if utxos:
+                    batch = utxos[index * self.options.txs : (index + 1) * self.options.txs]
+                    self.broadcast(wallet, batch, rng)
+                    size = len(batch)
+                    # Let the transactions relay, so tanks can reconstruct the compact block
+                    self.wait_until(
+                        lambda size=size: all(
+                            node.getmempoolinfo()["size"] >= size for node in self.nodes
+                        ),
+                        timeout=60,
+                    )
+
+                before = list(executor.map(block_counters, self.nodes))
+                height = miner.getblockcount() + 1
+                deadline = monotonic() + self.options.timeout
+                watchers = [
+                    executor.submit(self.watch, node, height, deadline) for node in self.nodes
+                ]
+                sleep(WATCH_LEAD)
+                block_hash = self.generatetodescriptor(
+                    miner, 1, MINING_DESCRIPTOR, sync_fun=self.no_op
+                )[0]
+                arrivals = [watcher.result() for watcher in watchers]
+                after = list(executor.map(block_counters, self.nodes))
+
+                # Both the miner and the other tanks are timed by the same long poll
+                mined = arrivals[miner.index]
+                block = []
+                for node, arrival in zip(self.nodes, arrivals):
+                    if node is miner:
+                        continue
+                    if arrival is None or mined is None:
+                        missed += 1
+                        continue
+                    block.append(arrival - mined)
+                    outcomes[relay_outcome(before[node.index], after[node.index])] += 1
+                latencies += block
+                if len(block) == len(self.nodes) - 1:
+                    reach_all.append(max(block, default=0.0))
+                self.log.info(
+                    f"Block {height} {block_hash} from {miner.tank} reached "
+                    f"{len(block)}/{len(self.nodes) - 1} tanks, "
+                    f"p50 {percentile(sorted(block), 50) if block else 0:.3f}s, "
+                    f"max {max(block, default=0):.3f}s"
+                )
+                sleep(self.options.interval)
+
+        self.log.info(f"Block arrival latency CDF: {format_cdf(latencies)}")
+        self.log.info(f"Time to reach all tanks ({len(reach_all)} blocks): {format_cdf(reach_all)}")
+        received = sum(outcomes.values())
+        self.log.info(
+            "Relay outcomes: "
+            + ", ".join(
+                f"{outcome} {count} ({100 * count / received:.0f}%)"
+                for outcome, count in outcomes.most_common()
+            )
+            + f", {missed} missed"
+        )
+        compact = outcomes["compact"] + outcomes["compact_roundtrip"]
+        result = {
+            "arrivals": cdf(latencies) if latencies else None,
+            "reach_all": cdf(reach_all) if reach_all else None,
+            "outcomes": dict(outcomes),
+            "missed": missed,
+            # Compact blocks rebuilt from the mempool without asking for missing transactions
+            "compact_reconstruction": round(outcomes["compact"] / compact, 4) if compact else None,
+        }
+        self.log_result(result)
+
+
+def main():
+    BlockPropagation().main()
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,7 @@ import base64
 import configparser
 import json
 import logging
+import math
 import os
 import pathlib
 import random
@@ -10,11 +11,17 @@ import signal
 import sys
 import tempfile
 import threading
-from time import sleep
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from decimal import Decimal
+from time import monotonic, sleep
+from typing import Callable, Optional
 
 from kubernetes import client, config
 from ln_framework.ln import CLN, LND, LNNode
 from test_framework.authproxy import AuthServiceProxy
+from test_framework.blocktools import COINBASE_MATURITY
 from test_framework.p2p import NetworkThread
 from test_framework.test_framework import (
     TMPDIR_PREFIX,
@@ -118,6 +125,282 @@ class ColorFormatter(logging.Formatter):
         return formatter.format(record)
 
 
+CDF_PERCENTILES = (10, 25, 50, 75, 90, 95, 99, 100)
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """Nearest-rank percentile of sorted values"""
+    return values[max(0, math.ceil(pct / 100 * len(values)) - 1)]
+
+
+def cdf(values: list[float]) -> dict[str, float]:
+    values = sorted(values)
+    return {f"p{pct}": round(percentile(values, pct), 4) for pct in CDF_PERCENTILES}
+
+
+def format_cdf(values: list[float]) -> str:
+    if not values:
+        return "no samples"
+    return ", ".join(f"{key} {value:.3f}s" for key, value in cdf(values).items())
+
+
+class RateProfile:
+    """
+    Requested rate in actions per second over the seconds since a load started:
+
+        100                         constant 100/s
+        constant:100                the same
+        ramp:10:200:60              10/s rising linearly to 200/s over 60s, then 200/s
+        step:10@0,50@30,200@60      10/s, 50/s from 30s, 200/s from 60s
+        burst:20:500:5:60           20/s with 5s bursts of 500/s every 60s
+    """
+
+    def __init__(self, spec: str):
+        self.spec = spec
+        kind, _, args = spec.partition(":")
+        if not args:
+            kind, args = "constant", kind
+        self.kind = kind
+        try:
+            if kind == "step":
+                steps = [step.split("@") for step in args.split(",")]
+                self.steps = sorted((float(at), float(rate)) for rate, at in steps)
+            else:
+                self.args = [float(arg) for arg in args.split(":")]
+        except ValueError as e:
+            raise ValueError(f"Invalid rate profile {spec}: {e}") from e
+        expected = {"constant": 1, "ramp": 3, "burst": 4, "step": None}
+        if kind not in expected:
+            raise ValueError(f"Unknown rate profile {kind}, expected one of {list(expected)}")
+        if expected[kind] is not None and len(self.args) != expected[kind]:
+            raise ValueError(f"Rate profile {kind} takes {expected[kind]} values: {spec}")
+
+    def __str__(self):
+        return self.spec
+
+    def rate(self, t: float) -> float:
+        if self.kind == "constant":
+            return self.args[0]
+        if self.kind == "ramp":
+            start, end, seconds = self.args
+            return end if t >= seconds else start + (end - start) * t / seconds
+        if self.kind == "burst":
+            base, peak, length, period = self.args
+            return peak if t % period < length else base
+        rate = 0.0
+        for at, step in self.steps:
+            if t < at:
+                break
+            rate = step
+        return rate
+
+
+class ActionDropped(Exception):
+    """Raised by a LoadScheduler action that cannot run now, counts it as dropped"""
+
+
+# Start lags kept per LoadStats, a uniform sample once more actions started
+LAG_SAMPLES = 10_000
+
+
+@dataclass
+class LoadStats:
+    started_at: float = field(default_factory=monotonic)
+    # Rates are over the scheduling period, not the wait for the last actions
+    ended_at: Optional[float] = None
+    requested: int = 0
+    dropped: int = 0
+    started: int = 0
+    # Completed before ended_at, and completed while the backlog drained after it
+    completed: int = 0
+    drained: int = 0
+    failed: int = 0
+    # Seconds between the scheduled and the actual start of the actions, a reservoir
+    # sample so a load running forever keeps bounded memory
+    lags: list[float] = field(default_factory=list)
+    errors: Counter = field(default_factory=Counter)
+    sampler: random.Random = field(default_factory=random.Random, repr=False)
+
+    def add_lag(self, lag: float):
+        """Call after counting the action in `started`"""
+        if len(self.lags) < LAG_SAMPLES:
+            self.lags.append(lag)
+            return
+        slot = self.sampler.randrange(self.started)
+        if slot < LAG_SAMPLES:
+            self.lags[slot] = lag
+
+    def summary(self, backlog: int) -> dict:
+        elapsed = max((self.ended_at or monotonic()) - self.started_at, 1e-9)
+        lags = sorted(self.lags)
+        summary = {
+            "requested_rate": round(self.requested / elapsed, 2),
+            "achieved_rate": round(self.completed / elapsed, 2),
+            "requested": self.requested,
+            "completed": self.completed,
+            "drained": self.drained,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "backlog": backlog,
+        }
+        for pct in (50, 99):
+            summary[f"lag_p{pct}"] = round(percentile(lags, pct), 4) if lags else None
+        return summary
+
+
+class LoadScheduler:
+    """
+    Runs action(seq) on a worker pool at the rate of a RateProfile, open loop: actions start
+    on schedule whether or not earlier ones have finished, so a slow node shows up as
+    backlog and start lag instead of as a silently lower rate.
+
+    Arrivals are evenly spaced ("constant") or exponentially distributed ("poisson").
+    Scheduled actions are paced by a token bucket holding at most `burst` tokens (one
+    second of load by default): a dispatcher that falls further behind drops the missed
+    actions instead of firing them all at once. Actions that would grow the queue of
+    actions waiting for a worker beyond `max_backlog` are dropped as well, and so are
+    actions that raise ActionDropped.
+    """
+
+    # Seconds between two looks at a profile that requests no load
+    IDLE_STEP = 0.1
+
+    def __init__(
+        self,
+        action: Callable[[int], object],
+        profile: RateProfile,
+        log: logging.Logger,
+        workers=8,
+        arrivals="constant",
+        burst=None,
+        max_backlog=1000,
+        report_interval=10.0,
+        seed=None,
+    ):
+        assert arrivals in ("constant", "poisson"), f"Unknown arrivals {arrivals}"
+        self.action = action
+        self.profile = profile
+        self.log = log
+        self.workers = workers
+        self.arrivals = arrivals
+        self.burst = burst
+        self.max_backlog = max_backlog
+        self.report_interval = report_interval
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.submitted = 0
+        self.total = LoadStats()
+        self.window = LoadStats()
+
+    @property
+    def backlog(self) -> int:
+        return self.submitted - self.total.started
+
+    def record(self, **counts):
+        with self.lock:
+            for stats in (self.total, self.window):
+                for name, count in counts.items():
+                    setattr(stats, name, getattr(stats, name) + count)
+
+    def execute(self, seq: int, scheduled: float):
+        lag = monotonic() - scheduled
+        with self.lock:
+            for stats in (self.total, self.window):
+                stats.started += 1
+                stats.add_lag(lag)
+        try:
+            self.action(seq)
+        except ActionDropped:
+            self.record(dropped=1)
+            return
+        except Exception as e:
+            with self.lock:
+                first = self.total.errors[type(e).__name__] == 0
+                for stats in (self.total, self.window):
+                    stats.failed += 1
+                    stats.errors[type(e).__name__] += 1
+            if first:
+                self.log.error(f"Scheduled action {seq} failed: {e!r}")
+            return
+        with self.lock:
+            for stats in (self.total, self.window):
+                if stats.ended_at is None:
+                    stats.completed += 1
+                else:
+                    stats.drained += 1
+
+    def report(self, label: str, summary: dict, rate: float, errors: Counter):
+        lag = summary["lag_p50"], summary["lag_p99"]
+        self.log.info(
+            f"{label}: {summary['achieved_rate']}/s achieved of {summary['requested_rate']}/s "
+            f"requested (profile {rate:g}/s now), {summary['completed']} completed, "
+            f"{summary['failed']} failed, {summary['dropped']} dropped, "
+            f"backlog {summary['backlog']}, start lag p50 {lag[0]}s p99 {lag[1]}s"
+            + (f", errors: {dict(errors.most_common(3))}" if errors else "")
+        )
+
+    def gap(self, rate: float) -> float:
+        if self.arrivals == "poisson":
+            return self.rng.expovariate(rate)
+        return 1 / rate
+
+    def run(self, duration=0.0) -> dict:
+        """Schedule actions for `duration` seconds (0 runs forever), returns the totals"""
+        self.log.info(f"Scheduling {self.arrivals} load with profile {self.profile}")
+        start = monotonic()
+        self.total = LoadStats(start)
+        self.window = LoadStats(start)
+        due = start
+        seq = 0
+        rate = 0.0
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while not duration or due - start < duration:
+                now = monotonic()
+                if now - self.window.started_at >= self.report_interval:
+                    window, self.window = self.window, LoadStats()
+                    summary = window.summary(self.backlog)
+                    self.report(
+                        f"Last {now - window.started_at:.0f}s", summary, rate, window.errors
+                    )
+                rate = self.profile.rate(due - start)
+                if rate <= 0:
+                    due += self.IDLE_STEP
+                    sleep(max(0.0, due - now))
+                    continue
+                if due > now:
+                    sleep(min(due - now, self.report_interval))
+                    continue
+                # Token bucket: never more than `burst` actions behind schedule
+                burst = self.burst if self.burst is not None else max(1.0, rate)
+                missed = int((now - due) * rate - burst)
+                if missed > 0:
+                    self.record(requested=missed, dropped=missed)
+                    due += missed / rate
+                    seq += missed
+                if self.backlog >= self.max_backlog:
+                    self.record(requested=1, dropped=1)
+                else:
+                    self.record(requested=1)
+                    with self.lock:
+                        self.submitted += 1
+                    executor.submit(self.execute, seq, due)
+                seq += 1
+                due += self.gap(rate)
+            with self.lock:
+                self.total.ended_at = monotonic()
+                summary = self.total.summary(self.backlog)
+        # Leaving the executor waits for the backlog
+        summary["drained"] = self.total.drained
+        summary["drain_seconds"] = round(monotonic() - self.total.ended_at, 3)
+        self.report("Total", summary, rate, self.total.errors)
+        if summary["drained"]:
+            self.log.info(
+                f"{summary['drained']} more actions of the backlog completed in "
+                f"{summary['drain_seconds']}s after scheduling ended"
+            )
+        return summary
+
+
 class Commander(BitcoinTestFramework):
     # required by subclasses of BitcoinTestFramework
     def set_test_params(self):
@@ -169,6 +452,77 @@ class Commander(BitcoinTestFramework):
         all(thread.join() is None for thread in conn_threads)
         self.log.info("Network connected")
 
+    def log_result(self, result: dict):
+        """
+        Log the outcome of a measurement as one machine readable line, to compare runs
+        across versions, implementations and policies
+        """
+        self.log.info(f"Result: {json.dumps(result, sort_keys=True)}")
+
+    def rpc_proxy(self, node: TestNode, timeout=60) -> AuthServiceProxy:
+        """
+        A new RPC connection to a tank. Calls made through one proxy share its HTTP
+        connection, so threads calling a tank at the same time each need their own.
+        """
+        tank = WARNET["tanks"][node.index]
+        return get_rpc_proxy(
+            f"http://{tank['rpc_user']}:{tank['rpc_password']}@{tank['rpc_host']}:{tank['rpc_port']}",
+            node.index,
+            timeout=timeout,
+            coveragedir=self.options.coveragedir,
+        )
+
+    def miniwallet_utxos(
+        self, node, wallet, count: int, fanout=500, min_value=Decimal("0.001")
+    ) -> list[dict]:
+        """
+        Up to `count` confirmed UTXOs of the MiniWallet of `node` worth at least `min_value`.
+        Missing ones are split off the largest coins, `fanout` outputs per transaction, and
+        on regtest coinbases are mined to the MiniWallet first if there isn't enough to split.
+        """
+        mined = False
+        while True:
+            utxos = [
+                u
+                for u in wallet.get_utxos(mark_as_spent=False, confirmed_only=True)
+                if u["value"] >= min_value
+            ]
+            utxos.sort(key=lambda u: u["value"])
+            missing = count - len(utxos)
+            splits = []
+            # Fan the largest coins out until there are enough UTXOs
+            while missing > 0 and utxos:
+                outputs = min(fanout, missing + 1)
+                if utxos[-1]["value"] < 2 * outputs * min_value:
+                    break
+                splits.append((utxos.pop(), outputs))
+                missing -= outputs - 1
+            if missing <= 0 or mined or node.chain != "regtest":
+                break
+            blocks = -(-missing // fanout)
+            self.log.info(f"Mining {blocks} coinbases to the MiniWallet...")
+            self.generatetodescriptor(
+                node, blocks + COINBASE_MATURITY, wallet.get_descriptor(), sync_fun=self.no_op
+            )
+            wallet.rescan_utxos()
+            mined = True
+        if splits:
+            self.log.info(f"Splitting {len(splits)} coins into UTXOs...")
+            for utxo, outputs in splits:
+                tx = wallet.create_self_transfer_multi(utxos_to_spend=[utxo], num_outputs=outputs)
+                wallet.sendrawtransaction(from_node=node, tx_hex=tx["hex"])
+            self.generatetodescriptor(node, 1, wallet.get_descriptor(), sync_fun=self.no_op)
+            wallet.rescan_utxos(include_mempool=False)
+            self.sync_blocks()
+        utxos = [
+            u
+            for u in wallet.get_utxos(mark_as_spent=False, confirmed_only=True)
+            if u["value"] >= min_value
+        ]
+        if len(utxos) < count:
+            self.log.warning(f"Only {len(utxos)} of {count} MiniWallet UTXOs available")
+        return utxos[:count]
+
     def handle_sigterm(self, signum, frame):
         print("SIGTERM received, stopping...")
         self.shutdown()
@@ -215,12 +569,7 @@ class Commander(BitcoinTestFramework):
                 coverage_dir=self.options.coveragedir,
             )
             node.tank = tank["tank"]
-            node.rpc = get_rpc_proxy(
-                f"http://{tank['rpc_user']}:{tank['rpc_password']}@{tank['rpc_host']}:{tank['rpc_port']}",
-                i,
-                timeout=60,
-                coveragedir=self.options.coveragedir,
-            )
+            node.rpc = self.rpc_proxy(node)
             node.rpc_connected = True
             node.init_peers = int(tank["init_peers"])
 
@@ -436,65 +785,85 @@ class Commander(BitcoinTestFramework):
                 since there will be a race between the actual connection and performing
                 the assertions before one node shuts down.
         """
-        from_connection = self.nodes[a]
-        to_connection = self.nodes[b]
-        from_num_peers = 1 + len(from_connection.getpeerinfo())
-        to_num_peers = 1 + len(to_connection.getpeerinfo())
-        ip_port = self.nodes[b].rpchost + ":18444"
+        self.connect_edges(
+            [(a, b)], peer_advertises_v2=peer_advertises_v2, wait_for_connect=wait_for_connect
+        )
 
+    def connect_edges(
+        self,
+        edges,
+        *,
+        parallelism: int = 32,
+        peer_advertises_v2=None,
+        wait_for_connect: bool = True,
+        timeout: int = 60,
+    ):
+        """
+        Connect a list of (a, b) node index pairs in bulk.
+
+        All addnode calls are issued concurrently, grouped by source node so each
+        node's RPC proxy is only ever used by one thread at a time. The handshake is
+        then verified with a single getpeerinfo poll per unconnected node per round.
+
+        Kwargs:
+            parallelism: maximum number of nodes being called concurrently
+            wait_for_connect: see connect_nodes()
+            timeout: seconds to wait for all handshakes to complete
+        """
         if peer_advertises_v2 is None:
             peer_advertises_v2 = self.options.v2transport
 
-        if peer_advertises_v2:
-            from_connection.addnode(node=ip_port, command="onetry", v2transport=True)
-        else:
-            # skip the optional third argument (default false) for
-            # compatibility with older clients
-            from_connection.addnode(ip_port, "onetry")
+        targets_by_source: dict[int, list[int]] = {}
+        new_peers: dict[int, int] = {}
+        for a, b in edges:
+            targets_by_source.setdefault(a, []).append(b)
+            new_peers[a] = new_peers.get(a, 0) + 1
+            new_peers[b] = new_peers.get(b, 0) + 1
+
+        def addnodes(source, targets):
+            for target in targets:
+                ip_port = self.nodes[target].rpchost + ":18444"
+                if peer_advertises_v2:
+                    self.nodes[source].addnode(node=ip_port, command="onetry", v2transport=True)
+                else:
+                    # skip the optional third argument (default false) for
+                    # compatibility with older clients
+                    self.nodes[source].addnode(ip_port, "onetry")
 
-        if not wait_for_connect:
-            return
+        with ThreadPoolExecutor(max_workers=parallelism) as executor:
+            # Count existing peers on every involved node before adding any edge
+            existing = executor.map(lambda n: len(self.nodes[n].getpeerinfo()), new_peers)
+            expected = {n: count + new_peers[n] for n, count in zip(new_peers, existing)}
 
-        # poll until version handshake complete to avoid race conditions
-        # with transaction relaying
-        # See comments in net_processing:
+            list(executor.map(lambda item: addnodes(*item), targets_by_source.items()))
+
+            if not wait_for_connect:
+                return
+
+            pending = set(expected)
+
+            def all_connected():
+                polled = list(pending)
+                peer_lists = executor.map(lambda n: self.nodes[n].getpeerinfo(), polled)
+                for n, peers in zip(polled, peer_lists):
+                    if self.count_handshaked_peers(peers) >= expected[n]:
+                        pending.discard(n)
+                return not pending
+
+            self.wait_until(all_connected, timeout=timeout)
+        self.log.debug(f"Connected {len(edges)} edges between {len(expected)} nodes")
+
+    @staticmethod
+    def count_handshaked_peers(peers) -> int:
+        # Poll until version handshake complete to avoid race conditions
+        # with transaction relaying. See comments in net_processing:
         # * Must have a version message before anything else
         # * Must have a verack message before anything else
-        self.wait_until(
-            lambda: sum(peer["version"] != 0 for peer in from_connection.getpeerinfo())
-            == from_num_peers
-        )
-        self.wait_until(
-            lambda: sum(peer["version"] != 0 for peer in to_connection.getpeerinfo())
-            == to_num_peers
-        )
-        self.wait_until(
-            lambda: sum(
-                peer["bytesrecv_per_msg"].pop("verack", 0) >= 21
-                for peer in from_connection.getpeerinfo()
-            )
-            == from_num_peers
-        )
-        self.wait_until(
-            lambda: sum(
-                peer["bytesrecv_per_msg"].pop("verack", 0) >= 21
-                for peer in to_connection.getpeerinfo()
-            )
-            == to_num_peers
-        )
         # The message bytes are counted before processing the message, so make
         # sure it was fully processed by waiting for a ping.
-        self.wait_until(
-            lambda: sum(
-                peer["bytesrecv_per_msg"].pop("pong", 0) >= 29
-                for peer in from_connection.getpeerinfo()
-            )
-            == from_num_peers
-        )
-        self.wait_until(
-            lambda: sum(
-                peer["bytesrecv_per_msg"].pop("pong", 0) >= 29
-                for peer in to_connection.getpeerinfo()
-            )
-            == to_num_peers
+        return sum(
+            peer["version"] != 0
+            and peer["bytesrecv_per_msg"].get("verack", 0) >= 21
+            and peer["bytesrecv_per_msg"].get("pong", 0) >= 29
+            for peer in peers
         )
@@ -0,0 +1,379 @@
+"""
+asyncio variants of the LN clients in ln.py, for scenarios with thousands of requests
+in flight: one event loop drives every node instead of one thread per request.
+
+Each node gets a pool of keep-alive HTTPS connections and a limit of requests in
+flight, so a burst of payments queues up in the scenario rather than in the LN node.
+
+    nodes = async_nodes(self.lns, concurrency=16)
+    invoice = await nodes["tank-0001-ln"].createinvoice(1000, "label")
+    result = await nodes["tank-0002-ln"].payinvoice(invoice)
+"""
+
+import asyncio
+import json
+import logging
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Optional
+
+import requests
+
+from .ln import (
+    IDEMPOTENT_METHODS,
+    INSECURE_CONTEXT,
+    MAX_BACKOFF,
+    MIN_BACKOFF,
+    REQUEST_TRIES,
+    STALE_CONNECTION_ERRORS,
+    LNNode,
+)
+
+# Requests in flight per LN node, each on its own keep-alive connection
+ASYNC_NODE_CONCURRENCY = 16
+# Seconds a request may take, payments included
+ASYNC_TIMEOUT = 60
+
+StreamPair = tuple[asyncio.StreamReader, asyncio.StreamWriter]
+
+
+@dataclass
+class Payment:
+    """Outcome of pay(), error is a short failure code and None without any response"""
+
+    ok: bool
+    payment_hash: Optional[str] = None
+    error: Optional[str] = None
+    message: str = ""
+    # Route length and fees, where the implementation reports them
+    hops: Optional[int] = None
+    fee_msat: Optional[int] = None
+
+
+class AsyncHTTPSPool:
+    """
+    Keep-alive HTTPS connections to one LN node, at most `concurrency` of them busy.
+
+    A request failing on a pooled connection the server closed while it was idle is
+    retried right away. Other connection failures are retried on a new connection with
+    exponential backoff, but POSTs only if the request was never sent: a payment that
+    timed out must not be paid again.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        log: logging.Logger,
+        concurrency=ASYNC_NODE_CONCURRENCY,
+        timeout=ASYNC_TIMEOUT,
+    ):
+        self.host = host
+        self.port = port
+        self.log = log
+        self.timeout = timeout
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.idle: list[StreamPair] = []
+
+    async def connect(self) -> tuple[StreamPair, bool]:
+        if self.idle:
+            return self.idle.pop(), True
+        pair = await asyncio.open_connection(
+            self.host, self.port, ssl=INSECURE_CONTEXT, server_hostname=self.host
+        )
+        return pair, False
+
+    def close(self):
+        for _, writer in self.idle:
+            writer.close()
+        self.idle = []
+
+    async def request(self, method: str, uri: str, body=None, headers=None):
+        """Response body as a string, or None once all attempts failed"""
+        payload = (body or "").encode()
+        head = f"{method} {uri} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n"
+        for key, value in (headers or {}).items():
+            head += f"{key}: {value}\r\n"
+        head += f"Content-Length: {len(payload)}\r\n\r\n"
+        delay = MIN_BACKOFF
+        attempt = 0
+        async with self.semaphore:
+            while True:
+                pair = None
+                reused = False
+                sent = False
+                try:
+                    pair, reused = await self.connect()
+                    await asyncio.wait_for(self.send(pair, head.encode() + payload), self.timeout)
+                    sent = True
+                    data, keep_alive = await asyncio.wait_for(self.receive(pair), self.timeout)
+                    if keep_alive:
+                        self.idle.append(pair)
+                    else:
+                        pair[1].close()
+                    return data.decode("utf8")
+                except Exception as e:
+                    if pair:
+                        pair[1].close()
+                    if reused and (not sent or isinstance(e, STALE_CONNECTION_ERRORS)):
+                        continue
+                    if sent and method not in IDEMPOTENT_METHODS:
+                        self.log.error(f"Error {method} {uri}, not retried once sent: {e!r}")
+                        return None
+                    attempt += 1
+                    if attempt >= REQUEST_TRIES:
+                        self.log.error(f"Error {method} {uri}, Abort: {e!r}")
+                        return None
+                    await asyncio.sleep(delay)
+                    delay = min(MAX_BACKOFF, delay * 2)
+
+    @staticmethod
+    async def send(pair: StreamPair, request: bytes):
+        writer = pair[1]
+        writer.write(request)
+        await writer.drain()
+
+    @staticmethod
+    async def receive(pair: StreamPair) -> tuple[bytes, bool]:
+        """Read one response, returns (body, keep the connection)"""
+        reader = pair[0]
+        status = await reader.readline()
+        if not status:
+            # Closed before answering, like an idle connection the server timed out
+            raise ConnectionResetError("Connection closed by server")
+        headers = {}
+        while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+            key, _, value = line.decode().partition(":")
+            headers[key.strip().lower()] = value.strip()
+        keep_alive = headers.get("connection", "").lower() != "close"
+        chunked = headers.get("transfer-encoding", "").lower() == "chunked"
+        if "content-length" in headers:
+            return await reader.readexactly(int(headers["content-length"])), keep_alive
+        if chunked:
+            body = b""
+            while chunk := await read_chunk(reader):
+                body += chunk
+            # Trailers end with an empty line
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            return body, keep_alive
+        return await reader.read(), False
+
+
+async def read_chunk(reader: asyncio.StreamReader) -> bytes:
+    """One chunk of a chunked transfer encoded body, empty at the last chunk"""
+    size = int((await reader.readline()).split(b";")[0], 16)
+    if size == 0:
+        return b""
+    data = await reader.readexactly(size)
+    await reader.readline()
+    return data
+
+
+class AsyncLNNode(ABC):
+    def __init__(self, node: LNNode, port: int, concurrency=ASYNC_NODE_CONCURRENCY):
+        self.name = node.name
+        self.ip_address = node.ip_address
+        self.impl = node.impl
+        self.log = node.log
+        self.pool = AsyncHTTPSPool(node.name, port, self.log, concurrency)
+
+    @staticmethod
+    def from_node(node: LNNode, concurrency=ASYNC_NODE_CONCURRENCY) -> "AsyncLNNode":
+        if node.impl == "cln":
+            return AsyncCLN(node, concurrency)
+        return AsyncLND(node, concurrency)
+
+    def close(self):
+        self.pool.close()
+
+    @abstractmethod
+    async def uri(self) -> Optional[str]:
+        pass
+
+    @abstractmethod
+    async def walletbalance(self) -> int:
+        pass
+
+    @abstractmethod
+    async def channelbalance(self) -> int:
+        pass
+
+    @abstractmethod
+    async def createinvoice(self, sats, label, description="new invoice") -> Optional[str]:
+        pass
+
+    @abstractmethod
+    async def pay(self, payment_request) -> Payment:
+        pass
+
+    async def payinvoice(self, payment_request) -> Optional[str]:
+        """Payment hash, or the error message like the blocking clients"""
+        payment = await self.pay(payment_request)
+        if payment.ok:
+            return payment.payment_hash
+        return payment.message or payment.error
+
+    @abstractmethod
+    async def graph(self) -> Optional[dict]:
+        pass
+
+
+class AsyncCLN(AsyncLNNode):
+    def __init__(self, node: LNNode, concurrency=ASYNC_NODE_CONCURRENCY):
+        super().__init__(node, 3010, concurrency)
+        # Reuse the rune of the blocking client if it already fetched one
+        self.headers = dict(node.headers)
+        self.rune_lock = asyncio.Lock()
+
+    async def createrune(self):
+        async with self.rune_lock:
+            if "Rune" in self.headers:
+                return
+            response = await asyncio.to_thread(
+                requests.get, f"http://{self.ip_address}:8080/rune.json", timeout=5
+            )
+            self.headers = {"Rune": json.loads(response.text)["rune"]}
+
+    async def post(self, uri, data=None):
+        if "Rune" not in self.headers:
+            await self.createrune()
+        body = json.dumps(data or {})
+        headers = {**self.headers, "Content-Type": "application/json"}
+        return await self.pool.request("POST", uri, body=body, headers=headers)
+
+    async def uri(self):
+        response = await self.post("/v1/getinfo")
+        if not response:
+            return None
+        res = json.loads(response)
+        if len(res["address"]) < 1:
+            return None
+        return f"{res['id']}@{res['address'][0]['address']}:{res['address'][0]['port']}"
+
+    async def walletbalance(self) -> int:
+        response = await self.post("/v1/listfunds")
+        if not response:
+            return 0
+        return int(sum(o["amount_msat"] for o in json.loads(response)["outputs"]) / 1000)
+
+    async def channelbalance(self) -> int:
+        response = await self.post("/v1/listfunds")
+        if not response:
+            return 0
+        return int(sum(o["our_amount_msat"] for o in json.loads(response)["channels"]) / 1000)
+
+    async def createinvoice(self, sats, label, description="new invoice"):
+        response = await self.post(
+            "/v1/invoice", {"amount_msat": sats * 1000, "label": label, "description": description}
+        )
+        if response:
+            res = json.loads(response)
+            if "bolt11" in res:
+                return res["bolt11"]
+            self.log.warning(f"Unable to create invoice: {res}")
+        return None
+
+    async def pay(self, payment_request) -> Payment:
+        response = await self.post("/v1/pay", {"bolt11": payment_request})
+        if not response:
+            return Payment(ok=False)
+        res = json.loads(response)
+        if "code" in res:
+            return Payment(ok=False, error=str(res["code"]), message=res.get("message", ""))
+        return Payment(
+            ok=True,
+            payment_hash=res["payment_hash"],
+            fee_msat=res["amount_sent_msat"] - res["amount_msat"],
+        )
+
+    async def graph(self):
+        response = await self.post("/v1/listchannels")
+        if not response:
+            return None
+        res = json.loads(response)
+        if "channels" not in res:
+            self.log.warning(f"Unable to get graph: {res}")
+            return None
+        channels = [ch for ch in res["channels"] if ch["direction"] == 1]
+        channels.sort(key=lambda x: x["short_channel_id"])
+        for channel in channels:
+            channel["capacity"] = channel["amount_msat"] // 1000
+        return {"edges": channels}
+
+
+class AsyncLND(AsyncLNNode):
+    def __init__(self, node: LNNode, concurrency=ASYNC_NODE_CONCURRENCY):
+        super().__init__(node, 8080, concurrency)
+        self.headers = dict(node.headers)
+
+    async def get(self, uri):
+        return await self.pool.request("GET", uri, headers=self.headers)
+
+    async def post(self, uri, data):
+        body = json.dumps(data)
+        headers = {**self.headers, "Content-Type": "application/json"}
+        return await self.pool.request("POST", uri, body=body, headers=headers)
+
+    async def uri(self):
+        response = await self.get("/v1/getinfo")
+        if not response:
+            return None
+        info = json.loads(response)
+        if "uris" not in info or len(info["uris"]) == 0:
+            return None
+        return info["uris"][0]
+
+    async def walletbalance(self) -> int:
+        response = await self.get("/v1/balance/blockchain")
+        if not response:
+            return 0
+        return int(json.loads(response)["confirmed_balance"])
+
+    async def channelbalance(self) -> int:
+        response = await self.get("/v1/balance/channels")
+        if not response:
+            return 0
+        return int(json.loads(response)["balance"])
+
+    async def createinvoice(self, sats, label, description="new invoice"):
+        # LND takes a description only as a hash, label the invoice with its memo
+        response = await self.post("/v1/invoices", {"value": sats, "memo": label})
+        if response:
+            res = json.loads(response)
+            if "payment_request" in res:
+                return res["payment_request"]
+            self.log.warning(f"Unable to create invoice: {res}")
+        return None
+
+    async def pay(self, payment_request) -> Payment:
+        # The blocking client reads the first message of the payment stream,
+        # SendPaymentSync answers with the same message and ends the response
+        response = await self.post(
+            "/v1/channels/transactions", {"payment_request": payment_request}
+        )
+        if not response:
+            return Payment(ok=False)
+        res = json.loads(response)
+        if res.get("payment_error"):
+            return Payment(ok=False, error=res["payment_error"], message=res["payment_error"])
+        if "payment_hash" not in res:
+            return Payment(ok=False, error=str(res.get("code")), message=res.get("message", ""))
+        route = res.get("payment_route") or {}
+        return Payment(
+            ok=True,
+            payment_hash=res["payment_hash"],
+            hops=len(route.get("hops", [])),
+            fee_msat=int(route.get("total_fees_msat", 0)),
+        )
+
+    async def graph(self):
+        response = await self.get("/v1/graph")
+        return json.loads(response) if response else None
+
+
+def async_nodes(
+    lns: dict[str, LNNode], concurrency=ASYNC_NODE_CONCURRENCY
+) -> dict[str, AsyncLNNode]:
+    """asyncio clients for the LN nodes of a Commander, keyed by name like Commander.lns"""
+    return {name: AsyncLNNode.from_node(ln, concurrency) for name, ln in lns.items()}
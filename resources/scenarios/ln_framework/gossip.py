@@ -0,0 +1,140 @@
+import logging
+import threading
+from statistics import median
+from time import monotonic
+
+from .ln import LNNode, Policy
+
+# Once at most this many edges of a node are still unmatched, query them one by one
+# instead of downloading the node's whole graph
+EDGE_QUERY_LIMIT = 16
+# Minimum seconds between two aggregate progress reports
+PROGRESS_INTERVAL = 10
+
+
+def edge_key(edge: dict) -> tuple[int, int]:
+    """(block, tx index) of a graph edge from LND (channel_id) or CLN (short_channel_id)"""
+    if "short_channel_id" in edge:
+        block, index, _ = edge["short_channel_id"].split("x")
+        return int(block), int(index)
+    chan_id = int(edge["channel_id"])
+    return chan_id >> 40, (chan_id >> 16) & 0xFFFFFF
+
+
+def policy_equal(pol1: Policy, pol2: Policy, capacity: int) -> bool:
+    return pol1.to_lnd_chanpolicy(capacity) == pol2.to_lnd_chanpolicy(capacity)
+
+
+def edge_matches(expected: dict, actual: dict, name: str) -> bool:
+    """True if a graph edge has the capacity and (if any) the policies of a network.yaml channel"""
+    capacity = expected["capacity"]
+    # We assert this because it isn't updated as part of policy.
+    # If this fails we have a bigger issue
+    assert int(actual["capacity"]) == capacity, (
+        f"LN {name} graph capacity mismatch:\n actual: {actual['capacity']}\n expected: {capacity}"
+    )
+
+    # Policies were not defined in network.yaml
+    if "source_policy" not in expected or "target_policy" not in expected:
+        return True
+
+    # policy actual/expected source/target
+    polas = Policy.from_lnd_describegraph(actual["node1_policy"])
+    polat = Policy.from_lnd_describegraph(actual["node2_policy"])
+    poles = Policy(**expected["source_policy"])
+    polet = Policy(**expected["target_policy"])
+    # Allow policy swap when comparing channels
+    return (policy_equal(polas, poles, capacity) and policy_equal(polat, polet, capacity)) or (
+        policy_equal(polas, polet, capacity) and policy_equal(polat, poles, capacity)
+    )
+
+
+class GossipTracker:
+    """
+    Tracks how the expected channels propagate to the graph of every LN node.
+
+    has_all_channels() and policies_match() are cheap enough to poll: channel counts
+    come from a summary call where the implementation has one, and once an edge
+    matches on a node it is never fetched from that node again. Callers stop polling
+    a node once it has converged. Aggregate progress and time-to-converge are logged.
+    """
+
+    def __init__(self, channels: list[dict], names: list[str], log: logging.Logger):
+        self.expected = {(ch["id"]["block"], ch["id"]["index"]): ch for ch in channels}
+        self.names = names
+        self.log = log
+        self.lock = threading.Lock()
+        # Edge keys each node has not matched yet, unknown until its first full graph
+        self.unmatched: dict[str, set[tuple[int, int]]] = {}
+        self.start("gossip")
+
+    def start(self, phase: str):
+        """Begin measuring a new convergence phase"""
+        with self.lock:
+            self.phase = phase
+            self.started = monotonic()
+            self.last_report = self.started
+            self.seen = {name: 0 for name in self.names}
+            self.converged: dict[str, float] = {}
+
+    def has_all_channels(self, ln: LNNode) -> bool:
+        count = ln.channel_count()
+        return self._update(ln.name, count, count >= len(self.expected))
+
+    def policies_match(self, ln: LNNode) -> bool:
+        with self.lock:
+            unmatched = self.unmatched.get(ln.name)
+        if unmatched is None or len(unmatched) > EDGE_QUERY_LIMIT:
+            edges = ln.graph()["edges"]
+            if len(edges) == 0:
+                return self._update(ln.name, 0, False)
+            assert len(self.expected) == len(edges), (
+                f"Expected edges {len(self.expected)}, actual edges {len(edges)}\n{edges}"
+            )
+            actual = {edge_key(edge): edge for edge in edges}
+            unmatched = {
+                key
+                for key in (set(self.expected) if unmatched is None else unmatched)
+                if key not in actual or not edge_matches(self.expected[key], actual[key], ln.name)
+            }
+        else:
+            unmatched = {key for key in unmatched if not self._edge_matches(ln, key)}
+        with self.lock:
+            self.unmatched[ln.name] = unmatched
+        return self._update(ln.name, len(self.expected) - len(unmatched), not unmatched)
+
+    def _edge_matches(self, ln: LNNode, key: tuple[int, int]) -> bool:
+        expected = self.expected[key]
+        edge = ln.graph_edge(*key, expected.get("output", 0))
+        return edge is not None and edge_matches(expected, edge, ln.name)
+
+    def _update(self, name: str, seen: int, done: bool) -> bool:
+        with self.lock:
+            self.seen[name] = seen
+            if done and name not in self.converged:
+                self.converged[name] = monotonic() - self.started
+            now = monotonic()
+            if now - self.last_report >= PROGRESS_INTERVAL:
+                self.last_report = now
+                self.log.info(self.progress())
+        return done
+
+    def progress(self) -> str:
+        total = len(self.names) * len(self.expected)
+        seen = sum(min(count, len(self.expected)) for count in self.seen.values())
+        return (
+            f"{self.phase}: {len(self.converged)}/{len(self.names)} LN nodes converged, "
+            f"{seen}/{total} edges ({100 * seen / max(total, 1):.0f}%) "
+            f"after {monotonic() - self.started:.1f}s"
+        )
+
+    def summary(self) -> str:
+        with self.lock:
+            times = sorted(self.converged.values())
+            if not times:
+                return f"{self.phase}: no LN node converged"
+            return (
+                f"{self.phase}: {len(times)}/{len(self.names)} LN nodes converged in "
+                f"{times[-1]:.1f}s (per node min {times[0]:.1f}s, "
+                f"median {median(times):.1f}s, max {times[-1]:.1f}s)"
+            )
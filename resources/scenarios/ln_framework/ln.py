@@ -3,8 +3,10 @@ import http.client
 import json
 import logging
 import ssl
+import threading
 from abc import ABC, abstractmethod
 from time import sleep
+from typing import Optional
 
 import requests
 
@@ -14,6 +16,104 @@ ADMIN_MACAROON_HEX = "0201036c6e6402f801030a1062beabbf2a614b112128afa0c0b4fdd612
 INSECURE_CONTEXT = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
 INSECURE_CONTEXT.check_hostname = False
 INSECURE_CONTEXT.verify_mode = ssl.CERT_NONE
+# Idle keep-alive connections kept open per LN node
+POOL_SIZE = 8
+# Attempts per request, and the bounds of the exponential backoff between them
+REQUEST_TRIES = 6
+MIN_BACKOFF = 0.25
+MAX_BACKOFF = 4.0
+# Requests that may be sent again after the server could have processed them
+IDEMPOTENT_METHODS = ("GET", "HEAD")
+# How a pooled connection the server closed while it was idle fails the next request,
+# before the server read any of it
+STALE_CONNECTION_ERRORS = (ConnectionResetError, BrokenPipeError, ConnectionAbortedError)
+
+
+class HTTPSPool:
+    """
+    Thread-safe pool of keep-alive HTTPS connections to one LN node.
+
+    Responses are read whole and the connection goes back to the pool for the next
+    request. A request failing on a pooled connection the server closed while it was
+    idle is retried right away. Other connection failures are retried on a new
+    connection with exponential backoff, but POSTs only if the request was never sent:
+    opening a channel twice is worse than reporting the error.
+    """
+
+    def __init__(self, host: str, port: int, log: logging.Logger, timeout=5):
+        self.host = host
+        self.port = port
+        self.log = log
+        self.timeout = timeout
+        self.idle: list[http.client.HTTPSConnection] = []
+        self.lock = threading.Lock()
+
+    def acquire(self) -> tuple[http.client.HTTPSConnection, bool]:
+        with self.lock:
+            if self.idle:
+                return self.idle.pop(), True
+        conn = http.client.HTTPSConnection(
+            host=self.host, port=self.port, timeout=self.timeout, context=INSECURE_CONTEXT
+        )
+        return conn, False
+
+    def release(self, conn: http.client.HTTPSConnection):
+        with self.lock:
+            if len(self.idle) < POOL_SIZE:
+                self.idle.append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for conn in idle:
+            conn.close()
+
+    def request(self, method: str, uri: str, body=None, headers=None, stream=False):
+        """
+        Response body as a string, or None once all attempts failed. Streaming
+        endpoints don't end their response, so only their first message is returned.
+        """
+        delay = MIN_BACKOFF
+        attempt = 0
+        while True:
+            conn, reused = self.acquire()
+            sent = False
+            try:
+                conn.request(method=method, url=uri, body=body, headers=headers or {})
+                sent = True
+                res = conn.getresponse()
+                if stream:
+                    data = self.first_message(res)
+                    conn.close()
+                else:
+                    data = res.read()
+                    if res.will_close:
+                        conn.close()
+                    else:
+                        self.release(conn)
+                return data.decode("utf8")
+            except Exception as e:
+                conn.close()
+                if reused and (not sent or isinstance(e, STALE_CONNECTION_ERRORS)):
+                    continue
+                if sent and method not in IDEMPOTENT_METHODS:
+                    self.log.error(f"Error {method} {uri}, not retried once sent: {e!r}")
+                    return None
+                attempt += 1
+                if attempt >= REQUEST_TRIES:
+                    self.log.error(f"Error {method} {uri}, Abort: {e}")
+                    return None
+                sleep(delay)
+                delay = min(MAX_BACKOFF, delay * 2)
+
+    @staticmethod
+    def first_message(res: http.client.HTTPResponse) -> bytes:
+        try:
+            return res.readline()
+        except OSError:
+            return b""
 
 
 # https://github.com/lightningcn/lightning-rfc/blob/master/07-routing-gossip.md#the-channel_update-message
@@ -113,6 +213,11 @@ class LNNode(ABC):
     def walletbalance(self) -> int:
         pass
 
+    @abstractmethod
+    def synced_height(self) -> Optional[int]:
+        """Height of the block the node's wallet has caught up with, None if unknown"""
+        pass
+
     @abstractmethod
     def connect(self, target_uri) -> dict:
         pass
@@ -129,78 +234,44 @@ class LNNode(ABC):
     def update(self, txid_hex: str, policy: dict, capacity: int) -> dict:
         pass
 
+    def channel_count(self) -> int:
+        """Number of channels in the node's graph, implementations may count cheaper"""
+        return len(self.graph()["edges"])
+
+    def graph_edge(self, block: int, index: int, output: int) -> Optional[dict]:
+        """One edge of graph() by short channel id, or None if the node doesn't know it"""
+        scid = f"{block}x{index}x{output}"
+        chan_id = str((block << 40) | (index << 16) | output)
+        for edge in self.graph()["edges"]:
+            if edge.get("short_channel_id") == scid or edge.get("channel_id") == chan_id:
+                return edge
+        return None
+
 
 class CLN(LNNode):
     def __init__(self, pod_name, ip_address):
         super().__init__(pod_name, ip_address)
-        self.conn = None
+        self.pool = HTTPSPool(pod_name, 3010, self.log)
         self.headers = {}
         self.impl = "cln"
-        self.reset_connection()
 
     def reset_connection(self):
-        self.conn = http.client.HTTPSConnection(
-            host=self.name, port=3010, timeout=5, context=INSECURE_CONTEXT
-        )
+        self.pool.close()
 
     def setRune(self, rune):
         self.headers = {"Rune": rune}
 
     def get(self, uri):
-        attempt = 0
-        while True:
-            try:
-                self.log.warning(f"headers: {self.headers}")
-                self.conn.request(
-                    method="GET",
-                    url=uri,
-                    headers=self.headers,
-                )
-                return self.conn.getresponse().read().decode("utf8")
-            except Exception as e:
-                self.reset_connection()
-                attempt += 1
-                if attempt > 5:
-                    self.log.error(f"Error CLN GET, Abort: {e}")
-                    return None
-                sleep(1)
+        if "Rune" not in self.headers:
+            self.createrune()
+        return self.pool.request("GET", uri, headers=self.headers)
 
     def post(self, uri, data=None):
-        if not data:
-            data = {}
-        body = json.dumps(data)
-        post_header = self.headers
-        post_header["Content-Length"] = str(len(body))
-        post_header["Content-Type"] = "application/json"
-        attempt = 0
-        while True:
-            try:
-                self.conn.request(
-                    method="POST",
-                    url=uri,
-                    body=body,
-                    headers=post_header,
-                )
-                # Stream output, otherwise we get a timeout error
-                res = self.conn.getresponse()
-                stream = ""
-                while True:
-                    try:
-                        data = res.read(1)
-                        if len(data) == 0:
-                            break
-                        else:
-                            stream += data.decode("utf8")
-                    except Exception:
-                        break
-                return stream
-            except Exception as e:
-                self.reset_connection()
-                attempt += 1
-                if attempt > 5:
-                    self.log.error(f"Error CLN POST, Abort: {e}")
-                    return None
-                sleep(1)
+        if "Rune" not in self.headers:
+            self.createrune()
+        body = json.dumps(data or {})
+        headers = {**self.headers, "Content-Type": "application/json"}
+        return self.pool.request("POST", uri, body=body, headers=headers)
 
     def createrune(self, max_tries=2):
         attempt = 0
@@ -217,7 +288,6 @@ class CLN(LNNode):
         raise Exception(f"Unable to fetch rune from {self.name}")
 
     def newaddress(self, max_tries=2):
-        self.createrune()
         attempt = 0
         while attempt < max_tries:
             attempt += 1
@@ -241,6 +311,12 @@ class CLN(LNNode):
             return None
         return f"{res['id']}@{res['address'][0]['address']}:{res['address'][0]['port']}"
 
+    def synced_height(self) -> Optional[int]:
+        response = self.post("/v1/getinfo")
+        if not response:
+            return None
+        return json.loads(response).get("blockheight")
+
     def walletbalance(self, max_tries=2) -> int:
         attempt = 0
         while attempt < max_tries:
@@ -309,7 +385,7 @@ class CLN(LNNode):
 
     def createinvoice(self, sats, label, description="new invoice") -> str:
         response = self.post(
-            "invoice", {"amount_msat": sats * 1000, "label": label, "description": description}
+            "/v1/invoice", {"amount_msat": sats * 1000, "label": label, "description": description}
         )
         if response:
             res = json.loads(response)
@@ -354,76 +430,34 @@ class CLN(LNNode):
         self.log.warning("Channel Policy Updates not supported by CLN yet!")
         return None
 
+    def graph_edge(self, block: int, index: int, output: int) -> Optional[dict]:
+        response = self.post("/v1/listchannels", {"short_channel_id": f"{block}x{index}x{output}"})
+        if not response:
+            return None
+        channels = [ch for ch in json.loads(response).get("channels", []) if ch["direction"] == 1]
+        if not channels:
+            return None
+        channels[0]["capacity"] = channels[0]["amount_msat"] // 1000
+        return channels[0]
+
 
 class LND(LNNode):
     def __init__(self, pod_name, ip_address):
         super().__init__(pod_name, ip_address)
-        self.conn = http.client.HTTPSConnection(
-            host=pod_name, port=8080, timeout=5, context=INSECURE_CONTEXT
-        )
-        self.headers = {
-            "Grpc-Metadata-macaroon": ADMIN_MACAROON_HEX,
-            "Connection": "close",
-        }
+        self.pool = HTTPSPool(pod_name, 8080, self.log)
+        self.headers = {"Grpc-Metadata-macaroon": ADMIN_MACAROON_HEX}
         self.impl = "lnd"
 
     def reset_connection(self):
-        self.conn = http.client.HTTPSConnection(
-            host=self.name, port=8080, timeout=5, context=INSECURE_CONTEXT
-        )
+        self.pool.close()
 
     def get(self, uri):
-        attempt = 0
-        while True:
-            try:
-                self.conn.request(
-                    method="GET",
-                    url=uri,
-                    headers=self.headers,
-                )
-                return self.conn.getresponse().read().decode("utf8")
-            except Exception as e:
-                self.reset_connection()
-                attempt += 1
-                if attempt > 5:
-                    self.log.error(f"Error LND POST, Abort: {e}")
-                    return None
-                sleep(1)
+        return self.pool.request("GET", uri, headers=self.headers)
 
-    def post(self, uri, data):
+    def post(self, uri, data, stream=False):
         body = json.dumps(data)
-        post_header = self.headers
-        post_header["Content-Length"] = str(len(body))
-        post_header["Content-Type"] = "application/json"
-        attempt = 0
-        while True:
-            try:
-                self.conn.request(
-                    method="POST",
-                    url=uri,
-                    body=body,
-                    headers=post_header,
-                )
-                # Stream output, otherwise we get a timeout error
-                res = self.conn.getresponse()
-                stream = ""
-                while True:
-                    try:
-                        data = res.read(1)
-                        if len(data) == 0:
-                            break
-                        else:
-                            stream += data.decode("utf8")
-                    except Exception:
-                        break
-                return stream
-            except Exception as e:
-                self.reset_connection()
-                attempt += 1
-                if attempt > 5:
-                    self.log.error(f"Error LND POST, Abort: {e}")
-                    return None
-                sleep(1)
+        headers = {**self.headers, "Content-Type": "application/json"}
+        return self.pool.request("POST", uri, body=body, headers=headers, stream=stream)
 
     def newaddress(self, max_tries=10):
         attempt = 0
@@ -440,6 +474,16 @@ class LND(LNNode):
             sleep(1)
         return False, ""
 
+    def synced_height(self) -> Optional[int]:
+        response = self.get("/v1/getinfo")
+        if not response:
+            return None
+        info = json.loads(response)
+        # block_height is the chain backend's tip, which the wallet may not have processed yet
+        if not info.get("synced_to_chain"):
+            return None
+        return int(info["block_height"])
+
     def walletbalance(self) -> int:
         res = self.get("/v1/balance/blockchain")
         return int(json.loads(res)["confirmed_balance"])
@@ -473,6 +517,7 @@ class LND(LNNode):
                     "node_pubkey": b64_pk,
                     "sat_per_vbyte": fee_rate,
                 },
+                stream=True,
             )
             try:
                 res = json.loads(response)
@@ -514,7 +559,9 @@ class LND(LNNode):
 
     def payinvoice(self, payment_request) -> str:
         response = self.post(
-            "/v1/channels/transaction-stream", data={"payment_request": payment_request}
+            "/v1/channels/transaction-stream",
+            data={"payment_request": payment_request},
+            stream=True,
         )
         if response:
             res = json.loads(response)
@@ -527,3 +574,13 @@ class LND(LNNode):
     def graph(self):
         res = self.get("/v1/graph")
         return json.loads(res)
+
+    def channel_count(self) -> int:
+        res = self.get("/v1/graph/info")
+        return int(json.loads(res)["num_channels"])
+
+    def graph_edge(self, block: int, index: int, output: int) -> Optional[dict]:
+        res = json.loads(self.get(f"/v1/graph/edge/{(block << 40) | (index << 16) | output}"))
+        if "channel_id" not in res:
+            return None
+        return res
@@ -1,10 +1,152 @@
 #!/usr/bin/env python3
 
 import threading
-from time import sleep
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+from decimal import ROUND_DOWN, Decimal
+from time import monotonic, sleep
 
 from commander import Commander
-from ln_framework.ln import Policy
+from ln_framework.gossip import GossipTracker
+
+# Upper bound of threads talking to LN nodes at the same time
+MAX_WORKERS = 256
+# Requests in flight per LN node, each on its own connection from the node's client pool
+LN_NODE_CONCURRENCY = 4
+# Bounds of the adaptive delay between two requests to the same LN node
+MIN_BACKOFF = 0.1
+MAX_BACKOFF = 5.0
+# Funding UTXOs every LN node gets beyond what its channel opens need
+SPARE_UTXOS = 1
+# Outputs per funding transaction, far below the 100 kvB standard transaction limit
+FUNDING_OUTPUTS_PER_TX = 1000
+# Upper bound of a P2WPKH / P2TR output, and the share of a block funding may use
+FUNDING_OUTPUT_VSIZE = 43
+MAX_FUNDING_VSIZE = 900_000
+
+
+class NodeGate:
+    """
+    Bounds the requests in flight to one LN node and spaces them by an adaptive delay,
+    doubled whenever the node reports it is busy or not ready and halved on success
+    """
+
+    def __init__(self, concurrency: int = LN_NODE_CONCURRENCY):
+        self.semaphore = threading.BoundedSemaphore(concurrency)
+        self.lock = threading.Lock()
+        self.delay = 0.0
+        self.next_start = 0.0
+
+    def __enter__(self):
+        self.semaphore.acquire()
+        with self.lock:
+            now = monotonic()
+            start = max(now, self.next_start)
+            self.next_start = start + self.delay
+        sleep(start - now)
+        return self
+
+    def __exit__(self, *exc):
+        self.semaphore.release()
+
+    def backoff(self):
+        with self.lock:
+            self.delay = min(MAX_BACKOFF, max(MIN_BACKOFF, self.delay * 2))
+
+    def relax(self):
+        with self.lock:
+            self.delay = self.delay / 2 if self.delay > MIN_BACKOFF else 0.0
+
+
+class Pipeline:
+    """
+    Thread pool that starts every task as soon as the tasks it depends on have finished,
+    so independent steps of different phases overlap instead of waiting for each other
+    """
+
+    def __init__(self, max_workers: int):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        # Set when the bootstrap fails, so pollers give up instead of blocking exit
+        self.stopped = threading.Event()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is not None:
+            self.stopped.set()
+        self.executor.shutdown(wait=True, cancel_futures=exc_type is not None)
+
+    def submit(self, fn, *args, after=()) -> Future:
+        future = Future()
+        after = list(after)
+        remaining = [len(after)]
+        lock = threading.Lock()
+
+        def run():
+            try:
+                future.set_result(fn(*args))
+            except BaseException as e:
+                future.set_exception(e)
+
+        def dependency_done(_):
+            with lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            failed = next((dep.exception() for dep in after if dep.exception()), None)
+            if failed:
+                future.set_exception(failed)
+            else:
+                self.executor.submit(run)
+
+        if not after:
+            self.executor.submit(run)
+        for dep in after:
+            dep.add_done_callback(dependency_done)
+        return future
+
+    def poll_until(self, predicate, timeout=None, interval=0.5, max_interval=5.0) -> bool:
+        """Call predicate() until it is true, backing off from `interval` to `max_interval`"""
+        deadline = None if timeout is None else monotonic() + timeout
+        while not predicate():
+            if self.stopped.is_set():
+                raise Exception("LN bootstrap stopped")
+            if deadline is not None and monotonic() >= deadline:
+                return False
+            sleep(interval)
+            interval = min(max_interval, interval * 1.5)
+        return True
+
+
+def plan_funding(channels: list[dict], addresses: dict[str, str]) -> dict[str, int]:
+    """
+    UTXOs each funded LN node needs: one for every channel it opens in the same block,
+    plus spares. Before opening in a block, a node waits until its wallet has seen the
+    previous one, which confirmed the change of its earlier opens.
+    """
+    per_block = Counter((ch["source"], ch.get("id", {}).get("block")) for ch in channels)
+    need = {name: SPARE_UTXOS for name in addresses}
+    for (source, _), count in per_block.items():
+        if source in need:
+            need[source] = max(need[source], count + SPARE_UTXOS)
+    return need
+
+
+def funding_batches(
+    addresses: dict[str, str], need: dict[str, int], max_outputs: int = FUNDING_OUTPUTS_PER_TX
+) -> list[list[str]]:
+    """Split all funding outputs into transactions that pay each address at most once"""
+    batches = []
+    for i in range(max(need.values(), default=0)):
+        addrs = [addr for name, addr in addresses.items() if need[name] > i]
+        batches += [addrs[j : j + max_outputs] for j in range(0, len(addrs), max_outputs)]
+    return batches
+
+
+def results(futures) -> list:
+    """Wait for all futures, raising the first failure"""
+    return [future.result() for future in futures]
 
 
 class LNInit(Commander):
@@ -16,166 +158,162 @@ class LNInit(Commander):
         parser.usage = "warnet run /path/to/ln_init.py"
 
     def run_test(self):
-        ##
-        # L1 P2P
-        ##
-        self.log.info("Waiting for L1 p2p network connections...")
-        self.wait_for_tanks_connected()
-
-        ##
-        # MINER
-        ##
-        self.log.info("Setting up miner...")
-        miner = self.ensure_miner(self.nodes[0])
-        miner_addr = miner.getnewaddress()
-
-        def gen(n):
-            return self.generatetoaddress(self.nodes[0], n, miner_addr, sync_fun=self.no_op)
-
-        self.log.info("Locking out of IBD...")
-        gen(1)
+        self.gates = {name: NodeGate() for name in self.lns}
+        workers = min(MAX_WORKERS, max(16, 4 * len(self.lns)))
+        with Pipeline(workers) as pipeline:
+            self.bootstrap(pipeline)
 
+    def bootstrap(self, pipeline: Pipeline):
         ##
-        # WALLET ADDRESSES
+        # WALLET ADDRESSES AND URIS
         ##
-        self.log.info("Getting LN wallet addresses...")
-        ln_addrs = []
+        # Neither needs funds or the L1 network, so start both right away for every LN node
+        self.log.info("Getting LN wallet addresses and URIs...")
+        ln_addrs = {}
+        ln_uris = {}
 
         def get_ln_addr(self, ln):
-            success, address = ln.newaddress()
+            with self.gates[ln.name]:
+                success, address = ln.newaddress()
             if success:
-                ln_addrs.append(address)
+                ln_addrs[ln.name] = address
                 self.log.info(f"Got wallet address {address} from {ln.name}")
             else:
                 self.log.info(f"Couldn't get wallet address from {ln.name}")
 
-        addr_threads = [
-            threading.Thread(target=get_ln_addr, args=(self, ln)) for ln in self.lns.values()
-        ]
-        for thread in addr_threads:
-            thread.start()
-
-        all(thread.join() is None for thread in addr_threads)
-        self.log.info(f"Got {len(ln_addrs)} addresses from {len(self.lns)} LN nodes")
-
-        ##
-        # FUNDS
-        ##
-        self.log.info("Funding LN wallets...")
-        # 298 block base for miner wallet
-        gen(297)
-        # divvy up the goods, except fee.
-        # 10 UTXOs per node means 10 channel opens per node per block
-        split = (miner.getbalance() - 1) // len(ln_addrs) // 10
-        sends = {}
-        for _ in range(10):
-            for addr in ln_addrs:
-                sends[addr] = split
-            miner.sendmany("", sends)
-        # confirm funds in block 299
-        gen(1)
-
-        self.log.info(
-            f"Waiting for funds to be spendable: 10x{split} BTC UTXOs each for {len(ln_addrs)} LN nodes"
-        )
-
-        def confirm_ln_balance(self, ln):
-            bal = 0
-            while True:
-                bal = ln.walletbalance()
-                if bal >= (split * 100000000):
-                    self.log.info(f"LN node {ln.name} confirmed funds")
-                    break
-                sleep(1)
-
-        fund_threads = [
-            threading.Thread(target=confirm_ln_balance, args=(self, ln)) for ln in self.lns.values()
-        ]
-        for thread in fund_threads:
-            thread.start()
-
-        all(thread.join() is None for thread in fund_threads)
-        self.log.info("All LN nodes are funded")
-
-        ##
-        # URIs
-        ##
-        self.log.info("Getting URIs for all LN nodes...")
-        ln_uris = {}
-
         def get_ln_uri(self, ln):
-            uri = None
-            while True:
-                uri = ln.uri()
+            def has_uri():
+                with self.gates[ln.name]:
+                    uri = ln.uri()
                 if uri:
                     ln_uris[ln.name] = uri
-                    self.log.info(f"LN node {ln.name} has URI {uri}")
-                    break
-                sleep(1)
+                return bool(uri)
 
-        uri_threads = [
-            threading.Thread(target=get_ln_uri, args=(self, ln)) for ln in self.lns.values()
-        ]
-        for thread in uri_threads:
-            thread.start()
+            pipeline.poll_until(has_uri)
+            self.log.info(f"LN node {ln.name} has URI {ln_uris[ln.name]}")
 
-        all(thread.join() is None for thread in uri_threads)
-        self.log.info("Got URIs from all LN nodes")
+        addr_tasks = [pipeline.submit(get_ln_addr, self, ln) for ln in self.lns.values()]
+        uri_tasks = {ln.name: pipeline.submit(get_ln_uri, self, ln) for ln in self.lns.values()}
+
+        ##
+        # L1 P2P
+        ##
+        self.log.info("Waiting for L1 p2p network connections...")
+        self.wait_for_tanks_connected()
 
         ##
         # P2P CONNECTIONS
         ##
+        # Each connection starts as soon as both of its URIs are known,
+        # while the miner below is still funding the LN wallets
         self.log.info("Adding p2p connections to LN nodes...")
-        # (source: LND, target_uri: str) tuples of LND instances
-        connections = []
+        # (source: LND, target: LND) tuples of LND instances, keyed by the unordered pair
+        # of names to avoid duplicates and reciprocals
+        connections = {}
         # Cycle graph through all LN nodes
         nodes = list(self.lns.values())
         prev_node = nodes[-1]
         for node in nodes:
-            connections.append((node, prev_node))
+            connections.setdefault(frozenset((node.name, prev_node.name)), (node, prev_node))
             prev_node = node
         # Explicit connections between every pair of channel partners
         for ch in self.channels:
             src = self.lns[ch["source"]]
             tgt = self.lns[ch["target"]]
-            # Avoid duplicates and reciprocals
-            if (src, tgt) not in connections and (tgt, src) not in connections:
-                connections.append((src, tgt))
+            connections.setdefault(frozenset((src.name, tgt.name)), (src, tgt))
 
         def connect_ln(self, pair):
-            while True:
-                res = pair[0].connect(ln_uris[pair[1].name])
+            gate = self.gates[pair[0].name]
+            while not pipeline.stopped.is_set():
+                with gate:
+                    res = pair[0].connect(ln_uris[pair[1].name])
                 if res == {}:
+                    gate.relax()
                     self.log.info(f"Connected LN nodes {pair[0].name} -> {pair[1].name}")
-                    break
-                if "message" in res:
-                    if "already connected" in res["message"]:
-                        self.log.info(
-                            f"Already connected LN nodes {pair[0].name} -> {pair[1].name}"
-                        )
-                        break
-                    if "process of starting" in res["message"]:
-                        self.log.info(
-                            f"{pair[0].name} not ready for connections yet, wait and retry..."
-                        )
-                        sleep(1)
-                    else:
-                        self.log.error(
-                            f"Unexpected response attempting to connect {pair[0].name} -> {pair[1].name}:\n  {res}\n  ABORTING"
-                        )
-                        raise Exception(
-                            f"Unable to connect {pair[0].name} -> {pair[1].name}:\n  {res}"
-                        )
+                    return
+                if res is None or "process of starting" in res.get("message", ""):
+                    gate.backoff()
+                    self.log.info(
+                        f"{pair[0].name} not ready for connections yet, wait and retry..."
+                    )
+                    continue
+                if "already connected" in res.get("message", ""):
+                    gate.relax()
+                    self.log.info(f"Already connected LN nodes {pair[0].name} -> {pair[1].name}")
+                    return
+                self.log.error(
+                    f"Unexpected response attempting to connect {pair[0].name} -> {pair[1].name}:\n  {res}\n  ABORTING"
+                )
+                raise Exception(f"Unable to connect {pair[0].name} -> {pair[1].name}:\n  {res}")
+
+        connect_tasks = {
+            key: pipeline.submit(
+                connect_ln,
+                self,
+                (src, tgt),
+                after=[uri_tasks[src.name], uri_tasks[tgt.name]],
+            )
+            for key, (src, tgt) in connections.items()
+        }
+
+        ##
+        # MINER
+        ##
+        self.log.info("Setting up miner...")
+        miner = self.ensure_miner(self.nodes[0])
+        miner_addr = miner.getnewaddress()
 
-        p2p_threads = [
-            threading.Thread(target=connect_ln, args=(self, pair)) for pair in connections
-        ]
-        for thread in p2p_threads:
-            sleep(0.25)
-            thread.start()
+        def gen(n):
+            return self.generatetoaddress(self.nodes[0], n, miner_addr, sync_fun=self.no_op)
 
-        all(thread.join() is None for thread in p2p_threads)
-        self.log.info("Established all LN p2p connections")
+        self.log.info("Locking out of IBD...")
+        gen(1)
+        # 298 block base for miner wallet
+        gen(297)
+
+        ##
+        # FUNDS
+        ##
+        results(addr_tasks)
+        self.log.info(f"Got {len(ln_addrs)} addresses from {len(self.lns)} LN nodes")
+        self.log.info("Funding LN wallets...")
+        utxos = plan_funding(self.channels, ln_addrs)
+        batches = funding_batches(ln_addrs, utxos)
+        outputs = sum(len(batch) for batch in batches)
+        if outputs * FUNDING_OUTPUT_VSIZE > MAX_FUNDING_VSIZE:
+            raise Exception(f"{outputs} funding outputs do not fit in one block")
+        # divvy up the goods, except fee
+        amount = ((miner.getbalance() - 1) / outputs).quantize(
+            Decimal("0.00000001"), rounding=ROUND_DOWN
+        )
+        amount_sats = int(amount * 100000000)
+        largest = max((ch["capacity"] for ch in self.channels), default=0)
+        assert amount_sats > largest, f"Funding UTXOs of {amount} BTC too small for {largest} sats"
+
+        # One sendmany per batch, one after another: they share the miner wallet's connection
+        txids = [miner.sendmany("", {addr: amount for addr in batch}) for batch in batches]
+        # confirm funds in block 299
+        block = self.nodes[0].getblock(gen(1)[0])
+        missing = set(txids) - set(block["tx"])
+        assert not missing, f"Funding transactions not confirmed: {missing}"
+        self.log.info(
+            f"Confirmed {len(txids)} funding transactions in block {block['height']}: "
+            f"{outputs} UTXOs of {amount} BTC for {len(ln_addrs)} LN nodes"
+        )
+
+        # Only channel openers wait for their wallet to see the block, right before opening
+        def confirm_ln_balance(self, ln):
+            def funded():
+                with self.gates[ln.name]:
+                    return ln.walletbalance() >= utxos[ln.name] * amount_sats
+
+            pipeline.poll_until(funded)
+            self.log.info(f"LN node {ln.name} confirmed funds")
+
+        fund_tasks = {
+            name: pipeline.submit(confirm_ln_balance, self, self.lns[name])
+            for name in {ch["source"] for ch in self.channels}
+        }
 
         ##
         # CHANNELS
@@ -195,6 +333,45 @@ class LNInit(Commander):
         blocks = list(ch_by_block.keys())
         blocks = sorted(blocks)
 
+        def open_channel(self, ch, fee_rate):
+            src = self.lns[ch["source"]]
+            tgt_uri = ln_uris[ch["target"]]
+            tgt_pk, _ = tgt_uri.split("@")
+            self.log.info(
+                f"Sending channel open from {ch['source']} -> {ch['target']} with fee_rate={fee_rate}"
+            )
+            with self.gates[src.name] as gate:
+                res = src.channel(
+                    pk=tgt_pk,
+                    capacity=ch["capacity"],
+                    push_amt=ch["push_amt"],
+                    fee_rate=fee_rate,
+                )
+            if res and "txid" in res:
+                gate.relax()
+                ch["txid"] = res["txid"]
+                ch["output"] = int(res["outpoint"].split(":")[1])
+                self.log.info(
+                    f"Channel open {ch['source']} -> {ch['target']}\n  "
+                    + f"outpoint={res['outpoint']}\n  "
+                    + f"expected channel id: {ch['id']}"
+                )
+            else:
+                gate.backoff()
+                ch["txid"] = "N/A"
+                self.log.info(
+                    "Unexpected channel open response:\n  "
+                    + f"From {ch['source']} -> {ch['target']} fee_rate={fee_rate}\n  "
+                    + f"{res}"
+                )
+
+        def wait_for_tip(self, ln, height):
+            def synced():
+                with self.gates[ln.name]:
+                    return (ln.synced_height() or 0) >= height
+
+            pipeline.poll_until(synced)
+
         for target_block in blocks:
             # First make sure the target block is the next block
             current_height = self.nodes[0].getblockcount()
@@ -204,49 +381,43 @@ class LNInit(Commander):
             if need > 1:
                 gen(need - 1)
 
-            def open_channel(self, ch, fee_rate):
-                src = self.lns[ch["source"]]
-                tgt_uri = ln_uris[ch["target"]]
-                tgt_pk, _ = tgt_uri.split("@")
-                self.log.info(
-                    f"Sending channel open from {ch['source']} -> {ch['target']} with fee_rate={fee_rate}"
+            # LN wallets only fund from confirmed coins they have seen: the change of opens
+            # in earlier blocks is spendable once the opener's wallet reached the last block
+            tip_tasks = {
+                source: pipeline.submit(
+                    wait_for_tip,
+                    self,
+                    self.lns[source],
+                    target_block - 1,
+                    after=[fund_tasks[source]],
                 )
-                res = src.channel(
-                    pk=tgt_pk,
-                    capacity=ch["capacity"],
-                    push_amt=ch["push_amt"],
-                    fee_rate=fee_rate,
-                )
-                if res and "txid" in res:
-                    ch["txid"] = res["txid"]
-                    self.log.info(
-                        f"Channel open {ch['source']} -> {ch['target']}\n  "
-                        + f"outpoint={res['outpoint']}\n  "
-                        + f"expected channel id: {ch['id']}"
-                    )
-                else:
-                    ch["txid"] = "N/A"
-                    self.log.info(
-                        "Unexpected channel open response:\n  "
-                        + f"From {ch['source']} -> {ch['target']} fee_rate={fee_rate}\n  "
-                        + f"{res}"
-                    )
+                for source in {ch["source"] for ch in ch_by_block[target_block]}
+            }
 
             channels = sorted(ch_by_block[target_block], key=lambda ch: ch["id"]["index"])
             index = 0
             fee_rate = 5006  # s/vB, decreases by 5 per tx for up to 1000 txs per block
-            ch_threads = []
+            ch_tasks = []
             for ch in channels:
                 index += 1  # noqa
                 fee_rate -= 5
                 assert index == ch["id"]["index"], "Channel ID indexes are not consecutive"
                 assert fee_rate >= 1, "Too many TXs in block, out of fee range"
-                t = threading.Thread(target=open_channel, args=(self, ch, fee_rate))
-                sleep(0.25)
-                t.start()
-                ch_threads.append(t)
+                # Open as soon as the source is funded and the partners are connected
+                ch_tasks.append(
+                    pipeline.submit(
+                        open_channel,
+                        self,
+                        ch,
+                        fee_rate,
+                        after=[
+                            tip_tasks[ch["source"]],
+                            connect_tasks[frozenset((ch["source"], ch["target"]))],
+                        ],
+                    )
+                )
 
-            all(thread.join() is None for thread in ch_threads)
+            results(ch_tasks)
             self.log.info(f"Waiting for {len(channels)} channel opens in mempool...")
             self.wait_until(
                 lambda channels=channels: self.nodes[0].getmempoolinfo()["size"] >= len(channels),
@@ -266,143 +437,85 @@ class LNInit(Commander):
                 )
             self.log.info("👍")
 
+        results(connect_tasks.values())
+        self.log.info("Established all LN p2p connections")
+
         gen(5)
         self.log.info(f"Confirmed {len(self.channels)} total channel opens")
 
+        ##
+        # CHANNEL ANNOUNCEMENTS AND POLICIES
+        ##
+        # Each LN node sends its policy updates as soon as its own graph is complete
         self.log.info("Waiting for channel announcement gossip...")
+        tracker = GossipTracker(self.channels, list(self.lns), self.log)
+        tracker.start("Channel announcements")
 
         def ln_all_chs(self, ln):
+            def complete():
+                with self.gates[ln.name]:
+                    return tracker.has_all_channels(ln)
+
             expected = len(self.channels)
-            attempts = 0
-            actual = 0
-            while actual != expected:
-                actual = len(ln.graph()["edges"])
-                if attempts > 10:
-                    break
-                attempts += 1
-                sleep(5)
-            if actual == expected:
+            if pipeline.poll_until(complete, timeout=60):
                 self.log.info(f"LN {ln.name} has graph with all {expected} channels")
             else:
                 self.log.error(
-                    f"LN {ln.name} graph is INCOMPLETE - {actual} of {expected} channels"
+                    f"LN {ln.name} graph is INCOMPLETE - {tracker.seen[ln.name]} of {expected} channels"
                 )
 
-        ch_ann_threads = [
-            threading.Thread(target=ln_all_chs, args=(self, ln)) for ln in self.lns.values()
-        ]
-        for thread in ch_ann_threads:
-            sleep(0.25)
-            thread.start()
-
-        all(thread.join() is None for thread in ch_ann_threads)
-        self.log.info("All LN nodes have complete graph")
+        graph_tasks = {ln.name: pipeline.submit(ln_all_chs, self, ln) for ln in self.lns.values()}
 
-        ##
-        # UPDATE CHANNEL POLICIES
-        ##
         self.log.info("Updating channel policies...")
 
         def update_policy(self, ln, txid_hex, policy, capacity):
             self.log.info(f"Sending update from {ln.name} for channel with outpoint: {txid_hex}:0")
-            res = ln.update(txid_hex, policy, capacity)
+            with self.gates[ln.name]:
+                res = ln.update(txid_hex, policy, capacity)
+            # CLN does not support policy updates yet, any other missing response is a failure
+            if res is None and ln.impl == "cln":
+                return
+            assert res is not None, f"No response to policy update from {ln.name} for {txid_hex}"
             assert len(res["failed_updates"]) == 0, (
                 f" Failed updates: {res['failed_updates']}\n txid: {txid_hex}\n policy:{policy}"
             )
 
-        update_threads = []
+        update_tasks = []
         for ch in self.channels:
-            if "source_policy" in ch:
-                ts = threading.Thread(
-                    target=update_policy,
-                    args=(
-                        self,
-                        self.lns[ch["source"]],
-                        ch["txid"],
-                        ch["source_policy"],
-                        ch["capacity"],
-                    ),
-                )
-                sleep(0.25)
-                ts.start()
-                update_threads.append(ts)
-            if "target_policy" in ch:
-                tt = threading.Thread(
-                    target=update_policy,
-                    args=(
-                        self,
-                        self.lns[ch["target"]],
-                        ch["txid"],
-                        ch["target_policy"],
-                        ch["capacity"],
-                    ),
-                )
-                sleep(0.25)
-                tt.start()
-                update_threads.append(tt)
-        count = len(update_threads)
+            for side, policy in (("source", "source_policy"), ("target", "target_policy")):
+                if policy in ch:
+                    update_tasks.append(
+                        pipeline.submit(
+                            update_policy,
+                            self,
+                            self.lns[ch[side]],
+                            ch["txid"],
+                            ch[policy],
+                            ch["capacity"],
+                            after=[graph_tasks[ch[side]]],
+                        )
+                    )
+        count = len(update_tasks)
 
-        all(thread.join() is None for thread in update_threads)
+        results(graph_tasks.values())
+        self.log.info(tracker.summary())
+        self.log.info("All LN nodes have complete graph")
+        results(update_tasks)
         self.log.info(f"Sent {count} channel policy updates")
 
         self.log.info("Waiting for all channel policy gossip to synchronize...")
+        tracker.start("Channel policies")
 
-        def policy_equal(pol1, pol2, capacity):
-            return pol1.to_lnd_chanpolicy(capacity) == pol2.to_lnd_chanpolicy(capacity)
-
-        def matching_graph(self, expected, ln):
-            done = False
-            while not done:
-                actual = ln.graph()["edges"]
-                self.log.debug(f"LN {ln.name} channel graph edges: {actual}")
-                if len(actual) > 0:
-                    done = True
-                    assert len(expected) == len(actual), (
-                        f"Expected edges {len(expected)}, actual edges {len(actual)}\n{actual}"
-                    )
-                for i, actual_ch in enumerate(actual):
-                    expected_ch = expected[i]
-                    capacity = expected_ch["capacity"]
-                    # We assert this because it isn't updated as part of policy.
-                    # If this fails we have a bigger issue
-                    assert int(actual_ch["capacity"]) == capacity, (
-                        f"LN {ln.name} graph capacity mismatch:\n actual: {actual_ch['capacity']}\n expected: {capacity}"
-                    )
+        def matching_graph(self, ln):
+            def matches():
+                with self.gates[ln.name]:
+                    return tracker.policies_match(ln)
+
+            pipeline.poll_until(matches)
+            self.log.info(f"LN {ln.name} graph channel policies all match expected source")
 
-                    # Policies were not defined in network.yaml
-                    if "source_policy" not in expected_ch or "target_policy" not in expected_ch:
-                        continue
-
-                    # policy actual/expected source/target
-                    polas = Policy.from_lnd_describegraph(actual_ch["node1_policy"])
-                    polat = Policy.from_lnd_describegraph(actual_ch["node2_policy"])
-                    poles = Policy(**expected_ch["source_policy"])
-                    polet = Policy(**expected_ch["target_policy"])
-                    # Allow policy swap when comparing channels
-                    if policy_equal(polas, poles, capacity) and policy_equal(
-                        polat, polet, capacity
-                    ):
-                        continue
-                    if policy_equal(polas, polet, capacity) and policy_equal(
-                        polat, poles, capacity
-                    ):
-                        continue
-                    done = False
-                if done:
-                    self.log.info(f"LN {ln.name} graph channel policies all match expected source")
-                else:
-                    sleep(5)
-
-        expected = sorted(self.channels, key=lambda ch: (ch["id"]["block"], ch["id"]["index"]))
-        policy_threads = [
-            threading.Thread(target=matching_graph, args=(self, expected, ln))
-            for ln in self.lns.values()
-        ]
-        for thread in policy_threads:
-            sleep(0.25)
-            thread.start()
-
-        all(thread.join() is None for thread in policy_threads)
+        results([pipeline.submit(matching_graph, self, ln) for ln in self.lns.values()])
+        self.log.info(tracker.summary())
         self.log.info("All LN nodes have matching graph!")
 
 
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+
+import asyncio
+import math
+import os
+import random
+from collections import Counter
+from time import monotonic
+
+from commander import Commander, percentile
+from ln_framework.async_ln import Payment, async_nodes
+
+PERCENTILES = (50, 95, 99)
+AMOUNT_DISTRIBUTIONS = ("fixed", "uniform", "exponential", "lognormal")
+# Seconds to wait for payments still in flight once the run is over
+DRAIN_TIMEOUT = 120
+
+
+class Window:
+    """Outcomes of the payments finished during one reporting interval, or the whole run"""
+
+    def __init__(self):
+        self.started = monotonic()
+        self.payments = 0
+        self.dropped = 0
+        # Latency in seconds of successful payments
+        self.latencies: list[float] = []
+        self.hops: Counter = Counter()
+        self.errors: Counter = Counter()
+        self.fee_msat = 0
+
+    def record(self, latency: float, payment: Payment):
+        self.payments += 1
+        if payment.ok:
+            self.latencies.append(latency)
+            if payment.hops is not None:
+                self.hops[payment.hops] += 1
+            self.fee_msat += payment.fee_msat or 0
+        else:
+            self.errors[payment.error or "no response"] += 1
+
+    def summary(self) -> dict:
+        elapsed = monotonic() - self.started
+        latencies = sorted(self.latencies)
+        routed = sum(self.hops.values())
+        summary = {
+            "payments": self.payments,
+            "succeeded": len(latencies),
+            "dropped": self.dropped,
+            "success_rate": round(len(latencies) / self.payments, 4) if self.payments else None,
+            "payments_per_second": round(self.payments / elapsed, 2) if elapsed else None,
+            "mean_hops": (
+                round(sum(k * v for k, v in self.hops.items()) / routed, 2) if routed else None
+            ),
+            "fee_msat": self.fee_msat,
+            "errors": dict(self.errors.most_common()),
+        }
+        for pct in PERCENTILES:
+            summary[f"p{pct}"] = round(percentile(latencies, pct), 4) if latencies else None
+        return summary
+
+    def report(self) -> str:
+        s = self.summary()
+        if not s["payments"]:
+            return f"no payments finished, {s['dropped']} dropped"
+        latency = ", ".join(
+            f"p{pct} {s[f'p{pct}']:.3f}s" if s[f"p{pct}"] is not None else f"p{pct} -"
+            for pct in PERCENTILES
+        )
+        errors = ", ".join(f"{error}: {count}" for error, count in list(s["errors"].items())[:5])
+        return (
+            f"{s['payments']} payments ({s['payments_per_second']}/s), "
+            f"{100 * s['success_rate']:.1f}% succeeded, latency {latency}, "
+            f"mean hops {s['mean_hops']}, {s['dropped']} dropped"
+            + (f", errors: {errors}" if errors else "")
+        )
+
+
+class LNPayments(Commander):
+    def set_test_params(self):
+        self.num_nodes = None
+
+    def add_options(self, parser):
+        parser.description = (
+            "Generate open-loop Lightning payment traffic and report throughput, "
+            "success rate and latency percentiles"
+        )
+        parser.usage = "warnet run /path/to/ln_payments.py [options]"
+        parser.add_argument(
+            "--rate",
+            dest="rate",
+            default=10.0,
+            type=float,
+            help="Payments per second started across the network (default 10)",
+        )
+        parser.add_argument(
+            "--arrivals",
+            dest="arrivals",
+            default="poisson",
+            choices=["poisson", "constant"],
+            help="Exponential (poisson) or fixed gaps between payments (default poisson)",
+        )
+        parser.add_argument(
+            "--duration",
+            dest="duration",
+            default=300,
+            type=float,
+            help="Seconds to generate payments for, 0 runs forever (default 300)",
+        )
+        parser.add_argument(
+            "--amount",
+            dest="amount",
+            default=1000,
+            type=int,
+            help="Payment amount in sats, the median for random distributions (default 1000)",
+        )
+        parser.add_argument(
+            "--amount-dist",
+            dest="amount_dist",
+            default="fixed",
+            choices=AMOUNT_DISTRIBUTIONS,
+            help="Distribution of payment amounts (default fixed)",
+        )
+        parser.add_argument(
+            "--alpha",
+            dest="alpha",
+            default=0.0,
+            type=float,
+            help="Power-law exponent of sender and receiver popularity, 0 picks uniformly "
+            "(default 0)",
+        )
+        parser.add_argument(
+            "--max-in-flight",
+            dest="max_in_flight",
+            default=10000,
+            type=int,
+            help="Payments in flight beyond which new ones are dropped (default 10000)",
+        )
+        parser.add_argument(
+            "--node-concurrency",
+            dest="node_concurrency",
+            default=16,
+            type=int,
+            help="Requests in flight per LN node (default 16)",
+        )
+        parser.add_argument(
+            "--report-interval",
+            dest="report_interval",
+            default=10.0,
+            type=float,
+            help="Seconds between progress reports (default 10)",
+        )
+        parser.add_argument(
+            "--seed",
+            dest="seed",
+            default=None,
+            type=int,
+            help="Seed for payment times, amounts and node selection",
+        )
+
+    def run_test(self):
+        assert len(self.lns) >= 2, "Payments need at least two LN nodes"
+        self.rng = random.Random(self.options.seed)
+        asyncio.run(self.generate())
+
+    def popularity(self) -> list[float]:
+        # Zipf weights over a random ranking of the nodes
+        ranks = list(range(1, len(self.lns) + 1))
+        self.rng.shuffle(ranks)
+        return [rank**-self.options.alpha for rank in ranks]
+
+    def amount(self) -> int:
+        amount = self.options.amount
+        dist = self.options.amount_dist
+        if dist == "uniform":
+            amount = self.rng.uniform(1, 2 * amount)
+        elif dist == "exponential":
+            amount = self.rng.expovariate(math.log(2) / amount)
+        elif dist == "lognormal":
+            amount = self.rng.lognormvariate(math.log(amount), 1)
+        return max(1, int(amount))
+
+    def gap(self) -> float:
+        if self.options.arrivals == "poisson":
+            return self.rng.expovariate(self.options.rate)
+        return 1 / self.options.rate
+
+    async def payment(self, sender, receiver, amount: int, label: str):
+        start = monotonic()
+        try:
+            invoice = await receiver.createinvoice(amount, label)
+            start = monotonic()
+            if invoice is None:
+                payment = Payment(ok=False, error="invoice")
+            else:
+                payment = await sender.pay(invoice)
+        except Exception as e:
+            payment = Payment(ok=False, error=type(e).__name__, message=str(e))
+        latency = monotonic() - start
+        self.log.debug(f"{sender.name} -> {receiver.name} {amount} sats: {payment}")
+        self.window.record(latency, payment)
+        self.total.record(latency, payment)
+
+    async def reporter(self):
+        while True:
+            await asyncio.sleep(self.options.report_interval)
+            window, self.window = self.window, Window()
+            self.log.info(f"Last {self.options.report_interval:.0f}s: {window.report()}")
+
+    async def generate(self):
+        nodes = list(async_nodes(self.lns, self.options.node_concurrency).values())
+        senders = self.popularity()
+        receivers = self.popularity()
+        run_id = os.urandom(4).hex()
+        self.window = Window()
+        self.total = Window()
+        self.log.info(
+            f"Sending {self.options.rate} payments/s ({self.options.arrivals}) between "
+            f"{len(nodes)} LN nodes, {self.options.amount_dist} amounts of "
+            f"{self.options.amount} sats, alpha={self.options.alpha}"
+        )
+        reporter = asyncio.create_task(self.reporter())
+        in_flight: set[asyncio.Task] = set()
+        start = monotonic()
+        due = start
+        seq = 0
+        try:
+            while not self.options.duration or due - start < self.options.duration:
+                # Open loop: payments start on schedule however long earlier ones take
+                await asyncio.sleep(max(0.0, due - monotonic()))
+                due += self.gap()
+                if len(in_flight) >= self.options.max_in_flight:
+                    self.window.dropped += 1
+                    self.total.dropped += 1
+                    continue
+                sender = self.rng.choices(nodes, senders)[0]
+                receiver = sender
+                while receiver is sender:
+                    receiver = self.rng.choices(nodes, receivers)[0]
+                seq += 1
+                task = asyncio.create_task(
+                    self.payment(sender, receiver, self.amount(), f"ln-payments-{run_id}-{seq}")
+                )
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+            if in_flight:
+                self.log.info(f"Waiting for {len(in_flight)} payments in flight...")
+                await asyncio.wait(in_flight, timeout=DRAIN_TIMEOUT)
+        finally:
+            reporter.cancel()
+            for node in nodes:
+                node.close()
+        self.log.info(f"Total: {self.total.report()}")
+        self.log_result(self.total.summary())
+
+
+def main():
+    LNPayments().main()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,6 @@
 #!/usr/bin/env python3
 
-from time import sleep
-
-from commander import Commander
+from commander import Commander, LoadScheduler, RateProfile
 
 
 class Miner:
@@ -57,21 +55,32 @@ class MinerStd(Commander):
             for index in range(max_miners):
                 self.miners.append(Miner(self.nodes[index], self.options.mature))
 
-        while True:
-            for miner in self.miners:
-                num = 1
-                if miner.mature:
-                    num = 101
-                    miner.mature = False
-                try:
-                    self.generatetoaddress(miner.node, num, miner.addr, sync_fun=self.no_op)
-                    height = miner.node.getblockcount()
-                    self.log.info(
-                        f"generated {num} block(s) from node {miner.node.index}. New chain height: {height}"
-                    )
-                except Exception as e:
-                    self.log.error(f"node {miner.node.index} error: {e}")
-                sleep(self.options.interval)
+        # Miners take turns, one block every interval however long generating takes
+        rate = 1 / max(self.options.interval, 0.1)
+        scheduler = LoadScheduler(
+            self.mine,
+            RateProfile(f"{rate:g}"),
+            self.log,
+            workers=1,
+            max_backlog=1,
+            report_interval=max(60, 10 * self.options.interval),
+        )
+        scheduler.run()
+
+    def mine(self, seq):
+        miner = self.miners[seq % len(self.miners)]
+        num = 1
+        if miner.mature:
+            num = 101
+            miner.mature = False
+        try:
+            self.generatetoaddress(miner.node, num, miner.addr, sync_fun=self.no_op)
+            height = miner.node.getblockcount()
+            self.log.info(
+                f"generated {num} block(s) from node {miner.node.index}. New chain height: {height}"
+            )
+        except Exception as e:
+            self.log.error(f"node {miner.node.index} error: {e}")
 
 
 def main():
@@ -45,15 +45,7 @@ class ConnectDag(Commander):
         #       │      ∧                        │      ∧
         #  B ───┴──────╯                   1 ───┴──────╯
 
-        self.connect_nodes(0, 2)
-        self.connect_nodes(1, 2)
-        self.connect_nodes(1, 3)
-        self.connect_nodes(2, 3)
-        self.connect_nodes(2, 4)
-        self.connect_nodes(3, 5)
-        self.connect_nodes(5, 4)
-        self.connect_nodes(5, 6)
-        self.connect_nodes(6, 7)
+        self.connect_edges([(0, 2), (1, 2), (1, 3), (2, 3), (2, 4), (3, 5), (5, 4), (5, 6), (6, 7)])
         self.sync_all()
 
         zero_peers = self.tanks["tank-0000"].getpeerinfo()
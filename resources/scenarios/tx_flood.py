@@ -1,17 +1,39 @@
 #!/usr/bin/env python3
 
-import threading
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from decimal import Decimal
 from random import choice, randrange
-from time import sleep
+from threading import Lock
+from time import monotonic, sleep
 
-from commander import Commander
+from commander import ActionDropped, Commander, LoadScheduler, RateProfile
+from test_framework.messages import COIN
+from test_framework.wallet import MiniWallet
+
+# Unconfirmed transactions chained on one UTXO, below the default ancestor limit of 25
+CHAIN_LIMIT = 24
+# UTXOs worth less are not used as flood chains
+MIN_LEAF_VALUE = Decimal("0.001")
+# vsize of a MiniWallet self-transfer
+SELF_TRANSFER_VSIZE = 104
+
+
+@dataclass
+class Leaf:
+    """A chain of MiniWallet self-transfers, always submitted to the same node"""
+
+    utxo: dict
+    node: int
+    # Unconfirmed transactions on top of the last confirmed UTXO of the chain
+    depth: int = 0
 
 
 class TXFlood(Commander):
     def set_test_params(self):
         self.num_nodes = 1
         self.addrs = []
-        self.threads = []
 
     def add_options(self, parser):
         parser.description = (
@@ -23,48 +45,240 @@ class TXFlood(Commander):
             dest="interval",
             default=10,
             type=int,
-            help="Number of seconds between TX generation (default 10 seconds)",
+            help="Number of seconds between TX generation, or between rate reports in "
+            "miniwallet mode (default 10 seconds)",
+        )
+        parser.add_argument(
+            "--mode",
+            dest="mode",
+            default="wallet",
+            choices=["wallet", "miniwallet"],
+            help="wallet: sendmany from every node's wallet every --interval seconds. "
+            "miniwallet: sign transactions locally and submit them in batches at --tps "
+            "(mines its coins on regtest, default wallet)",
+        )
+        parser.add_argument(
+            "--tps",
+            dest="tps",
+            default=100.0,
+            type=float,
+            help="miniwallet: target transactions per second across all nodes (default 100)",
+        )
+        parser.add_argument(
+            "--duration",
+            dest="duration",
+            default=0,
+            type=float,
+            help="miniwallet: seconds to flood for, 0 runs forever (default 0)",
+        )
+        parser.add_argument(
+            "--utxos",
+            dest="utxos",
+            default=2000,
+            type=int,
+            help="miniwallet: confirmed UTXOs to chain transactions on, each carries "
+            f"{CHAIN_LIMIT} transactions per block (default 2000)",
+        )
+        parser.add_argument(
+            "--fanout",
+            dest="fanout",
+            default=500,
+            type=int,
+            help="miniwallet: outputs per transaction splitting coins into UTXOs (default 500)",
+        )
+        parser.add_argument(
+            "--batch",
+            dest="batch",
+            default=100,
+            type=int,
+            help="miniwallet: transactions per JSON-RPC batch (default 100)",
+        )
+        parser.add_argument(
+            "--fee-rate",
+            dest="fee_rate",
+            default=2,
+            type=int,
+            help="miniwallet: fee rate in sat/vB (default 2)",
+        )
+        parser.add_argument(
+            "--mine",
+            dest="mine",
+            action="store_true",
+            help="miniwallet: mine a block when all UTXO chains are full instead of waiting "
+            "for the next block",
         )
 
     def orders(self, node):
         wallet = self.ensure_miner(node)
         for address_type in ["legacy", "p2sh-segwit", "bech32", "bech32m"]:
             self.addrs.append(wallet.getnewaddress(address_type=address_type))
-        while True:
-            sleep(self.options.interval)
-            try:
-                bal = wallet.getbalance()
-                if bal < 1:
-                    continue
-                amounts = {}
-                num_out = randrange(1, (len(self.nodes) // 2) + 1)
-                for _ in range(num_out):
-                    sats = int(float((bal / 20) / num_out) * 1e8)
-                    amounts[choice(self.addrs)] = randrange(sats // 4, sats) / 1e8
-                wallet.sendmany(dummy="", amounts=amounts)
-                self.log.info(f"node {node.index} sent tx with {num_out} outputs")
-            except Exception as e:
-                self.log.error(f"node {node.index} error: {e}")
+        return wallet
+
+    def send(self, seq):
+        node = self.nodes[seq % len(self.nodes)]
+        # The wallet calls of one node share its RPC connection, one send at a time.
+        # A node still busy with its last send skips its turn, counted as dropped,
+        # rather than tying up a worker the other nodes need.
+        lock = self.send_locks[node.index]
+        if not lock.acquire(blocking=False):
+            raise ActionDropped(f"node {node.index} is still sending")
+        try:
+            self.send_from(node)
+        finally:
+            lock.release()
+
+    def send_from(self, node):
+        try:
+            wallet = self.wallets[node.index]
+            bal = wallet.getbalance()
+            if bal < 1:
+                return
+            amounts = {}
+            num_out = randrange(1, (len(self.nodes) // 2) + 1)
+            for _ in range(num_out):
+                sats = int(float((bal / 20) / num_out) * 1e8)
+                amounts[choice(self.addrs)] = randrange(sats // 4, sats) / 1e8
+            wallet.sendmany(dummy="", amounts=amounts)
+            self.log.info(f"node {node.index} sent tx with {num_out} outputs")
+        except Exception as e:
+            self.log.error(f"node {node.index} error: {e}")
 
     def run_test(self):
-        self.log.info(f"Starting TX mess with {len(self.nodes)} threads")
-        for node in self.nodes:
-            sleep(1)  # stagger
-            t = threading.Thread(target=lambda n=node: self.orders(n))
-            t.daemon = False
-            t.start()
-            self.threads.append({"thread": t, "node": node})
-
-        while len(self.threads) > 0:
-            for thread in self.threads:
-                if not thread["thread"].is_alive():
-                    self.log.info(f"restarting thread for node {thread['node'].index}")
-                    thread["thread"] = threading.Thread(
-                        target=lambda n=thread["node"]: self.orders(n)
+        if self.options.mode == "miniwallet":
+            self.flood()
+            return
+        self.log.info(f"Starting TX mess from {len(self.nodes)} nodes")
+        self.wallets = {node.index: self.orders(node) for node in self.nodes}
+        self.send_locks = {node.index: Lock() for node in self.nodes}
+        # Every node sends one transaction per interval, nodes take turns
+        scheduler = LoadScheduler(
+            self.send,
+            RateProfile(f"{len(self.nodes) / max(self.options.interval, 0.1):g}"),
+            self.log,
+            workers=len(self.nodes),
+            max_backlog=len(self.nodes),
+            report_interval=max(60, 10 * self.options.interval),
+        )
+        scheduler.run()
+
+    def refresh_leaves(self, full: list[Leaf]) -> tuple[list[Leaf], list[Leaf]]:
+        """Splits full chains into those confirmed since and those still unconfirmed"""
+        ready, waiting = [], []
+        for index, node in enumerate(self.nodes):
+            leaves = [leaf for leaf in full if leaf.node == index]
+            if not leaves:
+                continue
+            requests = [
+                node.gettxout.get_request(leaf.utxo["txid"], leaf.utxo["vout"], True)
+                for leaf in leaves
+            ]
+            for leaf, response in zip(leaves, node.batch(requests)):
+                out = response.get("result")
+                if out is None:
+                    # Evicted, replaced or spent elsewhere, the chain is lost
+                    continue
+                if out["confirmations"] > 0:
+                    leaf.depth = 0
+                    ready.append(leaf)
+                else:
+                    waiting.append(leaf)
+        return ready, waiting
+
+    def submit(self, index: int, txs: list[tuple[Leaf, dict]]) -> list[tuple[Leaf, dict, dict]]:
+        node = self.nodes[index]
+        results = []
+        for start in range(0, len(txs), self.options.batch):
+            chunk = txs[start : start + self.options.batch]
+            requests = [node.sendrawtransaction.get_request(tx["hex"], 0) for _, tx in chunk]
+            results += [(leaf, tx, res) for (leaf, tx), res in zip(chunk, node.batch(requests))]
+        return results
+
+    def flood(self):
+        node = self.nodes[0]
+        wallet = MiniWallet(node)
+        fee_rate = Decimal(self.options.fee_rate) / 100_000
+        min_value = Decimal(self.options.fee_rate * SELF_TRANSFER_VSIZE + 1000) / COIN
+        utxos = self.miniwallet_utxos(
+            node, wallet, self.options.utxos, self.options.fanout, MIN_LEAF_VALUE
+        )
+        ready = deque(Leaf(utxo, i % len(self.nodes)) for i, utxo in enumerate(utxos))
+        full: list[Leaf] = []
+        self.log.info(
+            f"Flooding {self.options.tps} tx/s over {len(ready)} UTXOs and {len(self.nodes)} nodes"
+        )
+        errors = Counter()
+        sent = failed = window_sent = 0
+        # Transactions due so far, and those of them dropped after falling behind schedule
+        scheduled = dropped = window_dropped = 0
+        burst = max(1, int(self.options.tps))
+        start = last_report = monotonic()
+        tip = node.getbestblockhash()
+        with ThreadPoolExecutor(max_workers=len(self.nodes)) as executor:
+            while not self.options.duration or monotonic() - start < self.options.duration:
+                round_start = monotonic()
+                if full and (best := node.getbestblockhash()) != tip:
+                    tip = best
+                    confirmed, full = self.refresh_leaves(full)
+                    ready.extend(confirmed)
+                if not ready:
+                    if not full:
+                        self.log.error("No UTXO chains left to flood with")
+                        break
+                    if self.options.mine:
+                        self.generatetodescriptor(
+                            node, 1, wallet.get_descriptor(), sync_fun=self.no_op
+                        )
+                    else:
+                        self.log.info("All UTXO chains are full, waiting for the next block...")
+                        node.waitfornewblock(30_000)
+                    continue
+                # Open loop: catch up on the schedule, but never with more than 1s of backlog.
+                # Like LoadScheduler's tokens, transactions missed beyond that are dropped.
+                behind = int(self.options.tps * (round_start - start)) - scheduled
+                if behind > burst:
+                    dropped += behind - burst
+                    window_dropped += behind - burst
+                    scheduled += behind - burst
+                    behind = burst
+                by_node: dict[int, list] = {}
+                while behind > 0 and ready:
+                    leaf = ready.popleft()
+                    if leaf.utxo["value"] < min_value:
+                        continue
+                    tx = wallet.create_self_transfer(utxo_to_spend=leaf.utxo, fee_rate=fee_rate)
+                    by_node.setdefault(leaf.node, []).append((leaf, tx))
+                    scheduled += 1
+                    behind -= 1
+                for results in executor.map(lambda item: self.submit(*item), by_node.items()):
+                    for leaf, tx, res in results:
+                        if res.get("error"):
+                            failed += 1
+                            errors[res["error"]["message"]] += 1
+                            full.append(leaf)
+                            continue
+                        sent += 1
+                        window_sent += 1
+                        leaf.utxo = tx["new_utxo"]
+                        leaf.depth += 1
+                        (full if leaf.depth >= CHAIN_LIMIT else ready).append(leaf)
+                now = monotonic()
+                if now - last_report >= self.options.interval:
+                    self.log.info(
+                        f"{window_sent / (now - last_report):.1f} tx/s of {self.options.tps} "
+                        f"target, {sent} sent, {failed} failed, {window_dropped} dropped behind "
+                        f"schedule, {len(ready)} chains ready, {len(full)} full"
+                        + (f", errors: {dict(errors.most_common(3))}" if errors else "")
                     )
-                    thread["thread"].daemon = False
-                    thread["thread"].start()
-            sleep(30)
+                    last_report = now
+                    window_sent = window_dropped = 0
+                # Rounds of about one batch, shorter when few chains limit the round size
+                tick = min(self.options.batch, max(1, len(ready))) / self.options.tps
+                sleep(max(0.0, round_start + max(0.01, min(1.0, tick)) - monotonic()))
+        elapsed = monotonic() - start
+        self.log.info(
+            f"Sent {sent} transactions in {elapsed:.0f}s: {sent / elapsed:.1f} tx/s of "
+            f"{self.options.tps} target, {failed} failed, {dropped} dropped behind schedule"
+        )
 
 
 def main():
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+
+import math
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from decimal import Decimal
+from random import Random
+from statistics import median
+from time import monotonic, sleep
+from typing import Optional
+
+from commander import Commander, cdf, format_cdf, percentile
+from test_framework.wallet import MiniWallet
+
+# Upper bound of threads polling tanks at the same time
+MAX_POLLERS = 64
+
+
+def peer_graph(nodes) -> dict[int, set[int]]:
+    """Undirected p2p graph between tanks by node index, from getpeerinfo of every tank"""
+    by_host = {}
+    for node in nodes:
+        by_host[node.rpchost] = node.index
+        by_host[node.tank] = node.index
+    graph = {node.index: set() for node in nodes}
+    with ThreadPoolExecutor(max_workers=min(MAX_POLLERS, len(nodes))) as executor:
+        peer_lists = list(executor.map(lambda node: node.getpeerinfo(), nodes))
+    for node, peers in zip(nodes, peer_lists):
+        for peer in peers:
+            # Inbound peers show up by IP, outbound ones by the name they were added by
+            host = peer["addr"].rsplit(":", 1)[0].strip("[]")
+            index = by_host.get(host, by_host.get(host.split(".")[0]))
+            if index is not None and index != node.index:
+                graph[node.index].add(index)
+                graph[index].add(node.index)
+    return graph
+
+
+def hop_distances(graph: dict[int, set[int]], source: int) -> dict[int, int]:
+    hops = {source: 0}
+    queue = deque([source])
+    while queue:
+        current = queue.popleft()
+        for peer in graph[current]:
+            if peer not in hops:
+                hops[peer] = hops[current] + 1
+                queue.append(peer)
+    return hops
+
+
+@dataclass
+class Probe:
+    """One injected transaction and when it was first seen in each other tank's mempool"""
+
+    txid: str
+    source: int
+    sent: float
+    hops: dict[int, int]
+    # Per tank that hasn't seen the tx yet: start of the last poll that didn't find it
+    last_miss: dict[int, float]
+    # Per tank: estimated seconds from injection to arrival, and the estimate's uncertainty
+    latency: dict[int, float] = field(default_factory=dict)
+    resolution: dict[int, float] = field(default_factory=dict)
+
+    def time_to(self, share: float, observers: int) -> Optional[float]:
+        """Seconds until `share` of the other tanks had the transaction"""
+        needed = math.ceil(share * observers)
+        if needed == 0 or len(self.latency) < needed:
+            return None
+        return sorted(self.latency.values())[needed - 1]
+
+
+class TXPropagation(Commander):
+    def set_test_params(self):
+        self.num_nodes = 2
+
+    def add_options(self, parser):
+        parser.description = (
+            "Inject transactions at chosen tanks and measure how fast they reach the mempool "
+            "of every other tank"
+        )
+        parser.usage = "warnet run /path/to/tx_propagation.py [options]"
+        parser.add_argument(
+            "--txs",
+            dest="txs",
+            default=100,
+            type=int,
+            help="Number of transactions to inject (default 100)",
+        )
+        parser.add_argument(
+            "--interval",
+            dest="interval",
+            default=1.0,
+            type=float,
+            help="Seconds between two injections (default 1)",
+        )
+        parser.add_argument(
+            "--sources",
+            dest="sources",
+            default="",
+            type=str,
+            help="Comma separated tanks to inject at, in turn (default: all tanks at random)",
+        )
+        parser.add_argument(
+            "--poll",
+            dest="poll",
+            default=0.05,
+            type=float,
+            help="Seconds between two mempool polls of a tank (default 0.05)",
+        )
+        parser.add_argument(
+            "--timeout",
+            dest="timeout",
+            default=60.0,
+            type=float,
+            help="Seconds after which a transaction counts as not propagated (default 60)",
+        )
+        parser.add_argument(
+            "--fee-rate",
+            dest="fee_rate",
+            default=2,
+            type=int,
+            help="Fee rate of the injected transactions in sat/vB (default 2)",
+        )
+        parser.add_argument(
+            "--seed",
+            dest="seed",
+            default=None,
+            type=int,
+            help="Seed for the choice of source tanks",
+        )
+
+    def poll(self, index: int, probes: list[Probe]):
+        """Look up the probes in one tank's mempool with a single JSON-RPC batch"""
+        node = self.nodes[index]
+        started = monotonic()
+        responses = node.batch([node.getmempoolentry.get_request(p.txid) for p in probes])
+        return started, monotonic(), responses
+
+    def run_test(self):
+        rng = Random(self.options.seed)
+        if self.options.sources:
+            sources = [self.tanks[name].index for name in self.options.sources.split(",")]
+        else:
+            sources = [node.index for node in self.nodes]
+        observers = len(self.nodes) - 1
+
+        node = self.nodes[0]
+        wallet = MiniWallet(node)
+        utxos = self.miniwallet_utxos(node, wallet, self.options.txs)
+        fee_rate = Decimal(self.options.fee_rate) / 100_000
+
+        self.log.info("Mapping the p2p network...")
+        graph = peer_graph(self.nodes)
+        distances = {source: hop_distances(graph, source) for source in set(sources)}
+
+        self.log.info(
+            f"Injecting {len(utxos)} transactions every {self.options.interval}s, "
+            f"polling {observers} tanks every {self.options.poll}s"
+        )
+        probes: list[Probe] = []
+        pending: list[Probe] = []
+        next_injection = monotonic()
+        with ThreadPoolExecutor(max_workers=min(MAX_POLLERS, len(self.nodes))) as executor:
+            while len(probes) < len(utxos) or pending:
+                cycle = monotonic()
+                if len(probes) < len(utxos) and cycle >= next_injection:
+                    if self.options.sources:
+                        source = sources[len(probes) % len(sources)]
+                    else:
+                        source = rng.choice(sources)
+                    tx = wallet.create_self_transfer(
+                        utxo_to_spend=utxos[len(probes)], fee_rate=fee_rate
+                    )
+                    self.nodes[source].sendrawtransaction(tx["hex"], 0)
+                    # Relay starts once the source accepted the tx
+                    sent = monotonic()
+                    others = [n.index for n in self.nodes if n.index != source]
+                    probe = Probe(
+                        tx["txid"], source, sent, distances[source], dict.fromkeys(others, sent)
+                    )
+                    probes.append(probe)
+                    pending.append(probe)
+                    next_injection += self.options.interval
+
+                by_node: dict[int, list[Probe]] = {}
+                for probe in pending:
+                    for index in probe.last_miss:
+                        by_node.setdefault(index, []).append(probe)
+                polls = {
+                    index: executor.submit(self.poll, index, batch)
+                    for index, batch in by_node.items()
+                }
+                for index, future in polls.items():
+                    started, finished, responses = future.result()
+                    for probe, response in zip(by_node[index], responses):
+                        if response.get("result") is None:
+                            probe.last_miss[index] = started
+                            continue
+                        # The tx arrived between the last poll missing it and this one
+                        last_miss = probe.last_miss.pop(index)
+                        probe.latency[index] = (last_miss + finished) / 2 - probe.sent
+                        probe.resolution[index] = finished - last_miss
+
+                now = monotonic()
+                for probe in list(pending):
+                    if not probe.last_miss:
+                        pending.remove(probe)
+                        self.log.info(
+                            f"tx {probe.txid} from {self.nodes[probe.source].tank} reached all "
+                            f"tanks in {max(probe.latency.values(), default=0):.3f}s"
+                        )
+                    elif now - probe.sent > self.options.timeout:
+                        pending.remove(probe)
+                        self.log.warning(
+                            f"tx {probe.txid} from {self.nodes[probe.source].tank} did not reach "
+                            f"{len(probe.last_miss)} tanks within {self.options.timeout}s"
+                        )
+                sleep(max(0.0, cycle + self.options.poll - monotonic()))
+
+        self.report(probes, observers)
+
+    def report(self, probes: list[Probe], observers: int):
+        arrivals = [latency for p in probes for latency in p.latency.values()]
+        resolution = [r for p in probes for r in p.resolution.values()]
+        missed = sum(observers - len(p.latency) for p in probes)
+        self.log.info(
+            f"{len(arrivals)} arrivals of {len(probes)} transactions at {observers} tanks, "
+            f"{missed} missed, median resolution {median(resolution) if resolution else 0:.3f}s"
+        )
+        self.log.info(f"Arrival latency CDF: {format_cdf(arrivals)}")
+        result = {"arrivals": cdf(arrivals) if arrivals else None, "missed": missed}
+        for share in (0.5, 0.9, 1.0):
+            times = [t for p in probes if (t := p.time_to(share, observers)) is not None]
+            self.log.info(
+                f"Time to reach {share:.0%} of tanks ({len(times)} txs): {format_cdf(times)}"
+            )
+            result[f"reach_{share:.0%}"] = cdf(times) if times else None
+
+        # Latency by hop distance from the source in the p2p graph
+        by_hops: dict[int, list[float]] = {}
+        for probe in probes:
+            for index, latency in probe.latency.items():
+                if index in probe.hops:
+                    by_hops.setdefault(probe.hops[index], []).append(latency)
+        result["hops"] = {}
+        previous = 0.0
+        for hops in sorted(by_hops):
+            latencies = sorted(by_hops[hops])
+            hop_median = percentile(latencies, 50)
+            self.log.info(
+                f"{hops} hop(s): {len(latencies)} arrivals, median {hop_median:.3f}s "
+                f"(+{hop_median - previous:.3f}s for the last hop), "
+                f"p90 {percentile(latencies, 90):.3f}s"
+            )
+            result["hops"][hops] = {"median": round(hop_median, 4), **cdf(latencies)}
+            previous = hop_median
+        per_hop = [
+            latency / probe.hops[index]
+            for probe in probes
+            for index, latency in probe.latency.items()
+            if probe.hops.get(index)
+        ]
+        self.log.info(f"Latency per hop: {format_cdf(per_hop)}")
+        result["per_hop"] = cdf(per_hop) if per_hop else None
+        self.log_result(result)
+
+
+def main():
+    TXPropagation().main()
+
+
+if __name__ == "__main__":
+    main()
@@ -8,9 +8,9 @@ TIMESTAMP=$(date +"%Y%m%d_%H%M%S")
 # Ensure log directory exists
 mkdir -p "$LOG_DIR"
 
-# Collect logs using stern (includes logs from terminated pods)
-echo "Collecting stern logs..."
-stern "(tank|commander).*" --namespace="$NAMESPACE" --output default --since 1h --no-follow > "$LOG_DIR/${TIMESTAMP}_stern_logs"
+# Collect logs from all tanks, LN nodes and commanders (includes logs from terminated pods)
+echo "Collecting pod logs..."
+warnet logs --selector "mission in (tank,commander,lightning)" --namespace="$NAMESPACE" --since 1h --no-color > "$LOG_DIR/${TIMESTAMP}_pod_logs"
 
 # Collect descriptions of all resources
 echo "Collecting resource descriptions..."
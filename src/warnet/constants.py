@@ -21,11 +21,18 @@ HELM_COMMAND = "helm upgrade --install"
 
 TANK_MISSION = "tank"
 COMMANDER_MISSION = "commander"
+COMMANDER_POOL_MISSION = "commander-pool"
+COMMANDER_POOL_PREFIX = "commander-pool-"
 LIGHTNING_MISSION = "lightning"
 
 BITCOINCORE_CONTAINER = "bitcoincore"
 COMMANDER_CONTAINER = "commander"
 
+# Scenario files shared by every scenario, shipped once per namespace in a ConfigMap
+FRAMEWORK_ARCHIVE_MEMBERS = ["commander.py", "test_framework", "ln_framework"]
+FRAMEWORK_ARCHIVE_KEY = "framework.zip"
+FRAMEWORK_CONFIGMAP_PREFIX = "warnet-framework-"
+
 
 class HookValue(Enum):
     PRE_DEPLOY = "preDeploy"
@@ -77,6 +84,7 @@ COMMANDER_CHART = str(CHARTS_DIR.joinpath("commander"))
 NAMESPACES_CHART_LOCATION = CHARTS_DIR.joinpath("namespaces")
 FORK_OBSERVER_CHART = str(files("resources.charts").joinpath("fork-observer"))
 CADDY_CHART = str(files("resources.charts").joinpath("caddy"))
+METRICS_COLLECTOR_CHART = str(files("resources.charts").joinpath("metrics-collector"))
 CADDY_INGRESS_NAME = "caddy-ingress"
 
 DEFAULT_NAMESPACES = Path("two_namespaces_two_users")
@@ -84,6 +92,9 @@ DEFAULT_NAMESPACES = Path("two_namespaces_two_users")
 # Kubeconfig related stuffs
 KUBECONFIG = os.environ.get("KUBECONFIG", os.path.expanduser("~/.kube/config"))
 
+# Local cache for build artifacts such as scenario framework archives
+WARNET_CACHE_DIR = Path(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache"))) / "warnet"
+
 # TODO: all of this logging stuff should be a helm chart
 LOGGING_CONFIG = {
     "version": 1,
@@ -1,10 +1,15 @@
+import hashlib
 import io
 import json
 import os
+import queue
+import secrets
 import subprocess
 import sys
+import threading
 import time
 import zipapp
+import zipfile
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from multiprocessing import Pool
 from pathlib import Path
@@ -14,6 +19,7 @@ import click
 import inquirer
 from inquirer.themes import GreenPassion
 from kubernetes.client.models import V1Pod
+from kubernetes.client.rest import ApiException
 from rich import print
 from rich.console import Console
 from rich.prompt import Confirm, Prompt
@@ -24,23 +30,39 @@ from .constants import (
     COMMANDER_CHART,
     COMMANDER_CONTAINER,
     COMMANDER_MISSION,
+    COMMANDER_POOL_MISSION,
+    COMMANDER_POOL_PREFIX,
+    FRAMEWORK_ARCHIVE_KEY,
+    FRAMEWORK_ARCHIVE_MEMBERS,
+    FRAMEWORK_CONFIGMAP_PREFIX,
+    SCENARIOS_DIR,
     TANK_MISSION,
+    WARNET_CACHE_DIR,
 )
 from .k8s import (
     can_delete_pods,
     delete_pod,
+    ensure_binary_configmap,
     get_default_namespace,
     get_default_namespace_or,
     get_mission,
     get_namespaces,
     get_pod,
     get_pods,
+    get_static_client,
     pod_log,
     snapshot_bitcoin_datadir,
     wait_for_init,
     wait_for_pod,
+    watch_pods,
     write_file_to_container,
 )
+from .log_archive import (
+    ARCHIVE_SELECTOR,
+    collect_archive,
+    parse_time_arg,
+    search_archive,
+)
 from .process import run_command, stream_command
 
 console = Console()
@@ -294,6 +316,14 @@ def _run(
 
     name = f"commander-{scenario_name.replace('_', '')}-{int(time.time())}"
 
+    # Upload the shared framework files once per namespace, keyed by their content hash.
+    # If that fails (e.g. missing permissions) we fall back to a self-contained archive.
+    framework_configmap = None
+    try:
+        framework_configmap = upload_framework_archive(scenario_dir, namespace)
+    except Exception as e:
+        print(f"Could not upload scenario framework, including it in the scenario archive: {e}")
+
     # Create in-memory buffer to store python archive instead of writing to disk
     archive_buffer = io.BytesIO()
 
@@ -301,6 +331,10 @@ def _run(
     def filter(path):
         if any(needle in str(path) for needle in [".pyc", ".csv", ".DS_Store"]):
             return False
+        if framework_configmap and any(
+            Path(path).parts[0] == member for member in FRAMEWORK_ARCHIVE_MEMBERS
+        ):
+            return False
         if any(
             needle in str(path)
             for needle in [
@@ -336,6 +370,47 @@ def _run(
     archive_buffer.seek(0)
     archive_data = archive_buffer.read()
 
+    warm_name = None
+    if framework_configmap and not admin:
+        warm_name = claim_warm_commander(framework_configmap, namespace)
+
+    if warm_name:
+        name = warm_name
+        print(f"Claimed warm commander for scenario: {scenario_name}")
+        print(f"Commander pod name: {name}")
+        if not start_warm_commander(name, archive_data, additional_args, namespace):
+            return None
+        print(f"Successfully uploaded scenario data to commander: {scenario_name}")
+        # Replace the commander we took without blocking the user
+        subprocess.Popen(
+            warm_commander_helm_command(framework_configmap, namespace),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+    elif not _start_commander(
+        name, scenario_name, archive_data, additional_args, admin, framework_configmap, namespace
+    ):
+        return None
+
+    if debug:
+        print("Waiting for commander pod to start...")
+        wait_for_pod(name, namespace=namespace)
+        _logs(pod_name=name, follow=True, namespace=namespace)
+        print("Deleting pod...")
+        delete_pod(name, namespace=namespace)
+
+    return name
+
+
+def _start_commander(
+    name: str,
+    scenario_name: str,
+    archive_data: bytes,
+    additional_args: tuple[str],
+    admin: bool,
+    framework_configmap: Optional[str],
+    namespace: str,
+) -> bool:
     # Start the commander pod with python and init containers
     try:
         # Construct Helm command
@@ -352,6 +427,8 @@ def _run(
         # Add additional arguments
         if admin:
             helm_command.extend(["--set", "admin=true"])
+        if framework_configmap:
+            helm_command.extend(["--set", f"frameworkConfigMap={framework_configmap}"])
         if additional_args:
             helm_command.extend(["--set", f"args={' '.join(additional_args)}"])
 
@@ -370,11 +447,11 @@ def _run(
     except subprocess.CalledProcessError as e:
         print(f"Failed to deploy scenario commander: {scenario_name}")
         print(f"Error: {e.stderr}")
-        return None
+        return False
     except FileNotFoundError as e:
         click.secho(e)
         click.secho("Please install Helm, or run `warnet setup`.", fg="red")
-        return None
+        return False
 
     # upload scenario files and network data to the init container
     wait_for_init(name, namespace=namespace)
@@ -383,26 +460,364 @@ def _run(
     ):
         print(f"Successfully uploaded scenario data to commander: {scenario_name}")
 
-    if debug:
-        print("Waiting for commander pod to start...")
-        wait_for_pod(name, namespace=namespace)
-        _logs(pod_name=name, follow=True, namespace=namespace)
-        print("Deleting pod...")
-        delete_pod(name, namespace=namespace)
+    return True
+
 
+def build_framework_archive(scenario_dir: Path) -> tuple[str, bytes]:
+    """
+    Zip the framework files shared by all scenarios in `scenario_dir`.
+    Returns a hash of the file contents and the archive, which is cached locally by that hash.
+    """
+    files = []
+    for member in FRAMEWORK_ARCHIVE_MEMBERS:
+        path = scenario_dir / member
+        if path.is_file():
+            files.append(path)
+        elif path.is_dir():
+            files.extend(sorted(p for p in path.rglob("*") if p.is_file()))
+
+    contents = []
+    digest = hashlib.sha256()
+    for path in files:
+        if any(needle in str(path) for needle in [".pyc", ".csv", ".DS_Store"]):
+            continue
+        relative = path.relative_to(scenario_dir).as_posix()
+        data = path.read_bytes()
+        digest.update(relative.encode("utf-8") + b"\0" + data)
+        contents.append((relative, data))
+    framework_hash = digest.hexdigest()[:16]
+
+    cached = WARNET_CACHE_DIR / f"framework-{framework_hash}.zip"
+    if cached.exists():
+        return framework_hash, cached.read_bytes()
+
+    archive_buffer = io.BytesIO()
+    with zipfile.ZipFile(archive_buffer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for relative, data in contents:
+            archive.writestr(relative, data)
+    archive_data = archive_buffer.getvalue()
+
+    try:
+        cached.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = cached.with_suffix(f".{os.getpid()}.tmp")
+        temp_path.write_bytes(archive_data)
+        os.replace(temp_path, cached)
+    except OSError as e:
+        print(f"Could not cache framework archive in {cached.parent}: {e}")
+    return framework_hash, archive_data
+
+
+def upload_framework_archive(scenario_dir: Path, namespace: str) -> str:
+    """Ensure the framework archive for `scenario_dir` is in a ConfigMap and return its name"""
+    framework_hash, archive_data = build_framework_archive(scenario_dir)
+    name = f"{FRAMEWORK_CONFIGMAP_PREFIX}{framework_hash}"
+    if ensure_binary_configmap(
+        name,
+        FRAMEWORK_ARCHIVE_KEY,
+        archive_data,
+        labels={"app.kubernetes.io/name": "commander-framework"},
+        namespace=namespace,
+    ):
+        print(f"Uploaded scenario framework {name} ({len(archive_data)} bytes)")
+    else:
+        print(f"Using cached scenario framework {name}")
     return name
 
 
+def warm_commander_helm_command(framework_configmap: str, namespace: str) -> list[str]:
+    """Helm command that installs one idle commander into the warm pool"""
+    name = f"{COMMANDER_POOL_PREFIX}{secrets.token_hex(4)}"
+    return [
+        "helm",
+        "upgrade",
+        "--install",
+        "--namespace",
+        namespace,
+        "--set",
+        f"fullnameOverride={name}",
+        "--set",
+        "warm=true",
+        "--set",
+        f"frameworkConfigMap={framework_configmap}",
+        name,
+        COMMANDER_CHART,
+    ]
+
+
+def get_warm_commanders(namespace: str, framework_configmap: Optional[str] = None) -> list[V1Pod]:
+    selector = f"mission={COMMANDER_POOL_MISSION}"
+    if framework_configmap:
+        selector += f",framework={framework_configmap}"
+    sclient = get_static_client()
+    return sclient.list_namespaced_pod(namespace=namespace, label_selector=selector).items
+
+
+def claim_warm_commander(framework_configmap: str, namespace: str) -> Optional[str]:
+    """
+    Take a running idle commander built from the same framework out of the pool.
+    The label patch is conditional on the pod's resourceVersion, so two concurrent
+    `warnet run` commands can never claim the same pod.
+    """
+    sclient = get_static_client()
+    for pod in get_warm_commanders(namespace, framework_configmap):
+        if pod.status.phase != "Running":
+            continue
+        body = {
+            "metadata": {
+                "resourceVersion": pod.metadata.resource_version,
+                "labels": {"mission": COMMANDER_MISSION},
+            }
+        }
+        try:
+            sclient.patch_namespaced_pod(name=pod.metadata.name, namespace=namespace, body=body)
+        except ApiException as e:
+            if e.status in (404, 409):
+                continue
+            raise e
+        return pod.metadata.name
+    return None
+
+
+def start_warm_commander(
+    name: str, archive_data: bytes, additional_args: tuple[str], namespace: str
+) -> bool:
+    """Hand a scenario to a claimed warm commander. The args file is its signal to start."""
+    args = json.dumps(list(additional_args or ()))
+    return bool(
+        write_file_to_container(
+            name, COMMANDER_CONTAINER, "/shared/archive.pyz", archive_data, namespace=namespace
+        )
+        and write_file_to_container(
+            name, COMMANDER_CONTAINER, "/shared/args.json", args, namespace=namespace, quiet=True
+        )
+    )
+
+
+@click.command()
+@click.option(
+    "--size", type=int, default=3, show_default=True, help="Number of idle commanders to keep"
+)
+@click.option(
+    "--source_dir",
+    type=click.Path(exists=True, file_okay=False, dir_okay=True),
+    required=False,
+    help="Scenario directory containing the framework files (default: built-in scenarios)",
+)
+@click.option("--namespace", default=None, show_default=True)
+def pool(size: int, source_dir, namespace: Optional[str]):
+    """
+    Keep a pool of idle, pre-started commanders for fast scenario launch.
+    `warnet run` uses a pooled commander when one matches the scenario's framework files
+    and starts a replacement in the background. Use --size 0 to remove the pool.
+    """
+    namespace = get_default_namespace_or(namespace)
+    scenario_dir = Path(source_dir).resolve() if source_dir else Path(str(SCENARIOS_DIR))
+    framework_configmap = upload_framework_archive(scenario_dir, namespace)
+
+    matching = []
+    stale = []
+    for pod in get_warm_commanders(namespace):
+        if pod.metadata.labels.get("framework") == framework_configmap:
+            matching.append(pod.metadata.name)
+        else:
+            stale.append(pod.metadata.name)
+    stale.extend(matching[size:])
+    missing = max(0, size - len(matching))
+
+    commands = [warm_commander_helm_command(framework_configmap, namespace) for _ in range(missing)]
+    commands += [
+        ["helm", "uninstall", name, "--namespace", namespace, "--wait=false"] for name in stale
+    ]
+
+    with ThreadPoolExecutor(max_workers=10) as executor:
+        for result in executor.map(
+            lambda cmd: subprocess.run(cmd, capture_output=True, text=True), commands
+        ):
+            if result.returncode != 0:
+                console.print(f"[bold red]{result.stderr.strip()}[/bold red]")
+
+    console.print(
+        f"[bold green]Warm commander pool in {namespace}: started {missing}, "
+        f"removed {len(stale)}, target size {size}[/bold green]"
+    )
+
+
 @click.command()
 @click.argument("pod_name", type=str, default="")
 @click.option("--follow", "-f", is_flag=True, default=False, help="Follow logs")
 @click.option("--namespace", type=str, default="default", show_default=True)
-def logs(pod_name: str, follow: bool, namespace: str):
-    """Show the logs of a pod"""
-    return _logs(pod_name, follow, namespace)
+@click.option(
+    "--selector",
+    "-l",
+    type=str,
+    default=None,
+    help="Stream all pods matching a label selector, e.g. mission=tank",
+)
+@click.option(
+    "--since", type=str, default=None, help="Only show logs newer than a duration like 30s, 5m, 1h"
+)
+@click.option(
+    "--color/--no-color", default=None, help="Color pod name prefixes (default: if a terminal)"
+)
+@click.option(
+    "--archive",
+    type=click.Path(file_okay=False),
+    default=None,
+    help="Incrementally save tank, commander and LN logs to a compressed archive directory",
+)
+@click.option("--grep", type=str, default=None, help="Search an --archive for a regex")
+@click.option("--start", type=str, default=None, help="Search an --archive from this UTC time")
+@click.option("--end", type=str, default=None, help="Search an --archive up to this UTC time")
+def logs(
+    pod_name: str,
+    follow: bool,
+    namespace: str,
+    selector: Optional[str],
+    since: Optional[str],
+    color: Optional[bool],
+    archive: Optional[str],
+    grep: Optional[str],
+    start: Optional[str],
+    end: Optional[str],
+):
+    """Show the logs of a pod, or of all pods matching --selector"""
+    if archive:
+        if grep or start or end:
+            for name, line in search_archive(
+                archive,
+                pattern=grep,
+                start=parse_time_arg(start) if start else None,
+                end=parse_time_arg(end) if end else None,
+                pod_name=pod_name,
+            ):
+                click.echo(f"{name} {line}")
+            return
+        return collect_archive(archive, namespace, selector or ARCHIVE_SELECTOR)
+    if grep or start or end:
+        raise click.BadParameter("--grep, --start and --end search an --archive")
+
+    since_seconds = parse_duration(since) if since else None
+    if selector:
+        if pod_name:
+            raise click.BadParameter("Use either a pod name or --selector, not both")
+        return _logs_multiplexed(selector, follow, namespace, since_seconds, color)
+    return _logs(pod_name, follow, namespace, since_seconds)
 
 
-def _logs(pod_name: str, follow: bool, namespace: Optional[str] = None):
+def parse_duration(duration: str) -> int:
+    """Convert a duration like 90, 90s, 15m, 2h or 1d into seconds"""
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+    try:
+        if duration[-1] in units:
+            return int(duration[:-1]) * units[duration[-1]]
+        return int(duration)
+    except (ValueError, IndexError):
+        raise click.BadParameter(f"Invalid duration: {duration}") from None
+
+
+def get_primary_container(pod: V1Pod, fallback: bool = False) -> Optional[str]:
+    eligible_container_names = [BITCOINCORE_CONTAINER, COMMANDER_CONTAINER]
+    available_container_names = [container.name for container in pod.spec.containers]
+    container_name = next(
+        (
+            container_name
+            for container_name in available_container_names
+            if container_name in eligible_container_names
+        ),
+        None,
+    )
+    if not container_name and fallback and available_container_names:
+        return available_container_names[0]
+    return container_name
+
+
+LOG_COLORS = ["cyan", "green", "yellow", "magenta", "blue", "bright_cyan", "bright_green"]
+
+
+def _logs_multiplexed(
+    selector: str,
+    follow: bool,
+    namespace: Optional[str],
+    since_seconds: Optional[int] = None,
+    color: Optional[bool] = None,
+):
+    """
+    Stream logs from every pod matching `selector` through one queue, one reader thread
+    per pod. When following, pods that appear later are picked up from a pod watch.
+    """
+    namespace = get_default_namespace_or(namespace)
+    lines: queue.Queue = queue.Queue()
+    streamed_uids = set()
+    prefix_width = 0
+
+    def stream_pod(pod: V1Pod):
+        pod_name = pod.metadata.name
+        try:
+            stream = pod_log(
+                pod_name,
+                container_name=get_primary_container(pod, fallback=True),
+                namespace=namespace,
+                follow=follow,
+                since_seconds=since_seconds,
+            )
+            for line in stream:
+                lines.put((pod_name, line.decode("utf-8", errors="replace").rstrip()))
+        except Exception as e:
+            lines.put((pod_name, f"Error streaming log: {e}"))
+        finally:
+            lines.put((pod_name, None))
+
+    def start_streaming(pod: V1Pod) -> bool:
+        # Pending pods have no logs yet, they are picked up again when they start running
+        if pod.status.phase not in ("Running", "Succeeded", "Failed"):
+            return False
+        if pod.metadata.uid in streamed_uids:
+            return False
+        streamed_uids.add(pod.metadata.uid)
+        threading.Thread(target=stream_pod, args=(pod,), daemon=True).start()
+        return True
+
+    def watch_new_pods():
+        try:
+            for event_type, pod in watch_pods(selector, namespace=namespace):
+                if event_type in ("ADDED", "MODIFIED"):
+                    start_streaming(pod)
+        except Exception as e:
+            lines.put(("warnet", f"Stopped watching for new pods: {e}"))
+
+    active = 0
+    try:
+        if follow:
+            threading.Thread(target=watch_new_pods, daemon=True).start()
+        else:
+            sclient = get_static_client()
+            pods = sclient.list_namespaced_pod(namespace=namespace, label_selector=selector)
+            active = sum(start_streaming(pod) for pod in pods.items)
+            if not active:
+                print(f"No running pods match selector '{selector}' in namespace {namespace}")
+                return
+
+        colors = {}
+        while follow or active > 0:
+            pod_name, line = lines.get()
+            if line is None:
+                active -= 1
+                continue
+            if pod_name not in colors:
+                colors[pod_name] = LOG_COLORS[len(colors) % len(LOG_COLORS)]
+                prefix_width = max(prefix_width, len(pod_name))
+            prefix = click.style(f"{pod_name:<{prefix_width}} |", fg=colors[pod_name])
+            click.echo(f"{prefix} {line}", color=color)
+    except KeyboardInterrupt:
+        print("Interrupted streaming logs!")
+
+
+def _logs(
+    pod_name: str,
+    follow: bool,
+    namespace: Optional[str] = None,
+    since_seconds: Optional[int] = None,
+):
     namespace = get_default_namespace_or(namespace)
 
     def format_pods(pods: list[V1Pod]) -> list[str]:
@@ -440,16 +855,7 @@ def _logs(pod_name: str, follow: bool, namespace: Optional[str] = None):
 
     try:
         pod = get_pod(pod_name, namespace=namespace)
-        eligible_container_names = [BITCOINCORE_CONTAINER, COMMANDER_CONTAINER]
-        available_container_names = [container.name for container in pod.spec.containers]
-        container_name = next(
-            (
-                container_name
-                for container_name in available_container_names
-                if container_name in eligible_container_names
-            ),
-            None,
-        )
+        container_name = get_primary_container(pod)
         if not container_name:
             print("Could not determine primary container.")
             return
@@ -459,7 +865,11 @@ def _logs(pod_name: str, follow: bool, namespace: Optional[str] = None):
 
     try:
         stream = pod_log(
-            pod_name, container_name=container_name, namespace=namespace, follow=follow
+            pod_name,
+            container_name=container_name,
+            namespace=namespace,
+            follow=follow,
+            since_seconds=since_seconds,
         )
         for line in stream:
             click.echo(line.decode("utf-8").rstrip())
@@ -1,7 +1,7 @@
-import json
 import subprocess
 import sys
 import tempfile
+from dataclasses import dataclass
 from multiprocessing import Process
 from pathlib import Path
 from typing import Optional
@@ -22,6 +22,7 @@ from .constants import (
     LOGGING_CRD_COMMANDS,
     LOGGING_HELM_COMMANDS,
     LOGGING_NAMESPACE,
+    METRICS_COLLECTOR_CHART,
     NAMESPACES_CHART_LOCATION,
     NAMESPACES_FILE,
     NETWORK_FILE,
@@ -33,7 +34,9 @@ from .constants import (
     WarnetContent,
 )
 from .control import _logs, _run
+from .graph import YAML_LOADER, Shard, load_network
 from .k8s import (
+    ensure_namespace,
     get_default_namespace,
     get_default_namespace_or,
     get_mission,
@@ -41,7 +44,8 @@ from .k8s import (
     wait_for_ingress_controller,
     wait_for_pod_ready,
 )
-from .process import run_command, stream_command
+from .plugin_host import is_isolated, plugin_host
+from .process import stream_command
 
 HINT = "\nAre you trying to run a scenario? See `warnet run --help`"
 
@@ -66,16 +70,22 @@ def validate_directory(ctx, param, value):
 @click.option("--debug", is_flag=True)
 @click.option("--namespace", type=str, help="Specify a namespace in which to deploy the network")
 @click.option("--to-all-users", is_flag=True, help="Deploy network to all user namespaces")
+@click.option(
+    "--shard",
+    "shards",
+    multiple=True,
+    help="Only deploy the named shard(s) of a sharded network.yaml",
+)
 @click.argument("unknown_args", nargs=-1)
-def deploy(directory, debug, namespace, to_all_users, unknown_args):
+def deploy(directory, debug, namespace, to_all_users, shards, unknown_args):
     """Deploy a warnet with topology loaded from <directory>"""
     if unknown_args:
         raise click.BadParameter(f"Unknown args: {unknown_args}{HINT}")
 
-    _deploy(directory, debug, namespace, to_all_users)
+    _deploy(directory, debug, namespace, to_all_users, shards)
 
 
-def _deploy(directory, debug, namespace, to_all_users):
+def _deploy(directory, debug, namespace, to_all_users, shards=None):
     """Deploy a warnet with topology loaded from <directory>"""
     directory = Path(directory)
 
@@ -83,7 +93,9 @@ def _deploy(directory, debug, namespace, to_all_users):
         namespaces = get_namespaces_by_type(WARGAMES_NAMESPACE_PREFIX)
         processes = []
         for namespace in namespaces:
-            p = Process(target=_deploy, args=(directory, debug, namespace.metadata.name, False))
+            p = Process(
+                target=_deploy, args=(directory, debug, namespace.metadata.name, False, shards)
+            )
             p.start()
             processes.append(p)
         for p in processes:
@@ -91,36 +103,45 @@ def _deploy(directory, debug, namespace, to_all_users):
         return
 
     if (directory / NETWORK_FILE).exists():
-        run_plugins(directory, HookValue.PRE_DEPLOY, namespace)
+        ctx = load_deploy_context(directory, get_default_namespace_or(namespace))
+        run_plugins(ctx, HookValue.PRE_DEPLOY, namespace)
 
         processes = []
         # Deploy logging CRD first to avoid synchronisation issues
-        deploy_logging_crd(directory, debug)
+        deploy_logging_crd(ctx, debug)
 
-        logging_process = Process(target=deploy_logging_stack, args=(directory, debug))
+        logging_process = Process(target=deploy_logging_stack, args=(ctx, debug))
         logging_process.start()
         processes.append(logging_process)
 
-        run_plugins(directory, HookValue.PRE_NETWORK, namespace)
+        run_plugins(ctx, HookValue.PRE_NETWORK, namespace)
+
+        # Before the network and the collector, which installs Roles in every shard namespace
+        create_shard_namespaces(ctx, shards)
 
-        network_process = Process(target=deploy_network, args=(directory, debug, namespace))
+        network_process = Process(target=deploy_network, args=(ctx, debug, namespace, shards))
         network_process.start()
 
-        ingress_process = Process(target=deploy_ingress, args=(directory, debug))
+        ingress_process = Process(target=deploy_ingress, args=(ctx, debug))
         ingress_process.start()
         processes.append(ingress_process)
 
-        caddy_process = Process(target=deploy_caddy, args=(directory, debug))
+        caddy_process = Process(target=deploy_caddy, args=(ctx, debug))
         caddy_process.start()
         processes.append(caddy_process)
 
+        # The collector discovers tanks by itself, it does not need to wait for the tanks
+        collector_process = Process(target=deploy_metrics_collector, args=(ctx, debug, namespace))
+        collector_process.start()
+        processes.append(collector_process)
+
         # Wait for the network process to complete
         network_process.join()
 
-        run_plugins(directory, HookValue.POST_NETWORK, namespace)
+        run_plugins(ctx, HookValue.POST_NETWORK, namespace)
 
         # Start the fork observer process immediately after network process completes
-        fork_observer_process = Process(target=deploy_fork_observer, args=(directory, debug))
+        fork_observer_process = Process(target=deploy_fork_observer, args=(ctx, debug))
         fork_observer_process.start()
         processes.append(fork_observer_process)
 
@@ -128,7 +149,7 @@ def _deploy(directory, debug, namespace, to_all_users):
         for p in processes:
             p.join()
 
-        run_plugins(directory, HookValue.POST_DEPLOY, namespace)
+        run_plugins(ctx, HookValue.POST_DEPLOY, namespace)
 
     elif (directory / NAMESPACES_FILE).exists():
         deploy_namespaces(directory)
@@ -138,94 +159,112 @@ def _deploy(directory, debug, namespace, to_all_users):
         )
 
 
-def run_plugins(directory, hook_value: HookValue, namespace, annex: Optional[dict] = None):
-    """Run the plugin commands within a given hook value"""
+@dataclass
+class PluginCommand:
+    name: str
+    content: dict
+    entrypoint: Path
 
-    network_file_path = directory / NETWORK_FILE
 
-    with network_file_path.open() as f:
-        network_file = yaml.safe_load(f) or {}
-        if not isinstance(network_file, dict):
-            raise ValueError(f"Invalid network file structure: {network_file_path}")
+@dataclass
+class DeployContext:
+    """
+    Everything a deploy reads from the network directory, parsed once up front and
+    handed to every deploy step and (forked) node process
+    """
 
-    processes = []
+    directory: Path
+    network: dict
+    shards: list[Shard]
+    defaults: dict
+    plugins: dict[HookValue, list[PluginCommand]]
 
-    plugins_section = network_file.get("plugins", {})
-    hook_section = plugins_section.get(hook_value.value, {})
-    for plugin_name, plugin_content in hook_section.items():
-        match (plugin_name, plugin_content):
-            case (str(), dict()):
-                try:
-                    entrypoint_path = Path(plugin_content.get("entrypoint"))
-                except Exception as err:
-                    raise SyntaxError("Each plugin must have an 'entrypoint'") from err
-
-                warnet_content = {
-                    WarnetContent.HOOK_VALUE.value: hook_value.value,
-                    WarnetContent.NAMESPACE.value: namespace,
-                    PLUGIN_ANNEX: annex,
-                }
-
-                cmd = (
-                    f"{sys.executable} {network_file_path.parent / entrypoint_path / Path('plugin.py')} entrypoint "
-                    f"'{json.dumps(plugin_content)}' '{json.dumps(warnet_content)}'"
-                )
-                print(
-                    f"Queuing {hook_value.value} plugin command: {plugin_name} with {plugin_content}"
-                )
-
-                process = Process(target=run_command, args=(cmd,))
-                processes.append(process)
-
-            case _:
-                print(
-                    f"The following plugin command does not match known plugin command structures: {plugin_name} {plugin_content}"
-                )
-                sys.exit(1)
-
-    if processes:
-        print(f"Starting {hook_value.value} plugins")
-
-        for process in processes:
-            process.start()
-
-        for process in processes:
-            process.join()
-
-        print(f"Completed {hook_value.value} plugins")
-
-
-def check_logging_required(directory: Path):
-    # check if node-defaults has logging or metrics enabled
-    default_file_path = directory / DEFAULTS_FILE
-    with default_file_path.open() as f:
-        default_file = yaml.safe_load(f)
-    if default_file.get("collectLogs", False):
-        return True
-    if default_file.get("metricsExport", False):
-        return True
+    @property
+    def nodes(self) -> list[dict]:
+        return [node for shard in self.shards for node in shard.nodes]
 
-    # check to see if individual nodes have logging enabled
-    network_file_path = directory / NETWORK_FILE
-    with network_file_path.open() as f:
-        network_file = yaml.safe_load(f)
+    def metrics_collector_enabled(self) -> bool:
+        return bool((self.network.get("metrics_collector") or {}).get("enabled", False))
 
-    nodes = network_file.get("nodes") or []
-    for node in nodes:
-        if node.get("collectLogs", False):
+    def logging_required(self) -> bool:
+        if self.metrics_collector_enabled():
             return True
-        if node.get("metricsExport", False):
+        # check if node-defaults has logging or metrics enabled
+        if self.defaults.get("collectLogs", False) or self.defaults.get("metricsExport", False):
             return True
+        # check to see if individual nodes have logging enabled
+        return any(
+            node.get("collectLogs", False) or node.get("metricsExport", False)
+            for node in self.nodes
+        )
 
-    return False
 
+def load_deploy_context(directory: Path, namespace: Optional[str] = None) -> DeployContext:
+    """Parse network.yaml (with its shards), node-defaults.yaml and the plugin hooks once"""
+    network, shards = load_network(directory, namespace)
+    with (directory / DEFAULTS_FILE).open() as f:
+        defaults = yaml.load(f, Loader=YAML_LOADER) or {}
+
+    plugins = {hook_value: [] for hook_value in HookValue}
+    plugins_section = network.get("plugins") or {}
+    for hook_value in HookValue:
+        hook_section = plugins_section.get(hook_value.value) or {}
+        for plugin_name, plugin_content in hook_section.items():
+            match (plugin_name, plugin_content):
+                case (str(), dict()):
+                    try:
+                        entrypoint_path = Path(plugin_content.get("entrypoint"))
+                    except Exception as err:
+                        raise SyntaxError("Each plugin must have an 'entrypoint'") from err
+                    plugins[hook_value].append(
+                        PluginCommand(
+                            plugin_name,
+                            plugin_content,
+                            directory / entrypoint_path / Path("plugin.py"),
+                        )
+                    )
+                case _:
+                    print(
+                        f"The following plugin command does not match known plugin command structures: {plugin_name} {plugin_content}"
+                    )
+                    sys.exit(1)
+
+    # Import plugins before any node processes fork, so each is only imported once
+    for plugin_commands in plugins.values():
+        for plugin in plugin_commands:
+            if not is_isolated(plugin.content):
+                plugin_host.load(plugin.entrypoint)
+
+    return DeployContext(directory, network, shards, defaults, plugins)
+
+
+def run_plugins(ctx: DeployContext, hook_value: HookValue, namespace, annex: Optional[dict] = None):
+    """Run the plugin commands within a given hook value"""
+    plugin_commands = ctx.plugins[hook_value]
+    if not plugin_commands:
+        return
+
+    calls = []
+    for plugin in plugin_commands:
+        warnet_content = {
+            WarnetContent.HOOK_VALUE.value: hook_value.value,
+            WarnetContent.NAMESPACE.value: namespace,
+            PLUGIN_ANNEX: annex,
+        }
+        print(f"Queuing {hook_value.value} plugin command: {plugin.name} with {plugin.content}")
+        calls.append((plugin.entrypoint, plugin.content, warnet_content))
 
-def deploy_logging_crd(directory: Path, debug: bool) -> bool:
+    print(f"Starting {hook_value.value} plugins")
+    plugin_host.run(calls)
+    print(f"Completed {hook_value.value} plugins")
+
+
+def deploy_logging_crd(ctx: DeployContext, debug: bool) -> bool:
     """
     This function exists so we can parallelise the rest of the loggin stack
     installation
     """
-    if not check_logging_required(directory):
+    if not ctx.logging_required():
         return False
 
     click.echo(
@@ -239,8 +278,8 @@ def deploy_logging_crd(directory: Path, debug: bool) -> bool:
     return True
 
 
-def deploy_logging_stack(directory: Path, debug: bool) -> bool:
-    if not check_logging_required(directory):
+def deploy_logging_stack(ctx: DeployContext, debug: bool) -> bool:
+    if not ctx.logging_required():
         return False
 
     click.echo("Deploying logging stack")
@@ -252,10 +291,8 @@ def deploy_logging_stack(directory: Path, debug: bool) -> bool:
     return True
 
 
-def deploy_caddy(directory: Path, debug: bool):
-    network_file_path = directory / NETWORK_FILE
-    with network_file_path.open() as f:
-        network_file = yaml.safe_load(f)
+def deploy_caddy(ctx: DeployContext, debug: bool):
+    network_file = ctx.network
 
     namespace = LOGGING_NAMESPACE
     # TODO: get this from the helm chart
@@ -277,13 +314,10 @@ def deploy_caddy(directory: Path, debug: bool):
     click.echo("\nTo access the warnet dashboard run:\n  warnet dashboard")
 
 
-def deploy_ingress(directory: Path, debug: bool):
+def deploy_ingress(ctx: DeployContext, debug: bool):
     # Deploy ingress if either logging or fork observer is enabled
-    network_file_path = directory / NETWORK_FILE
-    with network_file_path.open() as f:
-        network_file = yaml.safe_load(f)
-    fo_enabled = network_file.get("fork_observer", {}).get("enabled", False)
-    logging_enabled = check_logging_required(directory)
+    fo_enabled = ctx.network.get("fork_observer", {}).get("enabled", False)
+    logging_enabled = ctx.logging_required()
     if not (fo_enabled or logging_enabled):
         return
     click.echo("Deploying ingress controller")
@@ -298,10 +332,8 @@ def deploy_ingress(directory: Path, debug: bool):
     return True
 
 
-def deploy_fork_observer(directory: Path, debug: bool) -> bool:
-    network_file_path = directory / NETWORK_FILE
-    with network_file_path.open() as f:
-        network_file = yaml.safe_load(f)
+def deploy_fork_observer(ctx: DeployContext, debug: bool) -> bool:
+    network_file = ctx.network
 
     # Only start if configured in the network file
     if not network_file.get("fork_observer", {}).get("enabled", False):
@@ -358,16 +390,68 @@ rpc_password = "{FORK_OBSERVER_RPC_PASSWORD}"
     return True
 
 
-def deploy_network(directory: Path, debug: bool = False, namespace: Optional[str] = None):
-    network_file_path = directory / NETWORK_FILE
+def deploy_metrics_collector(ctx: DeployContext, debug: bool, namespace: Optional[str]) -> bool:
+    """
+    Deploy one collector that polls every tank of the network and serves all their
+    metrics to Prometheus, instead of an exporter container in every tank pod
+    """
+    if not ctx.metrics_collector_enabled():
+        return False
+
     namespace = get_default_namespace_or(namespace)
+    values = {k: v for k, v in ctx.network["metrics_collector"].items() if k != "enabled"}
+    values.setdefault("namespaces", sorted({shard.namespace or namespace for shard in ctx.shards}))
 
-    with network_file_path.open() as f:
-        network_file = yaml.safe_load(f)
+    click.echo("Deploying metrics collector")
+    cmd = f"{HELM_COMMAND} metrics-collector {METRICS_COLLECTOR_CHART} --namespace {namespace}"
+    if debug:
+        cmd += " --debug"
+
+    with tempfile.NamedTemporaryFile(mode="w", suffix=".yaml", delete=False) as temp_file:
+        yaml.dump(values, temp_file)
+    cmd = f"{cmd} -f {temp_file.name}"
+
+    try:
+        if not stream_command(cmd):
+            click.echo(f"Failed to run Helm command: {cmd}")
+            return False
+        return True
+    finally:
+        Path(temp_file.name).unlink()
+
+
+def create_shard_namespaces(ctx: DeployContext, shard_names: Optional[list[str]] = None):
+    """
+    Create shard namespaces up front rather than racing helm --create-namespace per node.
+    The metrics collector watches every shard, so all of them are created when it is enabled.
+    """
+    shards = ctx.shards
+    if shard_names and not ctx.metrics_collector_enabled():
+        shards = [shard for shard in shards if shard.name in shard_names]
+    for shard_namespace in sorted({shard.namespace for shard in shards if shard.namespace}):
+        ensure_namespace(shard_namespace)
+
+
+def deploy_network(
+    ctx: DeployContext,
+    debug: bool = False,
+    namespace: Optional[str] = None,
+    shard_names: Optional[list[str]] = None,
+):
+    namespace = get_default_namespace_or(namespace)
+
+    shards = ctx.shards
+    if shard_names:
+        unknown = set(shard_names) - {shard.name for shard in shards}
+        if unknown:
+            click.echo(f"Error: no such shard(s) in {ctx.directory / NETWORK_FILE}: {unknown}")
+            return
+        shards = [shard for shard in shards if shard.name in shard_names]
+    nodes = [node for shard in shards for node in shard.nodes]
 
     needs_ln_init = False
     supported_ln_projects = ["lnd", "cln"]
-    for node in network_file["nodes"]:
+    for node in nodes:
         ln_config = node.get("ln", {})
         for key in supported_ln_projects:
             if ln_config.get(key, False) and key in node and "channels" in node[key]:
@@ -376,17 +460,20 @@ def deploy_network(directory: Path, debug: bool = False, namespace: Optional[str
         if needs_ln_init:
             break
 
-    default_file_path = directory / DEFAULTS_FILE
-    with default_file_path.open() as f:
-        default_file = yaml.safe_load(f)
-    if any(default_file.get("ln", {}).get(key, False) for key in supported_ln_projects):
+    if any(ctx.defaults.get("ln", {}).get(key, False) for key in supported_ln_projects):
         needs_ln_init = True
 
     processes = []
-    for node in network_file["nodes"]:
-        p = Process(target=deploy_single_node, args=(node, directory, debug, namespace))
-        p.start()
-        processes.append(p)
+    for shard in shards:
+        if shard.name:
+            click.echo(f"Deploying shard {shard.name}: {len(shard.nodes)} nodes")
+        for node in shard.nodes:
+            p = Process(
+                target=deploy_single_node,
+                args=(node, ctx, debug, shard.namespace or namespace),
+            )
+            p.start()
+            processes.append(p)
 
     for p in processes:
         p.join()
@@ -404,15 +491,14 @@ def deploy_network(directory: Path, debug: bool = False, namespace: Optional[str
         _logs(pod_name=name, follow=True, namespace=namespace)
 
 
-def deploy_single_node(node, directory: Path, debug: bool, namespace: str):
-    defaults_file_path = directory / DEFAULTS_FILE
+def deploy_single_node(node, ctx: DeployContext, debug: bool, namespace: str):
     click.echo(f"Deploying node: {node.get('name')}")
     temp_override_file_path = ""
     try:
         node_name = node.get("name")
         node_config_override = {k: v for k, v in node.items() if k != "name"}
 
-        defaults_file_path = directory / DEFAULTS_FILE
+        defaults_file_path = ctx.directory / DEFAULTS_FILE
         cmd = f"{HELM_COMMAND} {node_name} {BITCOIN_CHART_LOCATION} --namespace {namespace} -f {defaults_file_path}"
         if debug:
             cmd += " --debug"
@@ -423,20 +509,14 @@ def deploy_single_node(node, directory: Path, debug: bool, namespace: str):
                 temp_override_file_path = Path(temp_file.name)
             cmd = f"{cmd} -f {temp_override_file_path}"
 
-        run_plugins(
-            directory, HookValue.PRE_NODE, namespace, annex={AnnexMember.NODE_NAME.value: node_name}
-        )
+        annex = {AnnexMember.NODE_NAME.value: node_name}
+        run_plugins(ctx, HookValue.PRE_NODE, namespace, annex=annex)
 
         if not stream_command(cmd):
             click.echo(f"Failed to run Helm command: {cmd}")
             return
 
-        run_plugins(
-            directory,
-            HookValue.POST_NODE,
-            namespace,
-            annex={AnnexMember.NODE_NAME.value: node_name},
-        )
+        run_plugins(ctx, HookValue.POST_NODE, namespace, annex=annex)
 
     except Exception as e:
         click.echo(f"Error: {e}")
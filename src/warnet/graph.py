@@ -2,7 +2,10 @@ import json
 import os
 import random
 import sys
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass
 from pathlib import Path
+from typing import Optional
 
 import click
 import inquirer
@@ -17,15 +20,121 @@ from .constants import (
     DEFAULT_IMAGE_REPO,
     DEFAULT_TAG,
     FORK_OBSERVER_RPCAUTH,
+    NETWORK_FILE,
     SUPPORTED_TAGS,
 )
+from .topology import MAX_ADDNODE_CONNECTIONS, TOPOLOGIES, analyze_network, k_out
 
+# The C emitter and parser are much faster when libyaml is available
+YAML_DUMPER = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
 
-@click.group(name="graph", hidden=True)
+
+@click.group(name="graph")
 def graph():
     """Create and validate network graphs"""
 
 
+# Scheduling values a shard can apply to all of its nodes, e.g. to pin it to a node pool
+SHARD_SCHEDULING_KEYS = ["nodeSelector", "tolerations", "affinity"]
+
+
+@dataclass
+class Shard:
+    name: Optional[str]
+    namespace: Optional[str]
+    nodes: list[dict]
+
+
+def load_network(directory: Path, namespace: Optional[str] = None) -> tuple[dict, list[Shard]]:
+    """Parse the network.yaml of a network directory, see load_network_file"""
+    return load_network_file(directory / NETWORK_FILE, namespace)
+
+
+def load_network_file(
+    network_file: Path, namespace: Optional[str] = None
+) -> tuple[dict, list[Shard]]:
+    """
+    Parse a network file, and the shard files it lists, exactly once.
+
+    A sharded network.yaml lists node files instead of (or as well as) inline nodes:
+
+        shards:
+          - file: shards/east.yaml      # a file with its own `nodes:` list
+            namespace: warnet-east      # optional, defaults to the deploy namespace
+            nodeSelector: {pool: east}  # optional nodeSelector/tolerations/affinity
+
+    addnode entries naming a tank in a shard with a different namespace are
+    rewritten to <tank>.<namespace> so they resolve across namespaces. Shards without
+    a namespace are deployed to `namespace`.
+    Returns the network.yaml document and the shards, the first holding inline nodes.
+    """
+    with network_file.open() as f:
+        network = yaml.load(f, Loader=YAML_LOADER) or {}
+    if not isinstance(network, dict):
+        raise ValueError(f"Invalid network file structure: {network_file}")
+
+    # Shard files are relative to the network file
+    directory = network_file.parent
+
+    shards = []
+    if network.get("nodes"):
+        shards.append(Shard(None, None, network["nodes"]))
+    for entry in network.get("shards") or []:
+        shard_file = directory / entry["file"]
+        with shard_file.open() as f:
+            nodes = (yaml.load(f, Loader=YAML_LOADER) or {}).get("nodes") or []
+        scheduling = {k: entry[k] for k in SHARD_SCHEDULING_KEYS if k in entry}
+        for node in nodes:
+            for key, value in scheduling.items():
+                node.setdefault(key, value)
+        shards.append(Shard(entry.get("name", shard_file.stem), entry.get("namespace"), nodes))
+
+    if any(shard.namespace for shard in shards):
+        node_namespace = {
+            node["name"]: shard.namespace or namespace for shard in shards for node in shard.nodes
+        }
+        for shard in shards:
+            for node in shard.nodes:
+                if "addnode" not in node:
+                    continue
+                node["addnode"] = [
+                    f"{peer}.{node_namespace[peer]}"
+                    if node_namespace.get(peer)
+                    and node_namespace[peer] != (shard.namespace or namespace)
+                    else peer
+                    for peer in node["addnode"] or []
+                ]
+    return network, shards
+
+
+def tank_name(index: int) -> str:
+    return f"tank-{index:04d}"
+
+
+def write_network_yaml(
+    path: Path, nodes: Iterable[dict], extra: Optional[dict] = None, sort_keys: bool = True
+):
+    """
+    Write network.yaml one node at a time, so large generated or imported
+    networks never have to be held in memory as a single document
+    """
+    with open(path, "w") as f:
+        count = 0
+        for node in nodes:
+            if count == 0:
+                f.write("nodes:\n")
+            f.write(
+                yaml.dump([node], Dumper=YAML_DUMPER, default_flow_style=False, sort_keys=sort_keys)
+            )
+            count += 1
+        if count == 0:
+            f.write("nodes: []\n")
+        if extra:
+            yaml.dump(extra, f, Dumper=YAML_DUMPER, default_flow_style=False, sort_keys=sort_keys)
+    return count
+
+
 def custom_graph(
     tanks: list,
     datadir: Path,
@@ -42,55 +151,46 @@ def custom_graph(
         sys.exit(1)
 
     # Generate network.yaml
-    nodes = []
-    connections = set()
-    total_count = sum(int(entry["count"]) for entry in tanks)
-    index = 0
-
+    images = []
+    degrees = []
     for entry in tanks:
-        for _ in range(int(entry["count"])):
-            if ":" in entry["version"] and "/" in entry["version"]:
-                repo, tag = entry["version"].split(":")
-                image = {"repository": repo, "tag": tag}
-            else:
-                image = {"tag": entry["version"]}
-            node = {"name": f"tank-{index:04d}", "addnode": [], "image": image}
-
-            # Add round-robin connection
-            next_node = (index + 1) % total_count
-            node["addnode"].append(f"tank-{next_node:04d}")
-            connections.add((index, next_node))
-
-            # Add random connections
-            available_nodes = list(range(total_count))
-            available_nodes.remove(index)
-            if next_node in available_nodes:
-                available_nodes.remove(next_node)
-
-            for _ in range(min(int(entry["connections"]) - 1, len(available_nodes))):
-                random_node = random.choice(available_nodes)
-                # Avoid circular loops of A -> B -> A
-                if (random_node, index) not in connections:
-                    node["addnode"].append(f"tank-{random_node:04d}")
-                    connections.add((index, random_node))
-                    available_nodes.remove(random_node)
-
-            nodes.append(node)
-            index += 1
-
-    network_yaml_data = {"nodes": nodes}
-    network_yaml_data["fork_observer"] = {
-        "enabled": fork_observer,
-        "configQueryInterval": fork_obs_query_interval,
-    }
-    network_yaml_data["caddy"] = {
-        "enabled": caddy,
-    }
+        if ":" in entry["version"] and "/" in entry["version"]:
+            repo, tag = entry["version"].split(":")
+            image = {"repository": repo, "tag": tag}
+        else:
+            image = {"tag": entry["version"]}
+        images += [image] * int(entry["count"])
+        # Every tank gets at least its ring connection
+        degrees += [max(1, int(entry["connections"]))] * int(entry["count"])
+
+    nodes = (
+        {"name": tank_name(index), "addnode": [tank_name(t) for t in targets], "image": image}
+        for (index, targets), image in zip(
+            k_out(len(images), 0, random.Random(), degrees=degrees), images
+        )
+    )
+    write_network_yaml(
+        datadir / "network.yaml",
+        nodes,
+        {
+            "fork_observer": {
+                "enabled": fork_observer,
+                "configQueryInterval": fork_obs_query_interval,
+            },
+            "caddy": {
+                "enabled": caddy,
+            },
+        },
+    )
+
+    write_node_defaults(datadir, logging)
 
-    with open(os.path.join(datadir, "network.yaml"), "w") as f:
-        yaml.dump(network_yaml_data, f, default_flow_style=False)
+    click.echo(
+        f"Project '{datadir}' has been created with 'network.yaml' and 'node-defaults.yaml'."
+    )
 
-    # Generate node-defaults.yaml
+
+def write_node_defaults(datadir: Path, logging: bool):
     defaults_yaml_content = {
         "chain": "regtest",
         "image": {
@@ -110,10 +210,6 @@ def custom_graph(
     with open(os.path.join(datadir, "node-defaults.yaml"), "w") as f:
         yaml.dump(defaults_yaml_content, f, default_flow_style=False, sort_keys=False)
 
-    click.echo(
-        f"Project '{datadir}' has been created with 'network.yaml' and 'node-defaults.yaml'."
-    )
-
 
 def inquirer_create_network(project_path: Path):
     network_name_prompt = inquirer.prompt(
@@ -284,6 +380,161 @@ def inquirer_create_network(project_path: Path):
     return custom_network_path
 
 
+@graph.command(name="create")
+@click.argument("output_path", type=click.Path(exists=False, file_okay=False, dir_okay=True))
+@click.option("--nodes", "-n", type=int, default=12, show_default=True, help="Number of tanks")
+@click.option(
+    "--topology",
+    type=click.Choice(list(TOPOLOGIES.keys())),
+    default="k-out",
+    show_default=True,
+)
+@click.option(
+    "--connections",
+    "-k",
+    type=int,
+    default=8,
+    show_default=True,
+    help="Outbound connections (addnode) per tank",
+)
+@click.option("--seed", type=int, default=None, help="Random seed, for reproducible graphs")
+@click.option("--version", type=str, default=DEFAULT_TAG, show_default=True)
+@click.option(
+    "--rewire",
+    type=float,
+    default=0.1,
+    show_default=True,
+    help="watts-strogatz: probability of rewiring each lattice edge",
+)
+@click.option(
+    "--clusters",
+    type=int,
+    default=8,
+    show_default=True,
+    help="geographic: number of regions / autonomous systems",
+)
+@click.option(
+    "--locality",
+    type=float,
+    default=0.8,
+    show_default=True,
+    help="geographic: probability a connection stays inside its region",
+)
+@click.option("--fork-observer/--no-fork-observer", default=False, show_default=True)
+@click.option("--logging/--no-logging", default=False, show_default=True)
+def create_graph(
+    output_path: str,
+    nodes: int,
+    topology: str,
+    connections: int,
+    seed: Optional[int],
+    version: str,
+    rewire: float,
+    clusters: int,
+    locality: float,
+    fork_observer: bool,
+    logging: bool,
+):
+    """Generate a network of --nodes tanks with a given topology"""
+    options = {}
+    if topology == "watts-strogatz":
+        options["rewire"] = rewire
+    elif topology == "geographic":
+        options = {"clusters": clusters, "locality": locality}
+    datadir = Path(output_path)
+    try:
+        datadir.mkdir(parents=True, exist_ok=False)
+    except FileExistsError as e:
+        print(e)
+        print("Exiting network builder without overwriting")
+        sys.exit(1)
+
+    image = {"tag": version}
+    if ":" in version and "/" in version:
+        repo, tag = version.split(":")
+        image = {"repository": repo, "tag": tag}
+    generator = TOPOLOGIES[topology](nodes, connections, random.Random(seed), **options)
+    count = write_network_yaml(
+        datadir / "network.yaml",
+        (
+            {"name": tank_name(index), "addnode": [tank_name(t) for t in targets], "image": image}
+            for index, targets in generator
+        ),
+        {
+            "fork_observer": {"enabled": fork_observer, "configQueryInterval": 20},
+            "caddy": {"enabled": fork_observer or logging},
+        },
+    )
+    write_node_defaults(datadir, logging)
+    click.echo(f"Created {topology} network of {count} tanks in {datadir}")
+
+
+@graph.command()
+@click.argument("network_path", type=click.Path(exists=True, file_okay=True, dir_okay=True))
+@click.option("--seed", type=int, default=None, help="Random seed for sampled estimates")
+def analyze(network_path: str, seed: Optional[int]):
+    """Check connectivity, diameter and degrees of a network.yaml before deploying it"""
+    network_file = Path(network_path)
+    if network_file.is_dir():
+        network_file = network_file / NETWORK_FILE
+    _, shards = load_network_file(network_file)
+    stats = analyze_network([node for shard in shards for node in shard.nodes], seed)
+
+    table = Table(title=f"Network {network_file}", show_header=False)
+    table.add_column("Metric", style="cyan")
+    table.add_column("Value", style="green")
+    table.add_row("Tanks", str(stats["nodes"]))
+    table.add_row("Connections", str(stats["edges"]))
+    components = stats["components"]
+    table.add_row(
+        "Connected",
+        "yes" if stats["connected"] else f"[red]no: {len(components)} components {components[:5]}",
+    )
+    if stats["diameter"] is not None:
+        diameter = str(stats["diameter"]) + ("" if stats["diameter_exact"] else " (estimate)")
+        table.add_row("Diameter", diameter)
+    degree = stats["degree"]
+    table.add_row(
+        "Degree min/median/mean/max",
+        f"{degree['min']} / {degree['median']} / {degree['mean']:.2f} / {degree['max']}",
+    )
+    hops = stats["propagation_hops"]
+    if hops:
+        table.add_row(
+            "Propagation hops to 50% / 90% / 100%",
+            f"{hops['p50']:.1f} / {hops['p90']:.1f} / {hops['p100']:.1f}",
+        )
+        table.add_row("Mean hops between tanks", f"{hops['mean']:.2f}")
+    Console().print(table)
+
+    histogram = Table(title="Degree distribution", show_header=True)
+    histogram.add_column("Count", style="cyan")
+    histogram.add_column("Tanks with this many connections", style="green")
+    histogram.add_column("Tanks with this many addnode peers", style="green")
+    for value in sorted(set(stats["degree_histogram"]) | set(stats["out_degree_histogram"])):
+        histogram.add_row(
+            str(value),
+            str(stats["degree_histogram"].get(value, 0)),
+            str(stats["out_degree_histogram"].get(value, 0)),
+        )
+    Console().print(histogram)
+
+    over_limit = stats["over_addnode_limit"]
+    if over_limit:
+        examples = ", ".join(f"{name} ({count})" for name, count in list(over_limit.items())[:10])
+        print(
+            f"[yellow]{len(over_limit)} tanks have more than {MAX_ADDNODE_CONNECTIONS} addnode "
+            f"entries, bitcoind only connects to the first {MAX_ADDNODE_CONNECTIONS}: {examples}"
+        )
+    if stats["unknown_peers"]:
+        print(
+            f"[yellow]{len(stats['unknown_peers'])} addnode peers are not tanks in this network: "
+            f"{', '.join(stats['unknown_peers'][:10])}"
+        )
+    if not stats["connected"]:
+        sys.exit(1)
+
+
 @click.command()
 def create():
     """Create a new warnet network"""
@@ -314,68 +565,233 @@ def create():
 @click.command()
 @click.argument("graph_file_path", type=click.Path(exists=True, file_okay=True, dir_okay=False))
 @click.argument("output_path", type=click.Path(exists=False, file_okay=False, dir_okay=True))
-def import_network(graph_file_path: str, output_path: str):
+@click.option("--top", type=int, default=None, help="Keep the N nodes with the most capacity")
+@click.option(
+    "--k-core", "k_core", type=int, default=None, help="Keep the k-core (nodes with >= k channels)"
+)
+@click.option(
+    "--random-subgraph",
+    type=int,
+    default=None,
+    help="Keep a random connected subgraph of N nodes",
+)
+@click.option("--seed", type=int, default=None, help="Random seed for --random-subgraph")
+def import_network(
+    graph_file_path: str,
+    output_path: str,
+    top: Optional[int],
+    k_core: Optional[int],
+    random_subgraph: Optional[int],
+    seed: Optional[int],
+):
     """Create a network from an imported lightning network graph JSON"""
-    print(_import_network(graph_file_path, output_path))
+    print(_import_network(graph_file_path, output_path, top, k_core, random_subgraph, seed))
+
+
+graph.add_command(import_network)
 
 
-def _import_network(graph_file_path, output_path):
+def iter_json_arrays(f, chunk_size: int = 1 << 20) -> Iterator[tuple[str, object]]:
+    """
+    Yield (key, item) for every item of every array in the top level JSON object read
+    from `f`, without loading the whole document. Non-array values yield (key, value).
+    """
+    decoder = json.JSONDecoder()
+    buf = ""
+    pos = 0
+    eof = False
+
+    def fill() -> bool:
+        nonlocal buf, pos, eof
+        if eof:
+            return False
+        chunk = f.read(chunk_size)
+        if not chunk:
+            eof = True
+            return False
+        buf = buf[pos:] + chunk
+        pos = 0
+        return True
+
+    def skip(chars: str = " \t\r\n") -> str:
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in chars:
+                pos += 1
+            if pos < len(buf) or not fill():
+                return buf[pos] if pos < len(buf) else ""
+
+    def decode():
+        nonlocal pos
+        while True:
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+                # A number cut by the end of the buffer ("2." of "2.5") still parses, so
+                # only accept values followed by a delimiter
+                if eof or (end < len(buf) and buf[end] in ",:]} \t\r\n"):
+                    pos = end
+                    return value
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            if not fill():
+                value, pos = decoder.raw_decode(buf, pos)
+                return value
+
+    if skip() != "{":
+        raise ValueError("Expected a JSON object")
+    pos += 1
+    while skip(" \t\r\n,") not in ("}", ""):
+        key = decode()
+        skip()
+        pos += 1  # ":"
+        if skip() == "[":
+            pos += 1
+            while skip(" \t\r\n,") not in ("]", ""):
+                yield key, decode()
+            pos += 1
+        else:
+            yield key, decode()
+
+
+def k_core_nodes(nodes: set, edges: list[tuple], k: int) -> set:
+    """Repeatedly drop nodes with fewer than k channels, in O(V + E)"""
+    adjacency = {node: [] for node in nodes}
+    for edge in edges:
+        adjacency[edge[1]].append(edge[2])
+        adjacency[edge[2]].append(edge[1])
+    degree = {node: len(peers) for node, peers in adjacency.items()}
+    removed = set()
+    queue = [node for node, d in degree.items() if d < k]
+    while queue:
+        node = queue.pop()
+        if node in removed:
+            continue
+        removed.add(node)
+        for peer in adjacency[node]:
+            degree[peer] -= 1
+            if degree[peer] < k and peer not in removed:
+                queue.append(peer)
+    return nodes - removed
+
+
+def random_connected_nodes(nodes: set, edges: list[tuple], size: int, rng: random.Random) -> set:
+    """Grow a connected set of `size` nodes from a random start, adding random frontier nodes"""
+    adjacency = {node: [] for node in nodes}
+    for edge in edges:
+        adjacency[edge[1]].append(edge[2])
+        adjacency[edge[2]].append(edge[1])
+    # Start inside the largest part of the graph: from a random node that has channels
+    candidates = sorted(node for node, peers in adjacency.items() if peers) or sorted(nodes)
+    if not candidates:
+        return set()
+    start = rng.choice(candidates)
+    selected = {start}
+    frontier = list(adjacency[start])
+    while frontier and len(selected) < size:
+        i = rng.randrange(len(frontier))
+        frontier[i], frontier[-1] = frontier[-1], frontier[i]
+        node = frontier.pop()
+        if node in selected:
+            continue
+        selected.add(node)
+        frontier.extend(peer for peer in adjacency[node] if peer not in selected)
+    return selected
+
+
+def _import_network(
+    graph_file_path,
+    output_path,
+    top: Optional[int] = None,
+    k_core: Optional[int] = None,
+    random_subgraph: Optional[int] = None,
+    seed: Optional[int] = None,
+):
     output_path = Path(output_path)
     graph_file_path = Path(graph_file_path).resolve()
+
+    # Stream the describegraph JSON, keeping node keys in file order and a compact
+    # tuple per channel instead of the full JSON objects
+    pubkeys = []
+    edges = []
     with open(graph_file_path) as graph_file:
-        graph = json.loads(graph_file.read())
+        for key, item in iter_json_arrays(graph_file):
+            if key == "nodes":
+                pubkeys.append(item["pub_key"])
+            elif key == "edges":
+                edges.append(
+                    (
+                        int(item["channel_id"]),
+                        item["node1_pub"],
+                        item["node2_pub"],
+                        int(item["capacity"]),
+                        Policy.from_lnd_describegraph(item["node1_policy"]).to_dict(),
+                        Policy.from_lnd_describegraph(item["node2_policy"]).to_dict(),
+                    )
+                )
+    print(f"Read {len(pubkeys)} nodes and {len(edges)} channels")
+
+    selected = set(pubkeys)
+    if top is not None:
+        capacity = dict.fromkeys(selected, 0)
+        for edge in edges:
+            capacity[edge[1]] += edge[3]
+            capacity[edge[2]] += edge[3]
+        selected = set(sorted(capacity, key=lambda pk: capacity[pk], reverse=True)[:top])
+        edges = [e for e in edges if e[1] in selected and e[2] in selected]
+    if k_core is not None:
+        selected = k_core_nodes(selected, edges, k_core)
+        edges = [e for e in edges if e[1] in selected and e[2] in selected]
+    if random_subgraph is not None:
+        selected = random_connected_nodes(selected, edges, random_subgraph, random.Random(seed))
+        edges = [e for e in edges if e[1] in selected and e[2] in selected]
 
-    tanks = {}
     pk_to_tank = {}
-    tank_to_pk = {}
-    index = 0
-    for node in graph["nodes"]:
-        tank = f"tank-{index:04d}"
-        pk_to_tank[node["pub_key"]] = tank
-        tank_to_pk[tank] = node["pub_key"]
-        tanks[tank] = {"name": tank, "ln": {"lnd": True}, "lnd": {"channels": []}}
-        index += 1
-    print(f"Imported {index} nodes")
-
-    sorted_edges = sorted(graph["edges"], key=lambda x: int(x["channel_id"]))
+    for pk in pubkeys:
+        if pk in selected:
+            pk_to_tank[pk] = tank_name(len(pk_to_tank))
+    print(f"Imported {len(pk_to_tank)} nodes")
 
+    edges.sort(key=lambda e: e[0])
+    channels = {tank: [] for tank in pk_to_tank.values()}
     # By default we start including channel open txs in block 300
     block = 300
     # Coinbase occupies the 0 position!
     index = 1
-    count = 0
-    for edge in sorted_edges:
-        source = pk_to_tank[edge["node1_pub"]]
-        channel = {
-            "id": {"block": block, "index": index},
-            "target": pk_to_tank[edge["node2_pub"]] + "-ln",
-            "capacity": int(edge["capacity"]),
-            "push_amt": int(edge["capacity"]) // 2,
-            "source_policy": Policy.from_lnd_describegraph(edge["node1_policy"]).to_dict(),
-            "target_policy": Policy.from_lnd_describegraph(edge["node2_policy"]).to_dict(),
-        }
-        tanks[source]["lnd"]["channels"].append(channel)
+    for _, node1, node2, capacity, source_policy, target_policy in edges:
+        channels[pk_to_tank[node1]].append(
+            {
+                "id": {"block": block, "index": index},
+                "target": pk_to_tank[node2] + "-ln",
+                "capacity": capacity,
+                "push_amt": capacity // 2,
+                "source_policy": source_policy,
+                "target_policy": target_policy,
+            }
+        )
         index += 1
         if index > 1000:
             index = 1
             block += 1
-        count += 1
-
-    print(f"Imported {count} channels")
-
-    network = {"nodes": []}
-    prev_node_name = list(tanks.keys())[-1]
-    for name, obj in tanks.items():
-        obj["name"] = name
-        obj["addnode"] = [prev_node_name]
-        prev_node_name = name
-        network["nodes"].append(obj)
+    print(f"Imported {len(edges)} channels")
 
+    tanks = list(channels.keys())
     output_path.mkdir(parents=True, exist_ok=True)
     # This file must exist and must contain at least one line of valid yaml
     with open(output_path / "node-defaults.yaml", "w") as f:
         f.write(f"imported_from: {graph_file_path}\n")
     # Here's the good stuff
-    with open(output_path / "network.yaml", "w") as f:
-        f.write(yaml.dump(network, sort_keys=False))
+    write_network_yaml(
+        output_path / "network.yaml",
+        (
+            {
+                "name": name,
+                "ln": {"lnd": True},
+                "lnd": {"channels": channels.pop(name)},
+                "addnode": [tanks[i - 1]],
+            }
+            for i, name in enumerate(tanks)
+        ),
+        sort_keys=False,
+    )
     return f"Network created in {output_path.resolve()}"
@@ -1,3 +1,4 @@
+import base64
 import json
 import os
 import sys
@@ -99,6 +100,40 @@ def get_channels(namespace: Optional[str] = None) -> any:
     return channels
 
 
+def ensure_binary_configmap(
+    name: str,
+    key: str,
+    data: bytes,
+    labels: Optional[dict[str, str]] = None,
+    namespace: Optional[str] = None,
+) -> bool:
+    """
+    Create a ConfigMap holding `data` under `key` unless it already exists.
+    Returns True if the ConfigMap was created by this call.
+    """
+    namespace = get_default_namespace_or(namespace)
+    sclient = get_static_client()
+    try:
+        sclient.read_namespaced_config_map(name=name, namespace=namespace)
+        return False
+    except ApiException as e:
+        if e.status != 404:
+            raise e
+
+    body = client.V1ConfigMap(
+        metadata=client.V1ObjectMeta(name=name, labels=labels),
+        binary_data={key: base64.b64encode(data).decode("utf-8")},
+    )
+    try:
+        sclient.create_namespaced_config_map(namespace=namespace, body=body)
+    except ApiException as e:
+        # Another `warnet run` may have uploaded the same content concurrently
+        if e.status != 409:
+            raise e
+        return False
+    return True
+
+
 def create_kubernetes_object(
     kind: str, metadata: dict[str, any], spec: dict[str, any] = None
 ) -> dict[str, any]:
@@ -142,6 +177,11 @@ def apply_kubernetes_yaml_obj(yaml_obj: str) -> None:
         Path(temp_file_path).unlink()
 
 
+def ensure_namespace(namespace: str) -> bool:
+    command = f"kubectl create namespace {namespace} --dry-run=client -o yaml | kubectl apply -f -"
+    return run_command(command)
+
+
 def delete_namespace(namespace: str) -> bool:
     command = f"kubectl delete namespace {namespace} --ignore-not-found"
     return run_command(command)
@@ -348,7 +388,13 @@ def get_ingress_ip_or_host():
 
 
 def pod_log(
-    pod_name, container_name=None, follow=False, namespace: Optional[str] = None, tail_lines=None
+    pod_name,
+    container_name=None,
+    follow=False,
+    namespace: Optional[str] = None,
+    tail_lines=None,
+    since_seconds=None,
+    timestamps=False,
 ):
     namespace = get_default_namespace_or(namespace)
     sclient = get_static_client()
@@ -361,11 +407,24 @@ def pod_log(
             follow=follow,
             _preload_content=False,
             tail_lines=tail_lines,
+            since_seconds=since_seconds,
+            timestamps=timestamps,
         )
     except ApiException as e:
         raise Exception(json.loads(e.body.decode("utf-8"))["message"]) from None
 
 
+def watch_pods(label_selector: str, namespace: Optional[str] = None):
+    """Yield (event type, pod) for every current and future pod matching `label_selector`"""
+    namespace = get_default_namespace_or(namespace)
+    sclient = get_static_client()
+    w = watch.Watch()
+    for event in w.stream(
+        sclient.list_namespaced_pod, namespace=namespace, label_selector=label_selector
+    ):
+        yield event["type"], event["object"]
+
+
 def wait_for_pod(pod_name, timeout_seconds=10, namespace: Optional[str] = None):
     namespace = get_default_namespace_or(namespace)
     sclient = get_static_client()
@@ -0,0 +1,248 @@
+"""
+Incremental, compressed archive of container logs for post-run analysis.
+
+Layout of an archive directory:
+
+    <archive>/<namespace>/<pod>/<container>/
+        segment-000001.log.gz   concatenated gzip members, one per block of lines
+        index.jsonl             one entry per block: segment, byte offset, length,
+                                first/last timestamp and line count
+        state.json              pod uid and last archived timestamp
+
+Every block is an independent gzip member, so a time range query reads the index,
+seeks to the matching blocks and decompresses only those.
+"""
+
+import json
+import os
+import re
+import zlib
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+from kubernetes.client.models import V1Pod
+
+from .k8s import get_default_namespace_or, get_static_client, pod_log
+
+ARCHIVE_SELECTOR = "mission in (tank,commander,lightning)"
+BLOCK_MAX_LINES = 4096
+BLOCK_MAX_BYTES = 1024 * 1024
+SEGMENT_MAX_BYTES = 64 * 1024 * 1024
+INDEX_FILE = "index.jsonl"
+STATE_FILE = "state.json"
+
+
+def parse_k8s_timestamp(timestamp: str) -> float:
+    """Convert an RFC3339Nano timestamp as prefixed by the kubelet into epoch seconds"""
+    date, _, fraction = timestamp.rstrip("Z").partition(".")
+    seconds = datetime.fromisoformat(date).replace(tzinfo=timezone.utc).timestamp()
+    return seconds + float(f"0.{fraction}") if fraction else seconds
+
+
+def parse_time_arg(value: str) -> float:
+    """Accept an ISO-8601 date/time (UTC unless an offset is given) or epoch seconds"""
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parsed = datetime.fromisoformat(value.rstrip("Z"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+@dataclass
+class BlockEntry:
+    segment: str
+    offset: int
+    length: int
+    start: float
+    end: float
+    lines: int
+
+
+class ContainerArchive:
+    """Append-only segment files and block index for one container"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.state = self._load_state()
+
+    def _load_state(self) -> dict:
+        state_file = self.path / STATE_FILE
+        if state_file.exists():
+            with open(state_file) as f:
+                return json.load(f)
+        return {"uid": None, "last_timestamp": None, "segment": 1}
+
+    def save_state(self):
+        tmp = self.path / f"{STATE_FILE}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.state, f)
+        os.replace(tmp, self.path / STATE_FILE)
+
+    def _segment_path(self) -> Path:
+        return self.path / f"segment-{self.state['segment']:06d}.log.gz"
+
+    def blocks(self) -> list[BlockEntry]:
+        index_file = self.path / INDEX_FILE
+        if not index_file.exists():
+            return []
+        with open(index_file) as f:
+            return [BlockEntry(**json.loads(line)) for line in f if line.strip()]
+
+    def write_block(self, lines: list[bytes], start: float, end: float):
+        segment = self._segment_path()
+        if segment.exists() and segment.stat().st_size >= SEGMENT_MAX_BYTES:
+            self.state["segment"] += 1
+            segment = self._segment_path()
+        compressor = zlib.compressobj(wbits=31)
+        data = compressor.compress(b"".join(lines)) + compressor.flush()
+        with open(segment, "ab") as f:
+            offset = f.tell()
+            f.write(data)
+        entry = BlockEntry(segment.name, offset, len(data), start, end, len(lines))
+        with open(self.path / INDEX_FILE, "a") as f:
+            f.write(json.dumps(entry.__dict__) + "\n")
+
+    def read_block(self, entry: BlockEntry) -> list[str]:
+        with open(self.path / entry.segment, "rb") as f:
+            f.seek(entry.offset)
+            data = f.read(entry.length)
+        return zlib.decompress(data, wbits=31).decode("utf-8", errors="replace").splitlines()
+
+
+def collect_container(
+    pod: V1Pod, container: str, archive_dir: Path, namespace: str
+) -> tuple[str, int]:
+    """Append log lines newer than the last archived timestamp, return (name, new lines)"""
+    name = f"{pod.metadata.name}/{container}"
+    archive = ContainerArchive(archive_dir / namespace / pod.metadata.name / container)
+    last_timestamp = None
+    since_seconds = None
+    if archive.state["uid"] == pod.metadata.uid and archive.state["last_timestamp"]:
+        last_timestamp = archive.state["last_timestamp"]
+        # since_seconds has one second granularity, overlap and drop what we already have
+        since_seconds = max(1, int(datetime.now(timezone.utc).timestamp() - last_timestamp) + 2)
+    archive.state["uid"] = pod.metadata.uid
+
+    stream = pod_log(
+        pod.metadata.name,
+        container_name=container,
+        namespace=namespace,
+        since_seconds=since_seconds,
+        timestamps=True,
+    )
+    block: list[bytes] = []
+    block_bytes = 0
+    block_start = block_end = None
+    written = 0
+
+    def flush():
+        nonlocal block, block_bytes, written
+        if block:
+            archive.write_block(block, block_start, block_end)
+            archive.state["last_timestamp"] = block_end
+            archive.save_state()
+            written += len(block)
+        block = []
+        block_bytes = 0
+
+    for line in stream:
+        try:
+            timestamp = parse_k8s_timestamp(line.split(b" ", 1)[0].decode())
+        except ValueError:
+            # Continuation of a line split by the stream reader, keep it with its block
+            if block:
+                block.append(line)
+            continue
+        if last_timestamp is not None and timestamp <= last_timestamp:
+            continue
+        if not block:
+            block_start = timestamp
+        block_end = timestamp
+        block.append(line if line.endswith(b"\n") else line + b"\n")
+        block_bytes += len(line)
+        if len(block) >= BLOCK_MAX_LINES or block_bytes >= BLOCK_MAX_BYTES:
+            flush()
+    flush()
+    archive.save_state()
+    return name, written
+
+
+def collect_archive(
+    archive_dir: str,
+    namespace: Optional[str] = None,
+    selector: str = ARCHIVE_SELECTOR,
+    parallelism: int = 16,
+):
+    """Incrementally archive the logs of every container of every pod matching `selector`"""
+    namespace = get_default_namespace_or(namespace)
+    sclient = get_static_client()
+    pods = sclient.list_namespaced_pod(namespace=namespace, label_selector=selector).items
+    jobs = [
+        (pod, container.name)
+        for pod in pods
+        if pod.status.phase in ("Running", "Succeeded", "Failed")
+        for container in pod.spec.containers
+    ]
+    if not jobs:
+        print(f"No pods match selector '{selector}' in namespace {namespace}")
+        return
+
+    def collect(job):
+        pod, container = job
+        try:
+            return collect_container(pod, container, Path(archive_dir), namespace)
+        except Exception as e:
+            return f"{pod.metadata.name}/{container}", e
+
+    total = 0
+    with ThreadPoolExecutor(max_workers=parallelism) as executor:
+        for name, result in executor.map(collect, jobs):
+            if isinstance(result, Exception):
+                print(f"Error archiving {name}: {result}")
+            else:
+                total += result
+    print(f"Archived {total} new log lines from {len(jobs)} containers to {archive_dir}")
+
+
+def search_archive(
+    archive_dir: str,
+    pattern: Optional[str] = None,
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+    pod_name: str = "",
+) -> Iterator[tuple[str, str]]:
+    """
+    Yield (pod/container, line) from an archive, restricted to [start, end] and lines
+    matching `pattern`. Blocks outside the time range are skipped using the index.
+    """
+    regex = re.compile(pattern) if pattern else None
+    for index_file in sorted(Path(archive_dir).glob(f"*/*/*/{INDEX_FILE}")):
+        container_dir = index_file.parent
+        pod, container = container_dir.parent.name, container_dir.name
+        if pod_name and pod != pod_name:
+            continue
+        archive = ContainerArchive(container_dir)
+        for entry in archive.blocks():
+            if (start is not None and entry.end < start) or (end is not None and entry.start > end):
+                continue
+            for line in archive.read_block(entry):
+                if start is not None or end is not None:
+                    try:
+                        timestamp = parse_k8s_timestamp(line.split(" ", 1)[0])
+                    except ValueError:
+                        continue
+                    if (start is not None and timestamp < start) or (
+                        end is not None and timestamp > end
+                    ):
+                        continue
+                if regex and not regex.search(line):
+                    continue
+                yield f"{pod}/{container}", line
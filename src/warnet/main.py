@@ -1,19 +1,99 @@
+import importlib
+from typing import Optional
+
 import click
 
-from .admin import admin
-from .bitcoin import bitcoin
-from .control import down, logs, run, snapshot, stop
-from .dashboard import dashboard
-from .deploy import deploy
-from .graph import create, graph, import_network
-from .image import image
-from .ln import ln
-from .project import init, new, setup
-from .status import status
-from .users import auth
+# name: (module, attribute, short help, hidden)
+# Subcommand modules pull in kubernetes, inquirer, rich and the test framework, so they are
+# only imported when their command is invoked. The short help is kept here so that
+# `warnet --help` can list commands without importing anything.
+LAZY_COMMANDS = {
+    "admin": ("admin", "admin", "Admin commands for warnet project management", True),
+    "auth": (
+        "users",
+        "auth",
+        "Authenticate with a Warnet cluster using a kubernetes config file",
+        False,
+    ),
+    "bitcoin": ("bitcoin", "bitcoin", "Control running bitcoin nodes", False),
+    "create": ("graph", "create", "Create a new warnet network", False),
+    "dashboard": ("dashboard", "dashboard", "Open the Warnet dashboard in default browser", False),
+    "deploy": ("deploy", "deploy", "Deploy a warnet with topology loaded from <directory>", False),
+    "down": ("control", "down", "Bring down a running warnet quickly", False),
+    "graph": ("graph", "graph", "Create and validate network graphs", False),
+    "image": ("image", "image", "Build a custom Warnet Bitcoin Core image", False),
+    "import-network": (
+        "graph",
+        "import_network",
+        "Create a network from an imported lightning network graph JSON",
+        False,
+    ),
+    "init": ("project", "init", "Initialize a warnet project in the current directory", False),
+    "ln": ("ln", "ln", "Control running lightning nodes", False),
+    "logs": (
+        "control",
+        "logs",
+        "Show the logs of a pod, or of all pods matching --selector",
+        False,
+    ),
+    "new": ("project", "new", "Create a new warnet project in the specified directory", False),
+    "pool": (
+        "control",
+        "pool",
+        "Keep a pool of idle, pre-started commanders for fast scenario launch.",
+        False,
+    ),
+    "run": ("control", "run", "Run a scenario from a file.", False),
+    "setup": ("project", "setup", "Setup warnet", False),
+    "snapshot": (
+        "control",
+        "snapshot",
+        "Create a snapshot of a tank's Bitcoin data or snapshot all tanks",
+        False,
+    ),
+    "status": (
+        "status",
+        "status",
+        "Display the unified status of the Warnet network and active scenarios",
+        False,
+    ),
+    "stop": ("control", "stop", "Stop a running scenario or all scenarios", False),
+}
+
+
+class LazyGroup(click.Group):
+    """A click group that imports the module of a subcommand only when it is needed"""
+
+    def list_commands(self, ctx: click.Context) -> list[str]:
+        return sorted(set(super().list_commands(ctx)) | set(LAZY_COMMANDS))
+
+    def get_command(self, ctx: click.Context, cmd_name: str) -> Optional[click.Command]:
+        if cmd_name in self.commands or cmd_name not in LAZY_COMMANDS:
+            return super().get_command(ctx, cmd_name)
+        module_name, attribute, _, _ = LAZY_COMMANDS[cmd_name]
+        module = importlib.import_module(f".{module_name}", __package__)
+        command = getattr(module, attribute)
+        self.add_command(command, cmd_name)
+        return command
+
+    def format_commands(self, ctx: click.Context, formatter: click.HelpFormatter) -> None:
+        limit = formatter.width - 6 - max(len(name) for name in self.list_commands(ctx))
+        rows = []
+        for name in self.list_commands(ctx):
+            if name in LAZY_COMMANDS and name not in self.commands:
+                _, _, help, hidden = LAZY_COMMANDS[name]
+                if not hidden:
+                    rows.append((name, click.utils.make_default_short_help(help, limit)))
+                continue
+            command = self.commands[name]
+            if not command.hidden:
+                rows.append((name, command.get_short_help_str(limit)))
+        if rows:
+            with formatter.section("Commands"):
+                formatter.write_dl(rows)
 
 
-@click.group()
+@click.group(cls=LazyGroup)
 def cli():
     pass
 
@@ -61,25 +141,6 @@ def version() -> None:
         click.echo("warnet version unknown")
 
 
-cli.add_command(admin)
-cli.add_command(auth)
-cli.add_command(bitcoin)
-cli.add_command(deploy)
-cli.add_command(down)
-cli.add_command(dashboard)
-cli.add_command(graph)
-cli.add_command(import_network)
-cli.add_command(image)
-cli.add_command(init)
-cli.add_command(logs)
-cli.add_command(ln)
-cli.add_command(new)
-cli.add_command(run)
-cli.add_command(setup)
-cli.add_command(snapshot)
-cli.add_command(status)
-cli.add_command(stop)
-cli.add_command(create)
 cli.add_command(version)
 
 if __name__ == "__main__":
@@ -0,0 +1,95 @@
+import importlib.util
+import json
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+import click
+
+from .process import run_command
+
+# Maximum number of plugin entrypoints running at the same time within one hook
+PLUGIN_CONCURRENCY = 8
+# Plugin setting that opts out of in-process calls, e.g. for plugins with global state
+ISOLATED_KEY = "isolated"
+
+
+class PluginHost:
+    """
+    Imports each plugin.py once and calls its `entrypoint` click command in-process,
+    instead of starting a new python interpreter for every hook and node.
+    Plugins that cannot be imported, have no `entrypoint` command, or set
+    `isolated: true` are run as a subprocess exactly like `python plugin.py entrypoint ...`
+    would.
+    """
+
+    def __init__(self, max_workers: int = PLUGIN_CONCURRENCY):
+        self.max_workers = max_workers
+        self.groups: dict[Path, Optional[click.Group]] = {}
+        self.lock = threading.Lock()
+
+    def load(self, entrypoint: Path) -> Optional[click.Group]:
+        """Import a plugin.py and return its click group, or None to use a subprocess"""
+        entrypoint = entrypoint.resolve()
+        with self.lock:
+            if entrypoint in self.groups:
+                return self.groups[entrypoint]
+            group = None
+            try:
+                # Like running the script: sibling modules of plugin.py are importable
+                if str(entrypoint.parent) not in sys.path:
+                    sys.path.insert(0, str(entrypoint.parent))
+                module_name = f"warnet_plugin_{entrypoint.parent.name}_{len(self.groups)}"
+                spec = importlib.util.spec_from_file_location(module_name, entrypoint)
+                module = importlib.util.module_from_spec(spec)
+                spec.loader.exec_module(module)
+                group = next(
+                    (
+                        obj
+                        for obj in vars(module).values()
+                        if isinstance(obj, click.Group) and "entrypoint" in obj.commands
+                    ),
+                    None,
+                )
+            except Exception as e:
+                print(f"Could not import plugin {entrypoint}, running it as a subprocess: {e}")
+            self.groups[entrypoint] = group
+            return group
+
+    def call(self, entrypoint: Path, plugin_content: dict, warnet_content: dict) -> bool:
+        args = ["entrypoint", json.dumps(plugin_content), json.dumps(warnet_content)]
+        group = None if is_isolated(plugin_content) else self.load(entrypoint)
+        if group is None:
+            cmd = f"{sys.executable} {entrypoint} " + " ".join(f"'{arg}'" for arg in args)
+            try:
+                run_command(cmd)
+                return True
+            except Exception as e:
+                print(f"Plugin {entrypoint} failed: {e}")
+                return False
+        try:
+            group.main(args=args, prog_name=entrypoint.parent.name, standalone_mode=False)
+            return True
+        except SystemExit as e:
+            return e.code in (None, 0)
+        except Exception as e:
+            print(f"Plugin {entrypoint} failed: {e}")
+            return False
+
+    def run(self, calls: list[tuple[Path, dict, dict]]) -> list[bool]:
+        """Call many plugin entrypoints with bounded concurrency"""
+        if len(calls) == 1:
+            return [self.call(*calls[0])]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(lambda call: self.call(*call), calls))
+
+
+def is_isolated(plugin_content: dict) -> bool:
+    """Whether a plugin asked to always run in its own python process"""
+    return plugin_content.get(ISOLATED_KEY) is True
+
+
+# Shared by all deploy steps, and inherited by forked node processes with plugins loaded
+plugin_host = PluginHost()
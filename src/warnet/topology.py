@@ -0,0 +1,322 @@
+"""
+Topology generators for `warnet graph create` and analysis for `warnet graph analyze`.
+
+Every generator takes the node count `n`, the number of outbound connections per
+node `k` and a seeded `random.Random`, and yields `(index, [targets])` in index order
+so the caller can write network.yaml while the graph is still being generated.
+Each node's targets are picked in O(k) expected time, so a whole graph costs O(n·k).
+
+Edges are directed A -> B (A runs `addnode=B`). Self loops, duplicate edges and
+two-node loops A -> B -> A are never generated.
+
+Analysis treats connections as undirected, since a P2P connection relays both ways.
+"""
+
+import random
+from array import array
+from collections import Counter
+from collections.abc import Iterator
+from typing import Optional
+
+TopologyIterator = Iterator[tuple[int, list[int]]]
+
+
+class Edges:
+    """Outbound adjacency sets, used to reject duplicate and reverse edges"""
+
+    def __init__(self, n: int):
+        self.out: list[set[int]] = [set() for _ in range(n)]
+
+    def can_add(self, src: int, dst: int) -> bool:
+        return src != dst and dst not in self.out[src] and src not in self.out[dst]
+
+    def add(self, src: int, dst: int) -> bool:
+        if not self.can_add(src, dst):
+            return False
+        self.out[src].add(dst)
+        return True
+
+
+def sample_targets(
+    edges: Edges, src: int, want: int, population: int, rng: random.Random, pick=None
+) -> None:
+    """
+    Add up to `want` outbound edges from `src` to nodes drawn by `pick()`
+    (uniform over the whole population by default).
+    Rejection sampling is O(want) expected while the population is large compared to
+    `want`; small populations are shuffled and scanned instead.
+    """
+    if want <= 0:
+        return
+    if pick is None and population <= 4 * want + 8:
+        candidates = list(range(population))
+        rng.shuffle(candidates)
+        for dst in candidates:
+            if want == 0:
+                break
+            if edges.add(src, dst):
+                want -= 1
+        return
+    pick = pick or (lambda: rng.randrange(population))
+    attempts = 0
+    while want > 0 and attempts < 20 * want + 20:
+        attempts += 1
+        if edges.add(src, pick()):
+            want -= 1
+
+
+def k_out(
+    n: int, k: int, rng: random.Random, degrees: Optional[list[int]] = None
+) -> TopologyIterator:
+    """
+    Random k-out graph: every node connects to the next node in a ring (which keeps
+    the network connected) plus k - 1 uniformly random peers.
+    `degrees` optionally overrides k per node.
+    """
+    edges = Edges(n)
+    for i in range(n):
+        degree = degrees[i] if degrees else k
+        if degree > 0 and n > 1:
+            edges.add(i, (i + 1) % n)
+            sample_targets(edges, i, degree - len(edges.out[i]), n, rng)
+        yield i, sorted(edges.out[i])
+
+
+def barabasi_albert(n: int, k: int, rng: random.Random) -> TopologyIterator:
+    """
+    Barabási–Albert scale-free graph: each new node connects to k existing nodes
+    chosen with probability proportional to their degree (preferential attachment).
+    The first k + 1 nodes form a ring.
+    """
+    edges = Edges(n)
+    seed_size = min(n, k + 1)
+    # Every edge endpoint appears once, so a uniform pick from this list is degree-weighted
+    endpoints: list[int] = []
+    for i in range(n):
+        if i < seed_size:
+            if seed_size > 1 and edges.add(i, (i + 1) % seed_size):
+                endpoints += [i, (i + 1) % seed_size]
+        else:
+            sample_targets(edges, i, k, n, rng, pick=lambda e=endpoints: e[rng.randrange(len(e))])
+            for dst in edges.out[i]:
+                endpoints += [i, dst]
+        yield i, sorted(edges.out[i])
+
+
+def watts_strogatz(n: int, k: int, rng: random.Random, rewire: float = 0.1) -> TopologyIterator:
+    """
+    Watts–Strogatz small-world graph: a ring lattice where every node connects to
+    its k successors, then each lattice edge except the one to the immediate
+    successor is rewired to a uniformly random node with probability `rewire`.
+    """
+    edges = Edges(n)
+    for i in range(n):
+        if n > 1:
+            edges.add(i, (i + 1) % n)
+        rewired = 0
+        for j in range(2, k + 1):
+            if rng.random() < rewire or not edges.add(i, (i + j) % n):
+                rewired += 1
+        sample_targets(edges, i, rewired, n, rng)
+        yield i, sorted(edges.out[i])
+
+
+def geographic(
+    n: int, k: int, rng: random.Random, clusters: int = 8, locality: float = 0.8
+) -> TopologyIterator:
+    """
+    Clustered graph approximating geographic regions or autonomous systems: nodes are
+    split into `clusters` contiguous groups, and each connection stays inside the
+    node's own group with probability `locality`. A ring over all nodes links the
+    groups together.
+    """
+    clusters = max(1, min(clusters, n))
+    size = -(-n // clusters)
+    edges = Edges(n)
+
+    for i in range(n):
+        first = (i // size) * size
+        last = min(first + size, n)
+
+        def pick(first=first, last=last):
+            if rng.random() < locality:
+                return rng.randrange(first, last)
+            return rng.randrange(n)
+
+        if n > 1:
+            edges.add(i, (i + 1) % n)
+        sample_targets(edges, i, k - len(edges.out[i]), n, rng, pick=pick)
+        yield i, sorted(edges.out[i])
+
+
+TOPOLOGIES = {
+    "k-out": k_out,
+    "barabasi-albert": barabasi_albert,
+    "watts-strogatz": watts_strogatz,
+    "geographic": geographic,
+}
+
+
+# Bitcoin Core makes at most this many connections from -addnode entries
+MAX_ADDNODE_CONNECTIONS = 8
+
+
+class CSRGraph:
+    """
+    Undirected graph in compressed sparse row form: the neighbours of node i are
+    targets[offsets[i]:offsets[i + 1]]. Two flat integer arrays keep 10k+ node graphs
+    small and fast to traverse.
+    """
+
+    def __init__(self, n: int, edges: list[tuple[int, int]]):
+        self.n = n
+        degree = array("l", [0]) * n
+        for a, b in edges:
+            degree[a] += 1
+            degree[b] += 1
+        self.offsets = array("l", [0]) * (n + 1)
+        for i in range(n):
+            self.offsets[i + 1] = self.offsets[i] + degree[i]
+        self.targets = array("l", [0]) * self.offsets[n]
+        fill = array("l", self.offsets[:n])
+        for a, b in edges:
+            self.targets[fill[a]] = b
+            fill[a] += 1
+            self.targets[fill[b]] = a
+            fill[b] += 1
+
+    def degree(self, i: int) -> int:
+        return self.offsets[i + 1] - self.offsets[i]
+
+    def bfs(self, source: int) -> array:
+        """Hop distance from `source` to every node, -1 where unreachable"""
+        dist = array("l", [-1]) * self.n
+        dist[source] = 0
+        frontier = [source]
+        offsets, targets = self.offsets, self.targets
+        while frontier:
+            next_frontier = []
+            for node in frontier:
+                hops = dist[node] + 1
+                for j in range(offsets[node], offsets[node + 1]):
+                    peer = targets[j]
+                    if dist[peer] < 0:
+                        dist[peer] = hops
+                        next_frontier.append(peer)
+            frontier = next_frontier
+        return dist
+
+    def components(self) -> list[int]:
+        """Sizes of the connected components, largest first"""
+        seen = bytearray(self.n)
+        sizes = []
+        for start in range(self.n):
+            if seen[start]:
+                continue
+            seen[start] = 1
+            stack = [start]
+            size = 0
+            while stack:
+                node = stack.pop()
+                size += 1
+                for j in range(self.offsets[node], self.offsets[node + 1]):
+                    peer = self.targets[j]
+                    if not seen[peer]:
+                        seen[peer] = 1
+                        stack.append(peer)
+            sizes.append(size)
+        return sorted(sizes, reverse=True)
+
+    def diameter(
+        self, rng: random.Random, exact_limit: int = 1000, sweeps: int = 4
+    ) -> tuple[int, bool]:
+        """
+        Return (diameter, exact). Small graphs get an exact all-pairs BFS. Larger ones get
+        the double sweep lower bound (BFS from the farthest node found so far), which is
+        usually exact on real-world graphs.
+        """
+        if self.n == 0:
+            return 0, True
+        if self.n <= exact_limit:
+            return max(max(self.bfs(i)) for i in range(self.n)), True
+        best = 0
+        source = rng.randrange(self.n)
+        for _ in range(sweeps):
+            dist = self.bfs(source)
+            far = max(range(self.n), key=dist.__getitem__)
+            if dist[far] <= best:
+                source = rng.randrange(self.n)
+                continue
+            best = dist[far]
+            source = far
+        return best, False
+
+
+def propagation_hops(graph: CSRGraph, rng: random.Random, samples: int = 32) -> dict:
+    """
+    Estimate how many hops a broadcast (tx or block) from a random node takes to reach
+    50%, 90% and 100% of the reachable nodes, averaged over `samples` sources
+    """
+    if graph.n == 0:
+        return {}
+    totals = {"p50": 0.0, "p90": 0.0, "p100": 0.0, "mean": 0.0}
+    sources = [rng.randrange(graph.n) for _ in range(min(samples, graph.n))]
+    for source in sources:
+        hops = sorted(d for d in graph.bfs(source) if d >= 0)
+        totals["p50"] += hops[(len(hops) - 1) // 2]
+        totals["p90"] += hops[int((len(hops) - 1) * 0.9)]
+        totals["p100"] += hops[-1]
+        totals["mean"] += sum(hops) / len(hops)
+    return {key: value / len(sources) for key, value in totals.items()}
+
+
+def analyze_network(nodes: list[dict], seed: Optional[int] = None) -> dict:
+    """
+    Analyze the addnode topology of the `nodes` list from network.yaml. Only the first
+    MAX_ADDNODE_CONNECTIONS entries of each addnode list count as edges, because that is
+    all bitcoind will connect to.
+    """
+    rng = random.Random(seed)
+    index = {node["name"]: i for i, node in enumerate(nodes)}
+    edges = []
+    over_limit = {}
+    unknown = set()
+    out_degree = []
+    for i, node in enumerate(nodes):
+        addnode = node.get("addnode") or []
+        if len(addnode) > MAX_ADDNODE_CONNECTIONS:
+            over_limit[node["name"]] = len(addnode)
+        used = 0
+        for peer in addnode[:MAX_ADDNODE_CONNECTIONS]:
+            # Peers may be given as <tank> or <tank>.<namespace>
+            j = index.get(peer, index.get(peer.split(".")[0]))
+            if j is None:
+                unknown.add(peer)
+            elif j != i:
+                edges.append((i, j))
+                used += 1
+        out_degree.append(used)
+
+    graph = CSRGraph(len(nodes), edges)
+    components = graph.components()
+    degrees = sorted(graph.degree(i) for i in range(graph.n))
+    diameter, exact = graph.diameter(rng) if len(components) == 1 else (None, True)
+    return {
+        "nodes": graph.n,
+        "edges": len(edges),
+        "components": components,
+        "connected": len(components) <= 1,
+        "diameter": diameter,
+        "diameter_exact": exact,
+        "degree": {
+            "min": degrees[0] if degrees else 0,
+            "median": degrees[len(degrees) // 2] if degrees else 0,
+            "mean": sum(degrees) / len(degrees) if degrees else 0,
+            "max": degrees[-1] if degrees else 0,
+        },
+        "degree_histogram": Counter(degrees),
+        "out_degree_histogram": Counter(out_degree),
+        "over_addnode_limit": over_limit,
+        "unknown_peers": sorted(unknown),
+        "propagation_hops": propagation_hops(graph, rng),
+    }
@@ -23,6 +23,7 @@ class GraphTest(TestBase):
             self.directory_not_exist()
             os.mkdir(NETWORKS_DIR)
             self.directory_exists()
+            self.generated_network()
             self.run_created_network()
         finally:
             self.cleanup()
@@ -63,6 +64,19 @@ class GraphTest(TestBase):
             print(f"\nReceived prompt text:\n  {self.sut.before.decode('utf-8')}\n")
             raise e
 
+    def generated_network(self):
+        self.log.info("testing warnet graph create and analyze")
+        for name in ["gen-a", "gen-b"]:
+            self.warnet(
+                f"graph create {NETWORKS_DIR}/{name} --nodes 200 --topology barabasi-albert "
+                "--connections 4 --seed 7"
+            )
+        gen_a, gen_b = (f"{NETWORKS_DIR}/{name}/network.yaml" for name in ["gen-a", "gen-b"])
+        with open(gen_a) as a, open(gen_b) as b:
+            assert a.read() == b.read(), "same seed should generate the same network"
+        res = self.warnet(f"graph analyze {NETWORKS_DIR}/gen-a")
+        assert "Connected" in res and "yes" in res, res
+
     def run_created_network(self):
         self.log.info("adding custom config to one tank")
         with open("networks/ANewNetwork/network.yaml") as f:
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import threading
+from pathlib import Path
+from time import sleep
+
+from test_base import TestBase
+
+sys.path.insert(0, str(Path(os.path.dirname(__file__)).parent / "resources" / "scenarios"))
+from commander import (  # noqa: E402
+    LAG_SAMPLES,
+    ActionDropped,
+    LoadScheduler,
+    LoadStats,
+    RateProfile,
+)
+
+
+class LoadSchedulerTest(TestBase):
+    def __init__(self):
+        super().__init__()
+        # Pure scheduling tests, no cluster to bring down
+        self.network = False
+
+    def run_test(self):
+        try:
+            self.check_profiles()
+            self.check_invalid_profiles()
+            self.check_rate()
+            self.check_backlog()
+            self.check_drops()
+            self.check_lag_sample()
+        finally:
+            self.cleanup()
+
+    def check_profiles(self):
+        self.log.info("Parsing rate profiles")
+        assert RateProfile("100").rate(0) == 100
+        assert RateProfile("constant:2.5").rate(1000) == 2.5
+
+        ramp = RateProfile("ramp:10:200:60")
+        assert [ramp.rate(t) for t in (0, 30, 60, 600)] == [10, 105, 200, 200]
+
+        # Steps may be listed in any order
+        step = RateProfile("step:50@30,10@0,200@60")
+        assert [step.rate(t) for t in (0, 29.9, 30, 59, 60, 1000)] == [10, 10, 50, 50, 200, 200]
+        assert RateProfile("step:5@10").rate(0) == 0
+
+        burst = RateProfile("burst:20:500:5:60")
+        assert [burst.rate(t) for t in (0, 4.9, 5, 59, 60, 64)] == [500, 500, 20, 20, 500, 500]
+        assert str(burst) == "burst:20:500:5:60"
+
+    def check_invalid_profiles(self):
+        self.log.info("Rejecting invalid rate profiles")
+        for spec in ("fast", "wave:1:2", "ramp:1:2", "burst:1:2:3", "step:10", "constant:1:2"):
+            try:
+                RateProfile(spec)
+            except ValueError:
+                continue
+            raise AssertionError(f"Rate profile {spec} should be rejected")
+
+    def check_rate(self):
+        self.log.info("Achieving a sustainable rate")
+        calls = []
+        scheduler = LoadScheduler(calls.append, RateProfile("50"), self.log, workers=4)
+        totals = scheduler.run(duration=2)
+        # Gaps add up with float error, so the last action may just fit in the duration
+        assert totals["requested"] in (100, 101), totals
+        assert totals["completed"] + totals["drained"] == len(calls) == totals["requested"], totals
+        assert totals["dropped"] == 0 and totals["failed"] == 0, totals
+        assert 45 <= totals["achieved_rate"] <= 51, totals
+        assert sorted(calls) == list(range(len(calls)))
+
+    def check_backlog(self):
+        self.log.info("Accounting for backlog when the workers fall behind")
+        # 4 workers of 50ms each complete at most 80/s of the 200/s requested
+        scheduler = LoadScheduler(
+            lambda seq: sleep(0.05), RateProfile("200"), self.log, workers=4, max_backlog=10_000
+        )
+        totals = scheduler.run(duration=2)
+        assert totals["requested"] in (400, 401) and totals["dropped"] == 0, totals
+        assert totals["achieved_rate"] <= 85, totals
+        assert totals["backlog"] >= 200, totals
+        assert totals["completed"] + totals["drained"] == totals["requested"], totals
+        assert totals["drain_seconds"] >= 2, totals
+        assert totals["lag_p99"] >= 1, totals
+
+    def check_drops(self):
+        self.log.info("Dropping actions beyond max_backlog")
+        release = threading.Event()
+        scheduler = LoadScheduler(
+            lambda seq: release.wait(), RateProfile("100"), self.log, workers=1, max_backlog=5
+        )
+        threading.Timer(1.5, release.set).start()
+        totals = scheduler.run(duration=1)
+        # One action runs, five wait for the worker, the rest are dropped
+        assert totals["requested"] in (100, 101), totals
+        assert totals["dropped"] == totals["requested"] - 6, totals
+        assert totals["completed"] == 0 and totals["drained"] == 6, totals
+        assert totals["achieved_rate"] == 0, totals
+
+        def skip_odd(seq):
+            if seq % 2:
+                raise ActionDropped()
+
+        totals = LoadScheduler(skip_odd, RateProfile("50"), self.log, workers=2).run(duration=1)
+        assert totals["dropped"] == totals["requested"] // 2, totals
+        assert totals["failed"] == 0, totals
+        assert totals["completed"] + totals["drained"] + totals["dropped"] == totals["requested"]
+
+    def check_lag_sample(self):
+        self.log.info("Bounding the start lags kept by a load running forever")
+        stats = LoadStats()
+        for i in range(10 * LAG_SAMPLES):
+            stats.started += 1
+            stats.add_lag(i / (10 * LAG_SAMPLES))
+        assert len(stats.lags) == LAG_SAMPLES, len(stats.lags)
+        summary = stats.summary(0)
+        # A uniform sample of lags spread evenly over [0, 1)
+        assert 0.45 <= summary["lag_p50"] <= 0.55, summary
+        assert summary["lag_p99"] >= 0.97, summary
+
+
+if __name__ == "__main__":
+    test = LoadSchedulerTest()
+    test.run_test()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+from test_base import TestBase
+
+from warnet import log_archive
+from warnet.log_archive import ContainerArchive, parse_k8s_timestamp, search_archive
+
+NAMESPACE = "default"
+POD = "tank-0000"
+CONTAINER = "bitcoincore"
+
+
+def log_line(second: int, message: str) -> bytes:
+    return f"2024-05-01T12:00:{second:02d}.250000000Z {message}\n".encode()
+
+
+class LogArchiveTest(TestBase):
+    def __init__(self):
+        super().__init__()
+        # Pure file tests, no cluster to bring down
+        self.network = False
+        self.archive_dir = self.tmpdir / "archive"
+        self.container_dir = self.archive_dir / NAMESPACE / POD / CONTAINER
+
+    def run_test(self):
+        try:
+            self.check_timestamps()
+            self.write_blocks()
+            self.check_state()
+            self.check_search()
+        finally:
+            self.cleanup()
+
+    def check_timestamps(self):
+        self.log.info("Parsing kubelet timestamps")
+        assert parse_k8s_timestamp("2024-05-01T12:00:00Z") == 1714564800
+        assert parse_k8s_timestamp("2024-05-01T12:00:01.250000000Z") == 1714564801.25
+        assert log_archive.parse_time_arg("1714564800") == 1714564800
+        assert log_archive.parse_time_arg("2024-05-01T12:00:00") == 1714564800
+        assert log_archive.parse_time_arg("2024-05-01T14:00:00+02:00") == 1714564800
+
+    def write_blocks(self):
+        self.log.info("Writing blocks across segment rotations")
+        archive = ContainerArchive(self.container_dir)
+        # Every block after the first starts a new segment
+        max_bytes = log_archive.SEGMENT_MAX_BYTES
+        log_archive.SEGMENT_MAX_BYTES = 1
+        try:
+            for block in range(3):
+                lines = [log_line(10 * block + i, f"block {block} line {i}") for i in range(4)]
+                start = parse_k8s_timestamp(lines[0].split(b" ")[0].decode())
+                end = parse_k8s_timestamp(lines[-1].split(b" ")[0].decode())
+                archive.write_block(lines, start, end)
+                archive.state["last_timestamp"] = end
+                archive.save_state()
+        finally:
+            log_archive.SEGMENT_MAX_BYTES = max_bytes
+
+        entries = archive.blocks()
+        assert [e.segment for e in entries] == [
+            "segment-000001.log.gz",
+            "segment-000002.log.gz",
+            "segment-000003.log.gz",
+        ], entries
+        assert all(e.offset == 0 and e.lines == 4 for e in entries), entries
+        assert archive.read_block(entries[1])[2].endswith("block 1 line 2")
+
+        # Blocks of one segment are independent gzip members at their own offsets
+        archive.write_block([log_line(40, "appended")], 1714564840.25, 1714564840.25)
+        appended = archive.blocks()[-1]
+        assert appended.segment == "segment-000003.log.gz" and appended.offset > 0, appended
+        assert archive.read_block(appended) == ["2024-05-01T12:00:40.250000000Z appended"]
+
+    def check_state(self):
+        self.log.info("Reloading the archive state")
+        archive = ContainerArchive(self.container_dir)
+        assert archive.state["segment"] == 3, archive.state
+        assert archive.state["last_timestamp"] == 1714564823.25, archive.state
+        assert not list(self.container_dir.glob("*.tmp"))
+
+    def check_search(self):
+        self.log.info("Searching the archive")
+        everything = list(search_archive(str(self.archive_dir)))
+        assert len(everything) == 13, everything
+        assert all(name == f"{POD}/{CONTAINER}" for name, _ in everything)
+
+        window = [
+            line
+            for _, line in search_archive(
+                str(self.archive_dir), start=1714564811.0, end=1714564821.0
+            )
+        ]
+        assert [line.split(" ", 1)[1] for line in window] == [
+            "block 1 line 1",
+            "block 1 line 2",
+            "block 1 line 3",
+            "block 2 line 0",
+        ], window
+
+        matches = list(search_archive(str(self.archive_dir), pattern=r"line 3$"))
+        assert len(matches) == 3, matches
+        assert not list(search_archive(str(self.archive_dir), pod_name="tank-0001"))
+
+
+if __name__ == "__main__":
+    test = LogArchiveTest()
+    test.run_test()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+
+import re
+import subprocess
+import sys
+
+import click
+from test_base import TestBase
+
+from warnet.main import LAZY_COMMANDS, cli
+
+# Modules that must not be imported just to start the CLI
+HEAVY_MODULES = ["kubernetes", "inquirer", "rich", "yaml", "test_framework", "docker"]
+# Cumulative import time budget for warnet.main, in microseconds
+IMPORT_BUDGET_US = 300_000
+
+
+class StartupTest(TestBase):
+    def __init__(self):
+        super().__init__()
+        self.network = False
+
+    def run_test(self):
+        try:
+            self.check_import_time()
+            self.check_help_registry()
+        finally:
+            self.cleanup()
+
+    def check_import_time(self):
+        self.log.info("Measuring warnet.main import with python -X importtime")
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", "import warnet.main"],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        imported = {}
+        for line in proc.stderr.splitlines():
+            match = re.match(r"import time:\s+\d+ \|\s+(\d+) \|( *)(\S+)", line)
+            if match:
+                imported[match.group(3)] = int(match.group(1))
+        total = imported["warnet.main"]
+        self.log.info(f"warnet.main cumulative import time: {total / 1000:.1f}ms")
+        heavy = [m for m in imported if m.split(".")[0] in HEAVY_MODULES]
+        assert not heavy, f"Startup imports heavy modules: {heavy}"
+        assert total < IMPORT_BUDGET_US, f"warnet.main took {total}us to import"
+
+        for args in (["--help"], ["version"]):
+            subprocess.run(["warnet", *args], capture_output=True, check=True)
+
+    def check_help_registry(self):
+        self.log.info("Checking lazy command help matches the commands")
+        ctx = click.Context(cli)
+        for name, (_, _, help, hidden) in LAZY_COMMANDS.items():
+            command = cli.get_command(ctx, name)
+            assert command is not None, f"{name} did not load"
+            assert command.get_short_help_str(limit=200) == help, f"Outdated help for {name}"
+            assert command.hidden == hidden, f"Outdated hidden flag for {name}"
+
+
+if __name__ == "__main__":
+    test = StartupTest()
+    test.run_test()